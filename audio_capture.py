@@ -0,0 +1,210 @@
+"""Captura de audio persistente en modo callback sobre un buffer circular preasignado"""
+import threading
+import time
+
+import numpy as np
+
+
+class RingBuffer:
+    """Buffer circular int16 de tamaño fijo.
+
+    Las posiciones son absolutas (muestras escritas desde el inicio), así
+    que un consumidor guarda su cursor y pide las vistas [inicio, fin).
+    Las vistas no copian datos: son válidas mientras no se sobrescriban,
+    es decir, durante capacity muestras.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = int(capacity)
+        self.data = np.zeros(self.capacity, dtype=np.int16)
+        self.total = 0
+        self.condition = threading.Condition()
+
+    @property
+    def oldest(self):
+        """Posición más antigua que todavía está en el buffer"""
+        return max(0, self.total - self.capacity)
+
+    def write(self, samples):
+        """Copia muestras al buffer (se llama desde el callback de audio)"""
+        samples = np.asarray(samples, dtype=np.int16)
+        n = samples.size
+        if n >= self.capacity:
+            samples = samples[-self.capacity:]
+            start_total = self.total + n - self.capacity
+            n = self.capacity
+        else:
+            start_total = self.total
+        start = start_total % self.capacity
+        first = min(n, self.capacity - start)
+        self.data[start:start + first] = samples[:first]
+        if first < n:
+            self.data[:n - first] = samples[first:]
+        with self.condition:
+            self.total = start_total + n
+            self.condition.notify_all()
+
+    def views(self, start, end=None):
+        """Devuelve una o dos vistas (sin copia) de las muestras [start, end)"""
+        end = self.total if end is None else min(end, self.total)
+        start = max(start, self.oldest)
+        if start >= end:
+            return []
+        a, b = start % self.capacity, end % self.capacity
+        if a < b or b == 0:
+            return [self.data[a:b or self.capacity]]
+        return [self.data[a:], self.data[:b]]
+
+    def copy(self, start, end=None):
+        """Muestras [start, end) en un array contiguo propio"""
+        parts = self.views(start, end)
+        if not parts:
+            return np.zeros(0, dtype=np.int16)
+        return np.concatenate(parts) if len(parts) > 1 else parts[0].copy()
+
+    def wait(self, position, timeout=None):
+        """Bloquea hasta que haya datos más allá de position; devuelve el total escrito"""
+        with self.condition:
+            if self.total <= position:
+                self.condition.wait(timeout)
+            return self.total
+
+
+class AudioCapture:
+    """Stream de entrada de PyAudio que vive toda la sesión.
+
+    El callback solo copia cada bloque al buffer circular; los consumidores
+    leen a su ritmo sin cerrar ni reabrir el dispositivo entre turnos.
+    Sin instancia de PyAudio, se crea la primera vez que hace falta.
+    """
+
+    def __init__(self, audio=None, rate=16000, chunk=512, channels=1, seconds=60):
+        self.audio = audio
+        self.open_lock = threading.Lock()
+        self.rate = rate
+        self.chunk = chunk
+        self.channels = channels
+        self.ring = RingBuffer(rate * seconds)
+        self.stream = None
+        self.overflows = 0
+
+    @property
+    def position(self):
+        return self.ring.total
+
+    @property
+    def active(self):
+        return self.stream is not None
+
+    def open_device(self):
+        """Inicializa PortAudio si aún no se hizo (enumera dispositivos: puede tardar)"""
+        with self.open_lock:
+            if self.audio is None:
+                import pyaudio
+                self.audio = pyaudio.PyAudio()
+            return self.audio
+
+    def start(self):
+        """Abre el stream si todavía no está abierto"""
+        if self.stream is not None:
+            return
+        import pyaudio
+
+        self.stream = self.open_device().open(
+            format=pyaudio.paInt16,
+            channels=self.channels,
+            rate=self.rate,
+            input=True,
+            frames_per_buffer=self.chunk,
+            stream_callback=self._callback
+        )
+        self.stream.start_stream()
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        import pyaudio
+
+        if status & pyaudio.paInputOverflow:
+            self.overflows += 1
+        self.ring.write(np.frombuffer(in_data, dtype=np.int16))
+        return (None, pyaudio.paContinue)
+
+    def read(self, cursor, min_samples=None, timeout=0.5):
+        """Espera audio nuevo desde cursor y devuelve (vistas, nuevo_cursor).
+
+        Si el consumidor se atrasó más que el tamaño del buffer se salta
+        al dato más antiguo disponible.
+        """
+        min_samples = min_samples or self.chunk
+        total = self.ring.total
+        if total - cursor < min_samples:
+            total = self.ring.wait(cursor + min_samples - 1, timeout)
+            if total - cursor < min_samples:
+                return [], cursor
+        cursor = max(cursor, self.ring.oldest)
+        return self.ring.views(cursor, total), total
+
+    def stop(self):
+        """Cierra el stream (al salir de la aplicación)"""
+        if self.stream is None:
+            return
+        try:
+            self.stream.stop_stream()
+            self.stream.close()
+        finally:
+            self.stream = None
+
+
+class ReplayCapture:
+    """Reproduce un audio grabado con la misma interfaz que AudioCapture.
+
+    Sirve para el modo sin interfaz y los benchmarks: cada read entrega el
+    siguiente bloque (en tiempo real o lo más rápido posible) y al final
+    añade silencio para que el fin de frase se detecte igual que en vivo.
+    """
+
+    def __init__(self, samples, rate=16000, chunk=512, source_rate=None, realtime=False,
+                 tail_seconds=3.0, seconds=60):
+        samples = np.asarray(samples, dtype=np.int16)
+        if source_rate and source_rate != rate and samples.size:
+            n = int(round(samples.size * rate / source_rate))
+            samples = np.interp(np.linspace(0, samples.size - 1, n), np.arange(samples.size),
+                                samples).astype(np.int16)
+        self.samples = np.concatenate([samples, np.zeros(int(tail_seconds * rate), dtype=np.int16)])
+        self.rate = rate
+        self.chunk = chunk
+        self.realtime = realtime
+        self.ring = RingBuffer(rate * seconds)
+        self.overflows = 0
+        self.started_at = None
+
+    @property
+    def position(self):
+        return self.ring.total
+
+    @property
+    def finished(self):
+        return self.ring.total >= len(self.samples)
+
+    def start(self):
+        if self.started_at is None:
+            self.started_at = time.perf_counter()
+
+    def read(self, cursor, min_samples=None, timeout=0.5):
+        min_samples = min_samples or self.chunk
+        while self.ring.total - cursor < min_samples and not self.finished:
+            position = self.ring.total
+            if self.realtime:
+                # Esperar a que "llegue" el bloque según el reloj
+                due = self.started_at + (position + self.chunk) / self.rate
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            self.ring.write(self.samples[position:position + self.chunk])
+        total = self.ring.total
+        if total <= cursor:
+            return [], cursor
+        cursor = max(cursor, self.ring.oldest)
+        return self.ring.views(cursor, total), total
+
+    def stop(self):
+        pass
@@ -0,0 +1,126 @@
+"""Servicio de reproducción persistente: un hilo, un event loop y un mixer para toda la sesión"""
+import asyncio
+import threading
+
+from tts import play_pcm
+
+
+class AudioOutput:
+    """Reproduce los SpeechStream en orden desde un único event loop.
+
+    La síntesis de una respuesta puede empezar mientras la anterior todavía
+    suena, pero el audio siempre sale en el orden en que se enviaron los
+    streams. stop/skip/flush cortan la reproducción sin crear hilos nuevos.
+    """
+
+    def __init__(self, play=play_pcm, sample_rate=24000, mixer=True):
+        self.play = play
+        self.sample_rate = sample_rate
+        self.mixer = mixer  # False: sin dispositivo de audio (modo sin interfaz)
+        self.loop = asyncio.new_event_loop()
+        self.thread = None
+        self.streams = []          # Streams enviados que todavía no terminaron
+        self.last_done = None      # Futuro que se completa cuando termina el último stream
+        self.lock = threading.Lock()
+        self.played = 0
+        self.playing_clips = 0     # Clips sonando ahora mismo (para la supresión de eco)
+
+    def start(self):
+        """Arranca el hilo del event loop (una sola vez)"""
+        if self.thread is not None:
+            return self
+        self.thread = threading.Thread(target=self._run, name="audio-output", daemon=True)
+        self.thread.start()
+        return self
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        if self.mixer:
+            self._init_mixer()
+        self.loop.run_forever()
+
+    def _init_mixer(self):
+        # El mixer se inicializa una sola vez para toda la sesión
+        try:
+            import pygame
+            if not pygame.mixer.get_init():
+                # Formato fijo: los clips de otros motores se adaptan al reproducir
+                pygame.mixer.init(frequency=self.sample_rate, size=-16, channels=1)
+        except ImportError:
+            pass
+        except Exception as e:
+            print(f"⚠️ No se pudo inicializar el audio de salida: {e}")
+
+    def submit(self, stream):
+        """Encola un SpeechStream creado con loop=self.loop y lo devuelve"""
+        with self.lock:
+            self.streams.append(stream)
+        self.loop.call_soon_threadsafe(self._start_stream, stream)
+        return stream
+
+    def _start_stream(self, stream):
+        previous = self.last_done
+        done = self.loop.create_future()
+        self.last_done = done
+
+        async def play_in_turn(audio, should_stop):
+            # Esperar a que termine de sonar la respuesta anterior
+            while previous is not None and not previous.done():
+                if should_stop():
+                    return
+                await asyncio.wait([previous], timeout=0.05)
+            if should_stop():
+                return
+            self.playing_clips += 1
+            try:
+                await self.play(audio, should_stop)
+            finally:
+                self.playing_clips -= 1
+            self.played += 1
+
+        stream.play = play_in_turn
+        task = self.loop.create_task(stream.run())
+
+        def finished(_):
+            with self.lock:
+                if stream in self.streams:
+                    self.streams.remove(stream)
+            if not done.done():
+                done.set_result(None)
+        task.add_done_callback(finished)
+
+    @property
+    def busy(self):
+        with self.lock:
+            return bool(self.streams)
+
+    @property
+    def playing(self):
+        """¿Está saliendo audio por el altavoz?"""
+        return self.playing_clips > 0
+
+    def skip(self):
+        """Corta la respuesta que está sonando; la siguiente continúa"""
+        with self.lock:
+            current = self.streams[0] if self.streams else None
+        if current is not None:
+            current.cancel()
+
+    def flush(self):
+        """Descarta las respuestas en espera sin cortar la actual"""
+        with self.lock:
+            pending = self.streams[1:]
+        for stream in pending:
+            stream.cancel()
+
+    def stop(self):
+        """Silencio inmediato: corta la actual y descarta las pendientes"""
+        with self.lock:
+            streams = list(self.streams)
+        for stream in streams:
+            stream.cancel()
+
+    def shutdown(self):
+        self.stop()
+        if self.thread is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
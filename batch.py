@@ -0,0 +1,318 @@
+"""Procesado por lotes de grabaciones de alumnos: VAD → transcripción → respuesta del tutor → JSONL.
+
+Los WAV se leen mapeados en memoria. El VAD y la transcripción (lo que
+más CPU consume) corren en un pool de procesos; la respuesta del tutor
+se genera en el proceso principal mientras el pool sigue con los
+siguientes archivos. Cada archivo terminado se añade al JSONL en cuanto
+acaba, así una ejecución interrumpida se retoma donde quedó.
+
+Ejemplos:
+    python batch.py grabaciones/ --output resultados.jsonl
+    python batch.py grabaciones/ --output resultados.jsonl --workers 8 --asr whisper --model ""
+    python batch.py grabaciones/ --output resultados.jsonl --no-feedback    # solo transcripción
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+
+from fluency import analyze_utterance
+from pipeline import generate_reply, tutor_conversation, voice_user_text
+from speech_to_text import StubEngine, create_asr_engine
+from streaming import PromptCache
+from vad import VoiceActivityDetector, map_wav, speech_segments
+import model_registry
+
+ASR_RATE = 16000
+
+# Motor de reconocimiento de cada proceso del pool (se carga una vez por proceso)
+_engine = None
+_asr_name = None
+
+
+def wav_paths(paths):
+    """Archivos .wav indicados directamente o dentro de directorios (recursivo, en orden)"""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _, names in sorted(os.walk(path)):
+                found.extend(os.path.join(directory, name) for name in sorted(names)
+                             if name.lower().endswith(".wav"))
+        else:
+            found.append(path)
+    return found
+
+
+def file_key(path):
+    """Identifica un archivo y su versión: si cambia se vuelve a procesar"""
+    stat = os.stat(path)
+    return os.path.abspath(path), stat.st_size, int(stat.st_mtime)
+
+
+def load_done(output):
+    """Claves de los archivos ya procesados con éxito en un JSONL anterior"""
+    done = set()
+    if not os.path.isfile(output):
+        return done
+    with open(output, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                # Última línea a medio escribir al interrumpir
+                continue
+            if result.get("status") == "ok":
+                done.add((result["path"], result["size"], result["mtime"]))
+    return done
+
+
+def mono_block(samples, start, end):
+    """Muestras int16 mono de [start, end) (solo se leen esas del disco)"""
+    block = samples[start:end]
+    if block.shape[1] == 1:
+        return np.asarray(block[:, 0])
+    return block.mean(axis=1).astype(np.int16)
+
+
+def find_utterances(samples, rate, block_seconds=2.0, max_gap=0.8, padding=0.25, min_speech=0.2):
+    """Tramos de voz (inicio_s, fin_s) de un audio; las pausas cortas no parten la frase"""
+    vad = VoiceActivityDetector(sample_rate=rate)
+    block = int(block_seconds * rate) // vad.frame_length * vad.frame_length
+    decisions = [vad.process(mono_block(samples, start, start + block))
+                 for start in range(0, len(samples), block)]
+    if not decisions:
+        return []
+    segments = speech_segments(np.concatenate(decisions), vad.frame_length, rate)
+
+    duration = len(samples) / rate
+    utterances = []
+    for start, end in segments:
+        if utterances and start - utterances[-1][1] <= max_gap:
+            utterances[-1][1] = end
+        else:
+            utterances.append([start, end])
+    return [(max(0.0, float(start) - padding), min(duration, float(end) + padding))
+            for start, end in utterances if end - start >= min_speech]
+
+
+def asr_audio(samples, rate, start, end):
+    """Audio float32 mono a 16 kHz de un tramo, como lo espera el reconocedor"""
+    audio = mono_block(samples, int(start * rate), int(end * rate)).astype(np.float32) / 32768.0
+    if rate != ASR_RATE and audio.size:
+        n = int(round(audio.size * ASR_RATE / rate))
+        audio = np.interp(np.linspace(0, audio.size - 1, n), np.arange(audio.size), audio).astype(np.float32)
+    return audio
+
+
+def init_worker(asr_name, asr_options):
+    """Inicializador del pool: carga el reconocedor una vez por proceso"""
+    global _engine, _asr_name
+    # Ctrl+C lo atiende el proceso principal, que guarda lo terminado y cierra el pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _asr_name = asr_name
+    if asr_name != "stub":
+        _engine = create_asr_engine(asr_name, **asr_options)
+
+
+def analyze_file(path):
+    """VAD + transcripción de un archivo (en un proceso del pool)"""
+    started = time.perf_counter()
+    samples, rate = map_wav(path)
+    opened = time.perf_counter()
+    utterances = find_utterances(samples, rate)
+    segmented = time.perf_counter()
+
+    engine = _engine
+    if _asr_name == "stub":
+        # La transcripción esperada puede ir en un .txt junto al WAV (como en benchmark.py)
+        transcript_path = os.path.splitext(path)[0] + ".txt"
+        if os.path.isfile(transcript_path):
+            with open(transcript_path, encoding="utf-8") as f:
+                engine = StubEngine(f.read().strip())
+        else:
+            engine = StubEngine()
+
+    results = []
+    for start, end in utterances:
+        text = ""
+        if engine is not None:
+            segments = engine.transcribe(asr_audio(samples, rate, start, end), ASR_RATE)
+            text = " ".join(s.text for s in segments if s.text).strip()
+        results.append({"start": round(start, 3), "end": round(end, 3), "text": text})
+    transcribed = time.perf_counter()
+
+    # Fluidez de toda la intervención: las pausas entre frases también cuentan
+    transcript = " ".join(u["text"] for u in results if u["text"])
+    fluency = None
+    if utterances:
+        first, last = int(utterances[0][0] * rate), int(utterances[-1][1] * rate)
+        fluency = analyze_utterance(mono_block(samples, first, last), rate, transcript)
+    finished = time.perf_counter()
+
+    return {
+        "duration": len(samples) / rate,
+        "sample_rate": rate,
+        "utterances": results,
+        "transcript": transcript,
+        "fluency": fluency,
+        "worker": os.getpid(),
+        "timing": {"open": opened - started, "vad": segmented - opened,
+                   "transcription": transcribed - segmented, "fluency": finished - transcribed},
+    }
+
+
+class Tutor:
+    """Genera la respuesta del tutor para cada archivo (en el proceso principal).
+
+    Cada archivo es un alumno distinto: conversación nueva, pero el
+    prefijo de sistema sigue evaluado en el modelo entre archivos.
+    """
+
+    def __init__(self, model, context_length=2048, max_new_tokens=200, loaded=None):
+        self.model = model
+        self.context_length = context_length
+        self.max_new_tokens = max_new_tokens
+        self.cache = PromptCache()
+        if loaded is not None and loaded.spec.warmup:
+            conversation = tutor_conversation(model, context_length, max_new_tokens)
+            prefix = [] if model.bos_token_id is None else [model.bos_token_id]
+            model_registry.warm_up(loaded, prefix + conversation.system_tokens, cache=self.cache)
+
+    def feedback(self, transcript, fluency=None):
+        """(respuesta, stats) del tutor a la transcripción (y métricas de fluidez) de un archivo"""
+        conversation = tutor_conversation(self.model, self.context_length, self.max_new_tokens)
+        return generate_reply(self.model, conversation, voice_user_text(transcript, fluency),
+                              cache=self.cache)
+
+
+def process_batch(paths, output, workers, asr_name, asr_options, tutor=None, max_pending=None):
+    """Procesa los archivos que falten en output; devuelve (procesados, errores, segundos de audio)"""
+    done = load_done(output)
+    pending = []
+    for path in paths:
+        try:
+            key = file_key(path)
+        except OSError as e:
+            print(f"⚠️ {path}: {e}", file=sys.stderr)
+            continue
+        if key not in done:
+            done.add(key)
+            pending.append((path, key))
+    skipped = len(paths) - len(pending)
+    if skipped:
+        print(f"⏭️ {skipped} archivos ya procesados en {output} (o repetidos)", file=sys.stderr)
+    if not pending:
+        return 0, 0, 0.0
+
+    # Pocos trabajos en vuelo: el pool no se adelanta demasiado a la generación
+    max_pending = max_pending or workers * 2
+    processed = errors = 0
+    audio_seconds = 0.0
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=init_worker,
+                             initargs=(asr_name, asr_options)) as pool, \
+            open(output, "a", encoding="utf-8") as out:
+        queue = iter(pending)
+        running = {}
+
+        def submit_next():
+            item = next(queue, None)
+            if item is None:
+                return False
+            path, key = item
+            running[pool.submit(analyze_file, path)] = (path, key, time.perf_counter())
+            return True
+
+        for _ in range(max_pending):
+            if not submit_next():
+                break
+        try:
+            while running:
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    path, key, submitted = running.pop(future)
+                    submit_next()
+                    result = {"path": key[0], "size": key[1], "mtime": key[2], "status": "ok"}
+                    try:
+                        result.update(future.result())
+                        if tutor is not None and result["transcript"]:
+                            started = time.perf_counter()
+                            result["feedback"], stats = tutor.feedback(result["transcript"], result["fluency"])
+                            result["timing"]["generation"] = time.perf_counter() - started
+                            result["generated_tokens"] = stats.generated_tokens
+                    except Exception as e:
+                        result.update(status="error", error=f"{type(e).__name__}: {e}")
+                        errors += 1
+                    else:
+                        processed += 1
+                        audio_seconds += result["duration"]
+                    result.setdefault("timing", {})["total"] = time.perf_counter() - submitted
+                    out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                    out.flush()
+                    mark = "✅" if result["status"] == "ok" else "❌"
+                    print(f"{mark} [{processed + errors}/{len(pending)}] {os.path.basename(path)} "
+                          f"· {result['timing']['total']:.1f}s", file=sys.stderr)
+        except KeyboardInterrupt:
+            pool.shutdown(wait=False, cancel_futures=True)
+            print(f"⏸️ Interrumpido: {processed + errors} de {len(pending)} archivos guardados; "
+                  "vuelve a ejecutar para continuar", file=sys.stderr)
+            raise
+    return processed, errors, audio_seconds
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Procesa carpetas de grabaciones de alumnos")
+    parser.add_argument("paths", nargs="+", help="Archivos WAV o directorios (se recorren recursivamente)")
+    parser.add_argument("--output", required=True, help="JSONL de resultados (se retoma si ya existe)")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help="Procesos para VAD y transcripción")
+    parser.add_argument("--asr", default="stub", help="stub o whisper")
+    parser.add_argument("--asr-model", default="base.en")
+    parser.add_argument("--model", default="stub",
+                        help="'stub', 'mock-openai', 'openai' o un nombre del registro de modelos ('' = por defecto)")
+    parser.add_argument("--registry", default=model_registry.DEFAULT_REGISTRY_PATH)
+    parser.add_argument("--base-url", default="http://localhost:1234/v1")
+    parser.add_argument("--context-length", type=int, default=4096, help="Contexto del backend remoto")
+    parser.add_argument("--no-feedback", action="store_true", help="Solo VAD y transcripción, sin el tutor")
+    parser.add_argument("--stub-token-seconds", type=float, default=0.0)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    paths = wav_paths(args.paths)
+    if not paths:
+        print("No hay archivos WAV", file=sys.stderr)
+        return
+
+    asr_options = {}
+    if args.asr == "whisper":
+        # Los procesos se reparten los núcleos en vez de competir por ellos
+        asr_options = {"model": args.asr_model, "threads": max(1, (os.cpu_count() or 1) // args.workers)}
+
+    tutor = None
+    if not args.no_feedback:
+        from tutor_server import load_backend
+        model, context_length, max_new_tokens, loaded = load_backend(args)
+        tutor = Tutor(model, context_length, max_new_tokens, loaded)
+
+    started = time.perf_counter()
+    try:
+        processed, errors, audio_seconds = process_batch(paths, args.output, args.workers, args.asr,
+                                                         asr_options, tutor)
+    except KeyboardInterrupt:
+        sys.exit(130)
+    elapsed = time.perf_counter() - started
+    speed = f" · {audio_seconds / elapsed:.1f}x tiempo real" if processed and elapsed > 0 else ""
+    print(f"📦 {processed} archivos ({audio_seconds:.0f}s de audio) en {elapsed:.1f}s{speed}"
+          f" · {errors} errores · {args.workers} procesos", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""Benchmark sin interfaz del tutor completo: texto y WAV por el mismo camino que la app.
+
+Ejemplos:
+    python benchmark.py                                # stand-ins deterministas, JSON por stdout
+    python benchmark.py --wav grabaciones/ --runs 3 --output resultados.json
+    python benchmark.py --model openhermes-2.5-mistral-7b --tts piper --asr whisper
+    python benchmark.py --compare base.json --output nuevo.json
+    python benchmark.py --model mock-openai            # backend HTTP contra un servidor simulado local
+    python benchmark.py --model openai --base-url http://localhost:1234/v1
+    python benchmark.py --chat                         # modo conversación por consola
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from audio_capture import ReplayCapture
+from audio_output import AudioOutput
+from pipeline import TutorPipeline
+from speech_to_text import StubEngine, create_asr_engine
+from synthesizers import StubSynthesizer, create_synthesizer
+from tts_cache import TTSCache
+from vad import read_wav
+from openai_backend import OpenAIChatClient
+import model_registry
+
+DEFAULT_PROMPTS = [
+    "Hello! How are you today?",
+    "Yesterday I goed to the park with my friends.",
+    "Can you explain the difference between make and do?",
+    "I want to practice ordering food in a restaurant.",
+    "What is the past tense of the verb to bring?",
+]
+
+METRICS = ["end_to_end", "ttft", "ttfa", "tokens_per_second", "queue_wait"]
+
+
+def simulated_playback(speed=0.0):
+    """Reproducción sin dispositivo: espera la duración del clip escalada por speed (0 = instantánea)"""
+    async def play(clip, should_stop=None):
+        remaining = clip.duration * speed
+        while remaining > 0 and not (should_stop and should_stop()):
+            step = min(0.02, remaining)
+            await asyncio.sleep(step)
+            remaining -= step
+    return play
+
+
+def build_pipeline(args):
+    """Pipeline con los motores pedidos (por defecto, stand-ins deterministas)"""
+    cache = TTSCache() if args.tts_cache else TTSCache(directory=None, memory_bytes=0)
+    output = AudioOutput(play=simulated_playback(args.playback_speed), mixer=False)
+    pipeline = TutorPipeline(audio_output=output, tts_cache=cache, speak=not args.no_tts,
+                             silence_threshold=args.silence, preempt_on_new_turn=False)
+    pipeline.adaptive_endpointing = not args.no_adaptive
+    pipeline.speculative_prefill = not args.no_speculation
+    if args.trace:
+        pipeline.tracer.start_export(args.trace)
+    pipeline.start()
+
+    if args.model == "stub":
+        if args.isolate:
+            from model_worker import ProcessModel
+            pipeline.set_model(ProcessModel(model_registry.StubModel, seconds_per_token=args.stub_token_seconds))
+        else:
+            pipeline.set_model(model_registry.StubModel(seconds_per_token=args.stub_token_seconds))
+    elif args.model in ("openai", "mock-openai"):
+        base_url = args.base_url
+        if args.model == "mock-openai":
+            from mock_openai import MockChatServer
+            base_url = MockChatServer(seconds_per_token=args.stub_token_seconds).start().url
+        client = OpenAIChatClient(base_url)
+        client.warm_up()
+        pipeline.set_model(client)
+        print(f"🌐 {client.summary()}", file=sys.stderr)
+    else:
+        default, models = model_registry.load_registry(args.registry)
+        spec = models[args.model or default]
+        loaded = model_registry.load_model(spec, isolate=args.isolate or None)
+        pipeline.set_model(loaded.model, context_length=spec.context_length,
+                           max_new_tokens=spec.max_new_tokens)
+        if spec.warmup:
+            pipeline.warm_up(loaded)
+        print(f"🧠 {loaded.summary()}", file=sys.stderr)
+
+    if args.tts == "stub":
+        pipeline.set_synthesizer(StubSynthesizer(delay=args.stub_tts_delay))
+    else:
+        pipeline.set_synthesizer(create_synthesizer(args.tts))
+
+    if args.asr != "stub":
+        pipeline.transcriber.engine = create_asr_engine(args.asr)
+    return pipeline
+
+
+def wav_paths(paths):
+    """Archivos .wav indicados directamente o dentro de directorios (en orden)"""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                                if name.lower().endswith(".wav")))
+        else:
+            found.append(path)
+    return found
+
+
+def run_voice(pipeline, path, args):
+    """Reproduce un WAV por captura → VAD → transcripción y devuelve los turnos enviados"""
+    samples, rate = read_wav(path)
+    if args.asr == "stub":
+        # La transcripción esperada puede ir en un .txt junto al WAV
+        transcript_path = os.path.splitext(path)[0] + ".txt"
+        if os.path.isfile(transcript_path):
+            with open(transcript_path, encoding="utf-8") as f:
+                pipeline.transcriber.engine = StubEngine(f.read().strip())
+        else:
+            pipeline.transcriber.engine = StubEngine()
+    capture = ReplayCapture(samples, rate=pipeline.rate, chunk=pipeline.chunk, source_rate=rate,
+                            realtime=args.realtime, tail_seconds=args.silence + 1.0)
+    pipeline.begin_listening(capture)
+    return pipeline.listen(capture, lambda: not capture.finished)
+
+
+def run_benchmark(pipeline, prompts, wavs, args):
+    """Ejecuta los turnos de uno en uno (como un usuario) y devuelve los TurnRecord"""
+    records = []
+    for run in range(args.runs):
+        if run:
+            pipeline.clear_conversation()
+        for prompt in prompts:
+            record = pipeline.submit_text(prompt)
+            record.wait(args.timeout)
+            records.append(record)
+        for path in wavs:
+            for record in run_voice(pipeline, path, args):
+                record.wait(args.timeout)
+                records.append(record)
+        print(f"⏱️ Ronda {run + 1}/{args.runs}: {len(records)} turnos", file=sys.stderr)
+    return records
+
+
+def describe(values):
+    values = [v for v in values if v is not None]
+    if not values:
+        return None
+    array = np.asarray(values, dtype=float)
+    return {"p50": float(np.percentile(array, 50)), "p95": float(np.percentile(array, 95)),
+            "mean": float(array.mean()), "n": len(values)}
+
+
+def summarize(records):
+    """p50/p95/media de cada métrica por tipo de turno y en total"""
+    groups = {"all": records}
+    for record in records:
+        groups.setdefault(record.kind, []).append(record)
+    summary = {}
+    for kind, group in groups.items():
+        done = [r for r in group if r.status == "done"]
+        summary[kind] = {
+            "turns": len(group),
+            "errors": sum(r.status == "error" for r in group),
+            "dropped": sum(r.status == "dropped" for r in group),
+            "unfinished": sum(not r.done.is_set() for r in group),
+        }
+        for metric in METRICS:
+            summary[kind][metric] = describe([getattr(r, metric) if metric != "tokens_per_second"
+                                              else (r.stats.tokens_per_second if r.stats else None)
+                                              for r in done])
+    return summary
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(baseline, current, out=sys.stderr):
+    """Imprime la variación de p50/p95 respecto a un resultado anterior"""
+    print(f"📊 Comparación con {baseline.get('meta', {}).get('commit')}:", file=out)
+    for kind, metrics in current["summary"].items():
+        base_metrics = baseline.get("summary", {}).get(kind, {})
+        for metric in METRICS:
+            new, old = metrics.get(metric), base_metrics.get(metric)
+            if not new or not old:
+                continue
+            for q in ("p50", "p95"):
+                change = (new[q] - old[q]) / old[q] * 100 if old[q] else 0.0
+                print(f"  {kind:6s} {metric:18s} {q}: {old[q]:8.3f} → {new[q]:8.3f} ({change:+.1f}%)", file=out)
+
+
+def chat(pipeline):
+    """Modo conversación por consola (sin Tk ni micrófono)"""
+    pipeline.on_token = lambda text: print(text, end="", flush=True)
+    print("Escribe en inglés (línea vacía para salir).")
+    while True:
+        try:
+            message = input("\nTú: ").strip()
+        except EOFError:
+            break
+        if not message:
+            break
+        print("IA: ", end="", flush=True)
+        record = pipeline.submit_text(message)
+        record.wait()
+        print(f"\n{record.stats.summary() if record.stats else record.response}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark sin interfaz del tutor de inglés")
+    parser.add_argument("--prompts", help="Archivo con un mensaje de texto por línea")
+    parser.add_argument("--wav", nargs="*", default=[], help="Archivos WAV o directorios con WAV")
+    parser.add_argument("--runs", type=int, default=1, help="Rondas completas (la conversación se reinicia)")
+    parser.add_argument("--model", default="stub",
+                        help="'stub', 'mock-openai', 'openai' o un nombre del registro de modelos ('' = por defecto)")
+    parser.add_argument("--registry", default=model_registry.DEFAULT_REGISTRY_PATH)
+    parser.add_argument("--base-url", default="http://localhost:1234/v1",
+                        help="Servidor compatible con OpenAI para --model openai")
+    parser.add_argument("--isolate", action="store_true", help="Ejecutar el modelo local en un proceso aparte")
+    parser.add_argument("--tts", default="stub", help="stub, edge, piper o auto")
+    parser.add_argument("--asr", default="stub", help="stub o whisper")
+    parser.add_argument("--no-tts", action="store_true", help="Solo texto (sin síntesis)")
+    parser.add_argument("--tts-cache", action="store_true", help="Usar la caché de audio real")
+    parser.add_argument("--playback-speed", type=float, default=0.0,
+                        help="Fracción de la duración del audio que tarda la reproducción simulada")
+    parser.add_argument("--realtime", action="store_true", help="Entregar los WAV al ritmo real")
+    parser.add_argument("--silence", type=float, default=0.8, help="Pausa máxima de fin de frase (s)")
+    parser.add_argument("--no-adaptive", action="store_true", help="Esperar siempre la pausa completa")
+    parser.add_argument("--no-speculation", action="store_true",
+                        help="Sin transcripción ni prefill adelantados durante el silencio final")
+    parser.add_argument("--stub-token-seconds", type=float, default=0.01)
+    parser.add_argument("--stub-tts-delay", type=float, default=0.05)
+    parser.add_argument("--timeout", type=float, default=300.0, help="Espera máxima por turno (s)")
+    parser.add_argument("--output", help="Archivo JSON de salida (por defecto stdout)")
+    parser.add_argument("--trace", help="Archivo JSONL donde exportar los spans por etapa")
+    parser.add_argument("--compare", help="JSON de un benchmark anterior para comparar")
+    parser.add_argument("--chat", action="store_true", help="Conversación por consola en vez de benchmark")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.chat:
+        pipeline = build_pipeline(args)
+        try:
+            chat(pipeline)
+        finally:
+            pipeline.shutdown()
+        return
+
+    # Los registros del pipeline van a stderr: stdout queda solo para el JSON
+    out = sys.stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        pipeline = build_pipeline(args)
+        try:
+            if args.prompts:
+                with open(args.prompts, encoding="utf-8") as f:
+                    prompts = [line.strip() for line in f if line.strip()]
+            else:
+                prompts = DEFAULT_PROMPTS
+            wavs = wav_paths(args.wav)
+
+            started = time.time()
+            records = run_benchmark(pipeline, prompts, wavs, args)
+            stages = pipeline.tracer.snapshot()
+            if getattr(pipeline.model, "remote", False):
+                print(f"🌐 {pipeline.model.summary()}")
+        finally:
+            pipeline.shutdown()
+            pipeline.tracer.stop_export()
+
+    result = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": started,
+            "duration": time.time() - started,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": vars(args),
+        },
+        "summary": summarize(records),
+        "stages": stages,
+        "turns": [record.to_dict() for record in records],
+    }
+    text = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text, file=out)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), result)
+
+if __name__ == "__main__":
+    main()
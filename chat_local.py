@@ -1,59 +1,160 @@
+# El primero: marca el comienzo del arranque antes de los imports pesados
+from startup import StartupProfile, IMPORTED_AT
+import os
+import time
 import tkinter as tk
 from tkinter import scrolledtext, ttk
 import threading
-from ctransformers import AutoModelForCausalLM
-import queue
-import time
-import pyaudio
-import numpy as np
-from collections import deque
-import asyncio
-import edge_tts
-import tempfile
-import os
+from pipeline import TutorPipeline, TEXT_FALLBACK, AUDIO_FALLBACK
+from governor import ModelGovernor
+import model_registry
+from synthesizers import EdgeSynthesizer, create_synthesizer
+from audio_capture import AudioCapture
+from message_store import MessageStore
+from history import HistoryStore
+from transcript_view import TranscriptView
+from ui_dispatcher import UIDispatcher, LATEST, APPEND
+from speech_to_text import create_asr_engine
+
+# Frases fijas de la interfaz que se repiten: se precalientan en la caché de TTS
+GREETING = "¡Hola! Soy tu tutor de inglés. Escribe algo en inglés para practicar o presiona el botón del micrófono."
+NO_RESPONSE_TEXT = "No hay respuesta para leer"
+KNOWN_PHRASES = [GREETING, TEXT_FALLBACK, AUDIO_FALLBACK, NO_RESPONSE_TEXT]
+
+STARTUP = StartupProfile(origin=IMPORTED_AT)
+STARTUP.record("imports", IMPORTED_AT)
 
 class ChatApp:
-    def __init__(self, root):
+    def __init__(self, root, startup=None):
         self.root = root
+        # La ventana se dibuja antes de cargar nada pesado; el resto arranca en paralelo
+        self.startup = startup or StartupProfile()
         self.root.title("Chat con IA Local - Práctica de Inglés")
         self.root.geometry("1200x700")
         
-        # Cola para comunicación entre hilos
-        self.message_queue = queue.Queue()
+        # Eventos de los hilos de trabajo hacia Tk (un drenado por frame, sin sondeo)
+        self.ui = UIDispatcher(self.root)
         
         # Configuración de audio para streaming en tiempo real
-        self.audio_format = pyaudio.paInt16
         self.channels = 1
         self.rate = 16000
         self.chunk = 512  # Chunks más pequeños para menor latencia
-        self.audio = pyaudio.PyAudio()
+        
+        # Captura persistente: un solo stream en modo callback sobre un buffer circular.
+        # PortAudio se inicializa en segundo plano tras el primer frame
+        self.capture = AudioCapture(rate=self.rate, chunk=self.chunk, channels=self.channels, seconds=60)
+        
+        # Núcleo del tutor (modelo, voz de entrada y de salida), independiente de Tk
+        self.pipeline = TutorPipeline(rate=self.rate, chunk=self.chunk)
+        self.pipeline.on_response_start = lambda record: self.ui.post("response_start", record)
+        self.pipeline.on_token = lambda text: self.ui.post("tokens", text)
+        self.pipeline.on_response = lambda record: self.ui.post("response", record)
+        self.pipeline.on_user_voice = lambda record: self.ui.post("user_voice", record)
+        self.pipeline.on_partial = lambda text: self.ui.post("partial", text)
+        self.pipeline.on_queued = lambda pending: self.ui.post("status", f"En cola ({pending} pendientes)...")
+        self.pipeline.on_noise_floor = lambda db: self.ui.post("noise_floor", db)
+        self.pipeline.on_level = lambda db: self.ui.post("level", db)
+        self.pipeline.on_turn_done = lambda record: self.ui.post("metrics")
+        self.pipeline.on_barge_in = lambda: self.ui.post("status", "✋ Te escucho...")
+        self.pipeline.on_speech_finished = self.report_tts_metrics
         
         # Variables para escucha en tiempo real
         self.is_listening = False
         self.voice_thread = None
-        self.audio_stream = None
-        self.audio_buffer = deque(maxlen=200)  # Buffer más grande para mejor detección
-        self.last_speech_time = 0
-        self.silence_threshold = 2.0
-        self.is_processing = False
-        self.volume_threshold = 500  # Umbral de volumen para detectar voz
+        self.listen_stop = None
+        
+        # Reconocimiento de voz local, incremental mientras el usuario habla
+        self.asr_engine_name = "whisper"
+        self.asr_options = {"model": "base.en"}
         
         # Configuración de respuesta
         self.response_mode = tk.StringVar(value="TEXT + TTS")
+        self.current_mode = "TEXT + TTS"  # Copia legible desde otros hilos
         
         # Configuración de TTS
         self.tts_voice = "en-US-AriaNeural"  # Voz en inglés nativo
-        self.tts_speed = 1.0
         self.tts_volume = 100
-        
-        # Cargar modelo en hilo separado
-        self.model = None
+        # Motor: "edge" (nube), "piper" (local), "auto" (edge con respaldo local) o "stub"
+        self.tts_engine = "auto"
+        self.tts_options = {"piper_model": "en_US-lessac-medium.onnx", "timeout": 2.5}
+        
+        # Caché de audio sintetizado (memoria + disco) y precalentamiento de frases fijas
+        self.tts_prewarm = True
+        # Edge mientras se carga el motor configurado (la voz local tarda en cargar)
+        self.pipeline.set_synthesizer(EdgeSynthesizer(self.tts_voice))
+        
+        # Streaming de tokens hacia el chat (el despachador los agrupa por frame)
+        self.stream_active = False
+        self.stream_message = None
+        
+        # Historial completo en memoria (el widget solo muestra una ventana)
+        self.messages = MessageStore()
+        
+        # Historial persistente (SQLite): los turnos se guardan en segundo plano
+        with self.startup.span("history"):
+            self.history = HistoryStore()
+        self.history_results = []       # Ids de sesión de cada fila de la lista de resultados
+        self.save_voice_audio = True    # Guardar la voz del usuario junto al historial
+        self.pipeline.history = self.history
+        if self.save_voice_audio:
+            self.pipeline.audio_dir = os.path.join(os.path.dirname(self.history.path), "audio")
+        
+        # Hilo de inferencia y servicio de reproducción
+        self.pipeline.start()
+        
+        # El modelo (elegido del registro de modelos) se carga en segundo plano
+        self.model_name = None  # None: el modelo por defecto del registro
+        # El gobernador es el dueño del modelo cargado: lo descarga sin uso y lo recarga al hablar o escribir
+        self.governor = None
+        self.pin_model = False  # Mantener el modelo siempre en memoria (latencia mínima)
+        self.active_model_name = None
         self.model_loaded = False
-        self.loading_thread = threading.Thread(target=self.load_model)
-        self.loading_thread.start()
         
-        self.setup_ui()
-        self.check_model_status()
+        with self.startup.span("window"):
+            self.setup_ui()
+            self.register_ui_events()
+        self.root.after_idle(self.on_first_frame)
+    
+    def on_first_frame(self):
+        """La ventana ya se ve: arrancar en paralelo lo que tarda"""
+        self.startup.mark("first_frame")
+        print(f"🪟 Ventana lista en {self.startup.elapsed() * 1000:.0f} ms")
+        threads = [
+            self.ui.background(self.load_model, name="model"),
+            self.ui.background(self.load_asr, name="asr"),
+            self.ui.background(self.load_synthesizer, name="tts"),
+            self.ui.background(self.open_audio_device, name="audio-device"),
+        ]
+        self.ui.background(self.report_startup, threads, event="startup_report", name="startup-report")
+    
+    def open_audio_device(self):
+        """Inicializa PortAudio antes de que se pulse el micrófono"""
+        try:
+            with self.startup.span("audio_device"):
+                self.capture.open_device()
+        except Exception as e:
+            print(f"⚠️ Micrófono no disponible: {e}")
+    
+    def load_asr(self):
+        """Motor de reconocimiento de voz (local, sin red)"""
+        with self.startup.span("asr_load"):
+            self.pipeline.transcriber.engine = create_asr_engine(self.asr_engine_name, **self.asr_options)
+    
+    def report_startup(self, threads):
+        """Espera a los subsistemas e imprime el perfil de arranque"""
+        for thread in threads:
+            thread.join()
+        self.startup.mark("ready")
+        lines = self.startup.report_lines()
+        print("⏱️ Arranque:")
+        for line in lines:
+            print(f"   {line}")
+        return lines
+    
+    def show_startup_report(self, lines):
+        # Hasta el primer turno el panel de métricas muestra el arranque
+        if not self.pipeline.tracer.snapshot():
+            self.metrics_var.set("Arranque:\n" + "\n".join(lines))
     
     def setup_ui(self):
         # Frame principal con dos columnas
@@ -88,6 +189,8 @@ class ChatApp:
                                                  font=("Arial", 10))
         self.chat_area.grid(row=1, column=0, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S), 
                            pady=(0, 10))
+        # El widget solo contiene los mensajes recientes; el resto se carga al desplazarse
+        self.transcript = TranscriptView(self.chat_area, self.messages, window=200, page=50)
         
         # Frame para entrada y botones
         input_frame = ttk.Frame(chat_frame)
@@ -105,7 +208,11 @@ class ChatApp:
         
         # Botón hablar
         self.speak_button = ttk.Button(input_frame, text="🔊 Hablar", command=self.speak_last_response)
-        self.speak_button.grid(row=0, column=2)
+        self.speak_button.grid(row=0, column=2, padx=(0, 10))
+        
+        # Botón silenciar
+        self.mute_button = ttk.Button(input_frame, text="⏹️ Silenciar", command=self.stop_speaking)
+        self.mute_button.grid(row=0, column=3)
         
         # Frame para controles de voz
         voice_frame = ttk.Frame(chat_frame)
@@ -123,6 +230,10 @@ class ChatApp:
                                      font=("Arial", 10, "italic"))
         voice_status_label.grid(row=0, column=1, sticky=tk.W)
         
+        # Nivel del micrófono (dBFS de -80 a 0)
+        self.level_bar = ttk.Progressbar(voice_frame, length=120, maximum=80, mode="determinate")
+        self.level_bar.grid(row=0, column=2, padx=(10, 0))
+        
         # Barra de estado
         self.status_var = tk.StringVar(value="Cargando modelo...")
         status_bar = ttk.Label(chat_frame, textvariable=self.status_var, 
@@ -162,26 +273,17 @@ class ChatApp:
         self.silence_slider = ttk.Scale(silence_frame, from_=0.5, to=5.0, 
                                        orient=tk.HORIZONTAL, length=150,
                                        command=self.update_silence_threshold)
-        self.silence_slider.set(self.silence_threshold)
+        self.silence_slider.set(self.pipeline.silence_threshold)
         self.silence_slider.grid(row=0, column=0, sticky=(tk.W, tk.E))
         
-        self.silence_label = ttk.Label(silence_frame, text=f"{self.silence_threshold:.1f}s")
+        self.silence_label = ttk.Label(silence_frame, text=f"{self.pipeline.silence_threshold:.1f}s")
         self.silence_label.grid(row=0, column=1, padx=(5, 0))
         
-        # Umbral de volumen
-        ttk.Label(voice_config_frame, text="Sensibilidad del micrófono:").grid(row=2, column=0, sticky=tk.W, pady=(10, 2))
-        
-        volume_threshold_frame = ttk.Frame(voice_config_frame)
-        volume_threshold_frame.grid(row=3, column=0, sticky=(tk.W, tk.E), pady=2)
+        # Ruido de fondo (el detector de voz se ajusta solo)
+        ttk.Label(voice_config_frame, text="Ruido de fondo (automático):").grid(row=2, column=0, sticky=tk.W, pady=(10, 2))
         
-        self.volume_slider = ttk.Scale(volume_threshold_frame, from_=100, to=2000, 
-                                      orient=tk.HORIZONTAL, length=150,
-                                      command=self.update_volume_threshold)
-        self.volume_slider.set(self.volume_threshold)
-        self.volume_slider.grid(row=0, column=0, sticky=(tk.W, tk.E))
-        
-        self.volume_label = ttk.Label(volume_threshold_frame, text=str(self.volume_threshold))
-        self.volume_label.grid(row=0, column=1, padx=(5, 0))
+        self.noise_floor_var = tk.StringVar(value="—")
+        ttk.Label(voice_config_frame, textvariable=self.noise_floor_var).grid(row=3, column=0, sticky=tk.W, pady=2)
         
         # Velocidad de TTS
         ttk.Label(voice_config_frame, text="Velocidad de habla (TTS):").grid(row=4, column=0, sticky=tk.W, pady=(10, 2))
@@ -192,40 +294,188 @@ class ChatApp:
         self.speed_slider = ttk.Scale(speed_frame, from_=0.5, to=2.0, 
                                      orient=tk.HORIZONTAL, length=150,
                                      command=self.update_tts_speed)
-        self.speed_slider.set(self.tts_speed)
+        self.speed_slider.set(self.pipeline.tts_speed)
         self.speed_slider.grid(row=0, column=0, sticky=(tk.W, tk.E))
         
-        self.speed_label = ttk.Label(speed_frame, text=f"{self.tts_speed:.1f}x")
+        self.speed_label = ttk.Label(speed_frame, text=f"{self.pipeline.tts_speed:.1f}x")
         self.speed_label.grid(row=0, column=1, padx=(5, 0))
         
+        # Interrumpir al tutor hablando (con supresión de su propio eco)
+        self.barge_in_var = tk.BooleanVar(value=self.pipeline.barge_in)
+        ttk.Checkbutton(voice_config_frame, text="Interrumpir al tutor al hablar", variable=self.barge_in_var,
+                        command=self.update_barge_in).grid(row=6, column=0, sticky=tk.W, pady=(10, 2))
+
+        # Fin de frase según las pausas del alumno (la pausa de arriba es el máximo)
+        self.adaptive_var = tk.BooleanVar(value=self.pipeline.adaptive_endpointing)
+        ttk.Checkbutton(voice_config_frame, text="Fin de frase adaptativo", variable=self.adaptive_var,
+                        command=self.update_adaptive_endpointing).grid(row=7, column=0, sticky=tk.W, pady=2)
+        
         # === INFORMACIÓN DEL SISTEMA ===
         info_frame = ttk.LabelFrame(config_frame, text="ℹ️ Información", padding="5")
         info_frame.grid(row=2, column=0, sticky=(tk.W, tk.E), pady=(0, 10))
         
-        ttk.Label(info_frame, text="Modelo: OpenHermes-2.5-Mistral-7B", 
+        self.model_info_var = tk.StringVar(value="Modelo: cargando...")
+        ttk.Label(info_frame, textvariable=self.model_info_var, 
                  font=("Arial", 9)).grid(row=0, column=0, sticky=tk.W, pady=2)
-        ttk.Label(info_frame, text="TTS: Edge TTS (Inglés nativo)", 
+        self.tts_info_var = tk.StringVar(value="TTS: Edge TTS (Inglés nativo)")
+        ttk.Label(info_frame, textvariable=self.tts_info_var, 
                  font=("Arial", 9)).grid(row=1, column=0, sticky=tk.W, pady=2)
         ttk.Label(info_frame, text="Audio: Streaming en tiempo real", 
                  font=("Arial", 9)).grid(row=2, column=0, sticky=tk.W, pady=2)
         
+        # Sin marcar, el modelo se descarga tras un rato sin uso (equipos compartidos)
+        self.pin_model_var = tk.BooleanVar(value=self.pin_model)
+        ttk.Checkbutton(info_frame, text="Mantener el modelo en memoria", variable=self.pin_model_var,
+                        command=self.update_pin_model).grid(row=3, column=0, sticky=tk.W, pady=2)
+        
+        # === MÉTRICAS POR ETAPA ===
+        metrics_frame = ttk.LabelFrame(config_frame, text="📈 Latencia por etapa", padding="5")
+        metrics_frame.grid(row=3, column=0, sticky=(tk.W, tk.E), pady=(0, 10))
+        
+        self.metrics_var = tk.StringVar(value="Sin turnos todavía")
+        ttk.Label(metrics_frame, textvariable=self.metrics_var, font=("Courier", 8),
+                  justify=tk.LEFT).grid(row=0, column=0, sticky=tk.W, pady=2)
+        
+        self.trace_export_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(metrics_frame, text="Exportar trazas (JSONL)", variable=self.trace_export_var,
+                        command=self.toggle_trace_export).grid(row=1, column=0, sticky=tk.W, pady=2)
+        
+        # === HISTORIAL ===
+        history_frame = ttk.LabelFrame(config_frame, text="🗂️ Historial", padding="5")
+        history_frame.grid(row=4, column=0, sticky=(tk.W, tk.E), pady=(0, 10))
+        
+        self.history_query_var = tk.StringVar()
+        search_entry = ttk.Entry(history_frame, textvariable=self.history_query_var)
+        search_entry.grid(row=0, column=0, sticky=(tk.W, tk.E), padx=(0, 5))
+        search_entry.bind("<Return>", self.search_history)
+        ttk.Button(history_frame, text="🔍 Buscar",
+                  command=self.search_history).grid(row=0, column=1)
+        
+        self.history_list = tk.Listbox(history_frame, height=6, font=("Arial", 8))
+        self.history_list.grid(row=1, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=5)
+        ttk.Button(history_frame, text="↩️ Reanudar sesión",
+                  command=self.resume_selected_session).grid(row=2, column=0, columnspan=2, sticky=tk.W)
+        self.search_history()
+        
         # === BOTONES DE ACCIÓN ===
         action_frame = ttk.Frame(config_frame)
-        action_frame.grid(row=3, column=0, sticky=(tk.W, tk.E), pady=(10, 0))
+        action_frame.grid(row=5, column=0, sticky=(tk.W, tk.E), pady=(10, 0))
         
         ttk.Button(action_frame, text="🔄 Reiniciar Config", 
                   command=self.reset_config).grid(row=0, column=0, pady=5)
+        ttk.Button(action_frame, text="🧹 Nueva Conversación", 
+                  command=self.clear_conversation).grid(row=1, column=0, pady=5)
         
         # Configurar expansión
         config_frame.columnconfigure(0, weight=1)
         voice_config_frame.columnconfigure(0, weight=1)
+        history_frame.columnconfigure(0, weight=1)
         speed_frame.columnconfigure(0, weight=1)
-        volume_threshold_frame.columnconfigure(0, weight=1)
         silence_frame.columnconfigure(0, weight=1)
     
+    def register_ui_events(self):
+        """Qué hace el hilo de Tk con cada evento de los hilos de trabajo"""
+        self.ui.on("status", self.status_var.set, LATEST)
+        self.ui.on("model_info", self.model_info_var.set)
+        self.ui.on("tts_engine", lambda name: self.tts_info_var.set(f"TTS: {name}"))
+        self.ui.on("model_loaded", self.on_model_loaded)
+        self.ui.on("response_start", self.on_response_start)
+        self.ui.on("tokens", self.flush_stream_text, APPEND)
+        self.ui.on("response", lambda record: self.show_response(record.response, record.stats))
+        self.ui.on("user_voice", lambda record: self.add_message("Tú (Voz)", record.shown_text))
+        self.ui.on("partial", lambda text: self.voice_status_var.set(f"📝 {text}"), LATEST)
+        self.ui.on("noise_floor", lambda db: self.noise_floor_var.set(f"{db:.0f} dBFS"), LATEST)
+        self.ui.on("level", self.show_level, LATEST)
+        self.ui.on("metrics", self.refresh_metrics, LATEST)
+        self.ui.on("history_results", self.show_history_results)
+        self.ui.on("session_loaded", self.resume_session)
+        self.ui.on("startup_report", self.show_startup_report)
+        self.ui.on("model_pinned", self.pin_model_var.set)
+    
+    def refresh_metrics(self, data=None):
+        """Actualiza el panel con los percentiles móviles de cada etapa (al terminar cada turno)"""
+        lines = self.pipeline.tracer.summary_lines()
+        if lines:
+            self.metrics_var.set("\n".join(lines))
+    
+    def show_level(self, level_db):
+        self.level_bar["value"] = max(0.0, level_db + 80.0) if self.is_listening else 0.0
+    
+    def toggle_trace_export(self):
+        """Activa o desactiva la exportación de spans a JSONL"""
+        if self.trace_export_var.get():
+            try:
+                self.pipeline.tracer.start_export()
+                print(f"📈 Exportando trazas a {self.pipeline.tracer.export_path}")
+            except OSError as e:
+                print(f"⚠️ No se pudo abrir el archivo de trazas: {e}")
+                self.trace_export_var.set(False)
+        else:
+            self.pipeline.tracer.stop_export()
+    
+    def search_history(self, event=None):
+        """Busca en el historial (o lista las sesiones recientes) sin bloquear la interfaz"""
+        query = self.history_query_var.get().strip()
+        if query:
+            self.ui.background(lambda: (self.history.search(query), True),
+                               event="history_results", name="history-search")
+        else:
+            self.ui.background(lambda: (self.history.recent_sessions(), False),
+                               event="history_results", name="history-search")
+    
+    def show_history_results(self, results):
+        """Rellena la lista con mensajes encontrados o con sesiones recientes"""
+        rows, matches = results
+        self.history_list.delete(0, tk.END)
+        self.history_results = []
+        for row in rows:
+            if matches:
+                when = time.strftime("%d/%m %H:%M", time.localtime(row["created"]))
+                sender = "IA" if row["role"] == "assistant" else "Tú"
+                line = f"{when} {sender}: {row['snippet']}"
+                self.history_results.append(row["session_id"])
+            else:
+                when = time.strftime("%d/%m %H:%M", time.localtime(row["updated"]))
+                line = f"{when} · {row['messages']} msgs · {(row['first'] or '')[:40]}"
+                self.history_results.append(row["id"])
+            self.history_list.insert(tk.END, line)
+    
+    def resume_selected_session(self):
+        """Carga la sesión seleccionada en un hilo y la reanuda en el de Tk"""
+        selection = self.history_list.curselection()
+        if not selection or not self.model_loaded or self.stream_active:
+            return
+        session_id = self.history_results[selection[0]]
+        self.ui.background(lambda: (session_id, self.history.load_session(session_id)),
+                           event="session_loaded", name="history-load")
+    
+    def resume_session(self, loaded):
+        """Sustituye el chat por la sesión guardada y la continúa con el tutor"""
+        session_id, rows = loaded
+        self.messages.clear()
+        for row in rows:
+            if row["role"] == "assistant":
+                sender = "IA"
+            elif row["role"] == "user":
+                sender = "Tú (Voz)" if row["kind"] == "voice" else "Tú"
+            else:
+                sender = row["sender"] or "Sistema"
+            self.messages.append(sender, row["text"], role=row["role"])
+        self.messages.append("Sistema", f"↩️ Sesión reanudada ({len(rows)} mensajes).")
+        # Solo se dibuja la última ventana de mensajes; el resto se pagina al subir
+        self.transcript.show_latest(reload=True)
+        
+        # El tutor ve lo que realmente recibió (la transcripción en los turnos de voz)
+        self.pipeline.session_id = session_id
+        self.pipeline.resume_conversation([(row["role"], row["prompt_text"] or row["text"])
+                                           for row in rows if row["role"] in ("user", "assistant")
+                                           and row["status"] != "dropped"])
+    
     def on_response_mode_change(self):
         """Se ejecuta cuando cambia el modo de respuesta"""
         mode = self.response_mode.get()
+        self.current_mode = mode
+        self.pipeline.speak = mode in ["TTS", "TEXT + TTS"]
         print(f"Modo de respuesta cambiado a: {mode}")
         
         # Actualizar estado de botones según el modo
@@ -236,82 +486,116 @@ class ChatApp:
     
     def update_silence_threshold(self, value):
         """Actualiza el umbral de silencio"""
-        self.silence_threshold = float(value)
-        self.silence_label.config(text=f"{self.silence_threshold:.1f}s")
-        print(f"Umbral de silencio actualizado: {self.silence_threshold}s")
-    
-    def update_volume_threshold(self, value):
-        """Actualiza el umbral de volumen"""
-        self.volume_threshold = int(float(value))
-        self.volume_label.config(text=str(self.volume_threshold))
-        print(f"Umbral de volumen actualizado: {self.volume_threshold}")
+        self.pipeline.silence_threshold = float(value)
+        self.silence_label.config(text=f"{self.pipeline.silence_threshold:.1f}s")
+        print(f"Umbral de silencio actualizado: {self.pipeline.silence_threshold}s")
     
     def update_tts_speed(self, value):
         """Actualiza la velocidad del TTS"""
-        self.tts_speed = float(value)
-        self.speed_label.config(text=f"{self.tts_speed:.1f}x")
-        print(f"Velocidad TTS actualizada: {self.tts_speed}x")
+        self.pipeline.tts_speed = float(value)
+        self.speed_label.config(text=f"{self.pipeline.tts_speed:.1f}x")
+        print(f"Velocidad TTS actualizada: {self.pipeline.tts_speed}x")
+    
+    def update_barge_in(self):
+        """Activa o desactiva el barge-in"""
+        self.pipeline.barge_in = self.barge_in_var.get()
+        print(f"Barge-in: {'activado' if self.pipeline.barge_in else 'desactivado'}")
+    
+    def update_adaptive_endpointing(self):
+        """Activa o desactiva el fin de frase adaptativo"""
+        self.pipeline.adaptive_endpointing = self.adaptive_var.get()
+        print(f"Fin de frase adaptativo: {'activado' if self.pipeline.adaptive_endpointing else 'desactivado'}")
     
     def reset_config(self):
         """Reinicia la configuración a valores por defecto"""
         self.silence_slider.set(2.0)
-        self.volume_slider.set(500)
         self.speed_slider.set(1.0)
         self.response_mode.set("TEXT + TTS")
+        self.current_mode = "TEXT + TTS"
+        self.pipeline.speak = True
         
-        self.silence_threshold = 2.0
-        self.volume_threshold = 500
-        self.tts_speed = 1.0
+        self.pipeline.silence_threshold = 2.0
+        self.pipeline.tts_speed = 1.0
         
         self.silence_label.config(text="2.0s")
-        self.volume_label.config(text="500")
         self.speed_label.config(text="1.0x")
         
         print("Configuración reiniciada a valores por defecto")
     
+    def clear_conversation(self):
+        """Olvida el historial de la conversación con el tutor"""
+        if not self.pipeline.ready:
+            return
+        self.pipeline.clear_conversation()
+        self.pipeline.session_id = self.history.start_session(model=self.active_model_name)
+        self.add_message("Sistema", "🧹 Conversación reiniciada. El tutor ya no recuerda los mensajes anteriores.")
+    
     def load_model(self):
         """Carga el modelo en un hilo separado"""
         try:
-            MODEL_PATH = r"G:\.ollama\models\TheBloke\OpenHermes-2.5-Mistral-7B-GGUF\openhermes-2.5-mistral-7b.Q8_0.gguf"
+            default, models = model_registry.load_registry()
+            spec = models[self.model_name or default]
+            
+            self.ui.post("status", f"Cargando {spec.name}... (esto puede tardar unos minutos)")
             
-            self.message_queue.put(("status", "Cargando modelo... (esto puede tardar unos minutos)"))
+            with self.startup.span("model_load", model=spec.name):
+                loaded = model_registry.load_model(spec)
+            print(f"🧠 Modelo: {loaded.variant.path}")
+            self.ui.post("model_info", f"Modelo: {spec.name} ({loaded.variant.quantization})")
+            self.active_model_name = spec.name
+            self.pipeline.session_id = self.history.start_session(model=spec.name)
             
-            self.model = AutoModelForCausalLM.from_pretrained(
-                MODEL_PATH,
-                model_type="mistral",
-                gpu_layers=0,
-                context_length=2048
-            )
+            self.pipeline.set_model(loaded.model, context_length=spec.context_length,
+                                    max_new_tokens=spec.max_new_tokens)
             
-            self.message_queue.put(("status", "¡Modelo cargado! Escribe tu mensaje en inglés o usa el micrófono"))
-            self.message_queue.put(("model_loaded", True))
+            # El prompt de sistema queda evaluado y los pesos ya en memoria
+            if spec.warmup:
+                self.ui.post("status", "Calentando el modelo...")
+                with self.startup.span("warm_up"):
+                    self.pipeline.warm_up(loaded)
+            
+            self.governor = ModelGovernor(self.pipeline, lambda: model_registry.load_model(spec), loaded,
+                                          idle_seconds=spec.idle_unload, pinned=spec.pinned or self.pin_model)
+            self.governor.on_state = self.on_governor_state
+            self.governor.start()
+            if spec.pinned:
+                self.ui.post("model_pinned", True)
+            
+            print(f"🧠 {loaded.summary()}")
+            self.ui.post("status", f"¡Modelo cargado! ({loaded.summary()}) "
+                                   "Escribe tu mensaje en inglés o usa el micrófono")
+            self.startup.mark("model_ready")
+            self.ui.post("model_loaded", True)
             
         except Exception as e:
-            self.message_queue.put(("status", f"Error al cargar modelo: {str(e)}"))
-            self.message_queue.put(("model_loaded", False))
+            self.ui.post("status", f"Error al cargar modelo: {str(e)}")
+            self.ui.post("model_loaded", False)
     
-    def check_model_status(self):
-        """Verifica el estado del modelo y actualiza la UI"""
-        try:
-            while True:
-                msg_type, data = self.message_queue.get_nowait()
-                if msg_type == "status":
-                    self.status_var.set(data)
-                elif msg_type == "model_loaded":
-                    self.model_loaded = data
-                    if data:
-                        self.send_button.config(state="normal")
-                        self.input_field.config(state="normal")
-                        self.mic_button.config(state="normal")
-                        self.add_message("IA", "¡Hola! Soy tu tutor de inglés. Escribe algo en inglés para practicar o presiona el botón del micrófono.")
-                    else:
-                        self.send_button.config(state="disabled")
-                        self.input_field.config(state="disabled")
-                        self.mic_button.config(state="disabled")
-        except queue.Empty:
-            pass
-        # Programar siguiente verificación
-        self.root.after(100, self.check_model_status)
+    def on_governor_state(self, state, detail):
+        """Descargas y recargas del modelo (desde el hilo de inferencia)"""
+        if state == "unloaded":
+            self.ui.post("status", f"💤 Modelo descargado para liberar memoria ({detail}); "
+                                   "se recargará al escribir o hablar")
+        elif state == "loading":
+            self.ui.post("status", "⏰ Recargando el modelo...")
+        else:
+            self.ui.post("status", f"¡Modelo listo! ({detail})")
+    
+    def update_pin_model(self):
+        """Activa o desactiva el modo fijo (el modelo no se descarga nunca)"""
+        self.pin_model = self.pin_model_var.get()
+        if self.governor is not None:
+            self.governor.set_pinned(self.pin_model)
+    
+    def on_model_loaded(self, loaded):
+        """Habilita (o no) la entrada cuando termina la carga del modelo"""
+        self.model_loaded = loaded
+        state = "normal" if loaded else "disabled"
+        self.send_button.config(state=state)
+        self.input_field.config(state=state)
+        self.mic_button.config(state=state)
+        if loaded:
+            self.add_message("IA", GREETING)
     
     def toggle_voice_listening(self):
         """Activa/desactiva la escucha de voz"""
@@ -329,218 +613,101 @@ class ChatApp:
         self.mic_button.config(text="🎤 Detener Escucha")
         self.voice_status_var.set("Escuchando... Habla ahora")
         
-        # Limpiar buffer de audio
-        self.audio_buffer.clear()
-        self.last_speech_time = time.time()
-        self.is_processing = False
-        
-        # Iniciar hilo de escucha
-        self.voice_thread = threading.Thread(target=self.continuous_voice_listening, daemon=True)
+        # Cada escucha tiene su propia señal de parada: el hilo de la anterior puede
+        # seguir cerrando su última frase y no debe ver la escucha nueva
+        self.listen_stop = threading.Event()
+        self.voice_thread = threading.Thread(target=self.continuous_voice_listening,
+                                             args=(self.voice_thread, self.listen_stop), daemon=True)
         self.voice_thread.start()
         
         self.add_message("Sistema", "🎤 Micrófono activado. Habla en inglés para practicar.")
     
-    def stop_voice_listening(self):
-        """Detiene la escucha de voz"""
+    def stop_voice_listening(self, session=None):
+        """Detiene la escucha de voz (si session es de una escucha anterior, no hace nada)"""
+        if session is not None and session is not self.listen_stop:
+            return
         self.is_listening = False
+        if self.listen_stop is not None:
+            self.listen_stop.set()
         self.mic_button.config(text="🎤 Iniciar Escucha")
         self.voice_status_var.set("Micrófono desactivado")
         
-        # Procesar cualquier audio restante
-        if self.audio_buffer and not self.is_processing:
-            self.process_audio_buffer()
-        
+        # El hilo de escucha procesa el audio restante al salir
         self.add_message("Sistema", "🎤 Micrófono desactivado.")
     
-    async def speak_text_async(self, text):
-        """Lee en voz alta el texto usando Edge TTS"""
-        try:
-            # Corregir formato de velocidad - Edge TTS usa +20% no +1.0%
-            rate_percentage = int((self.tts_speed - 1.0) * 100)
-            rate_string = f"{rate_percentage:+d}%" if rate_percentage != 0 else "+0%"
-            
-            communicate = edge_tts.Communicate(text, self.tts_voice, rate=rate_string)
-            
-            # Crear archivo temporal para el audio
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as tmp_file:
-                tmp_filename = tmp_file.name
-            
-            # Generar audio
-            await communicate.save(tmp_filename)
-            
-            # Reproducir audio usando pygame (más confiable)
-            try:
-                import pygame
-                pygame.mixer.init()
-                pygame.mixer.music.load(tmp_filename)
-                pygame.mixer.music.play()
-                
-                # Esperar a que termine de reproducir
-                while pygame.mixer.music.get_busy():
-                    pygame.time.wait(100)
-                    
-            except ImportError:
-                print("🔊 TTS generado (instala pygame para reproducción): {text}")
-            
-            # Limpiar archivo temporal
-            try:
-                os.unlink(tmp_filename)
-            except:
-                pass
-                
-        except Exception as e:
-            print(f"Error en TTS: {e}")
+    def report_tts_metrics(self, stream):
+        print(self.pipeline.tts_cache.summary())
+        print(f"🗣️ TTS {self.pipeline.synthesizer.metrics_summary()}")
     
-    def process_audio_buffer(self):
-        """Procesa el buffer de audio acumulado"""
-        if not self.audio_buffer or self.is_processing:
-            return
-        
-        self.is_processing = True
-        
+    def stop_speaking(self):
+        """Corta la voz actual y descarta la que estaba en espera"""
+        self.pipeline.stop_speaking()
+    
+    def load_synthesizer(self):
+        """Carga el motor de TTS configurado y precalienta la caché (en segundo plano)"""
         try:
-            print("🎧 Procesando audio en tiempo real...")
-            
-            # Aquí procesarías el audio con Whisper local
-            # Por ahora, simulamos el procesamiento con el modelo
-            self.process_audio_with_model()
-            
+            with self.startup.span("tts_load", engine=self.tts_engine):
+                engine = create_synthesizer(self.tts_engine, voice=self.tts_voice, **self.tts_options)
+            self.pipeline.set_synthesizer(engine)
+            print(f"🗣️ Motor de TTS: {engine.name}")
+            self.ui.post("tts_engine", engine.name)
         except Exception as e:
-            print(f"Error al procesar audio: {e}")
-        finally:
-            self.is_processing = False
-            # Reiniciar la escucha después de procesar
-            if self.is_listening:
-                print("🔄 Reiniciando escucha de voz...")
-                self.root.after(100, self.restart_voice_listening)
-    
-    def restart_voice_listening(self):
-        """Reinicia la escucha de voz después de procesar audio"""
-        if self.is_listening and not self.is_processing:
-            # Limpiar buffer y reiniciar
-            self.audio_buffer.clear()
-            self.last_speech_time = time.time()
-            
-            # Iniciar nuevo hilo de escucha
-            self.voice_thread = threading.Thread(target=self.continuous_voice_listening, daemon=True)
-            self.voice_thread.start()
-            print("🎤 Escucha de voz reiniciada")
+            print(f"⚠️ No se pudo cargar el motor de TTS '{self.tts_engine}': {e}")
+        if self.tts_prewarm:
+            with self.startup.span("tts_prewarm"):
+                self.pipeline.prewarm_tts(KNOWN_PHRASES)
     
-    def continuous_voice_listening(self):
+    def continuous_voice_listening(self, previous, stop):
         """Escucha continuamente la voz del usuario en tiempo real"""
+        # El VAD, el transcriptor y el fin de frase son uno: esperar a que el hilo
+        # anterior termine (fuera del hilo de Tk) antes de reiniciarlos
+        if previous is not None:
+            previous.join()
+        if stop.is_set():
+            return
         try:
-            # Abrir stream de audio
-            self.audio_stream = self.audio.open(
-                format=self.audio_format,
-                channels=self.channels,
-                rate=self.rate,
-                input=True,
-                frames_per_buffer=self.chunk
-            )
-            
-            print("🎤 Iniciando escucha en tiempo real...")
-            
-            while self.is_listening:
-                try:
-                    # Leer audio en chunks pequeños
-                    data = self.audio_stream.read(self.chunk, exception_on_overflow=False)
-                    self.audio_buffer.append(data)
-                    
-                    # Detectar si hay voz activa
-                    audio_data = np.frombuffer(data, dtype=np.int16)
-                    volume_norm = np.linalg.norm(audio_data)
-                    
-                    # Si hay sonido por encima del umbral, actualizar timestamp
-                    if volume_norm > self.volume_threshold:
-                        self.last_speech_time = time.time()
-                        print(f"🎤 Voz detectada - Volumen: {volume_norm:.0f}")
-                    
-                    # Verificar si ha pasado suficiente tiempo de silencio
-                    silence_duration = time.time() - self.last_speech_time
-                    if silence_duration > self.silence_threshold:
-                        if self.audio_buffer and not self.is_processing:
-                            print(f"🔇 Silencio detectado ({silence_duration:.1f}s) - Procesando audio...")
-                            self.process_audio_buffer()
-                            break  # Salir del loop para reiniciar
-                    
-                    time.sleep(0.01)  # Pausa mínima para no saturar CPU
-                    
-                except Exception as e:
-                    print(f"Error en captura de audio: {e}")
-                    continue
-            
-            # Cerrar stream
-            if self.audio_stream:
-                self.audio_stream.stop_stream()
-                self.audio_stream.close()
-                self.audio_stream = None
-            
+            self.pipeline.begin_listening(self.capture)
+            self.pipeline.listen(self.capture, lambda: not stop.is_set())
         except Exception as e:
             print(f"Error crítico en escucha de voz: {e}")
-            self.root.after(0, self.stop_voice_listening)
-    
-    def process_audio_with_model(self):
-        """Procesa el audio usando el modelo de IA"""
-        try:
-            # Crear prompt para la IA
-            prompt = f"""<|im_start|>system
-You are a friendly English tutor who can "hear" audio directly. The user has just spoken to you in English.
-Analyze their speech and respond naturally in English. If you detect pronunciation issues, mention them politely.
-Keep responses concise and helpful for language practice.
-<|im_end|>
-<|im_start|>user
-[Audio input - user speaking in English]
-<|im_end|>
-<|im_start|>assistant
-"""
-            
-            # Generar respuesta basada en el audio
-            response = self.model(prompt, max_new_tokens=200, temperature=0.7, 
-                                stop=["<|im_end|>", "<|im_start|>"])
-            
-            # Limpiar respuesta
-            clean_response = response.strip()
-            if clean_response.startswith("assistant"):
-                clean_response = clean_response[9:].strip()
-            
-            if not clean_response:
-                clean_response = "I heard you speak! That's great pronunciation practice. Keep going!"
-            
-            print(f"🎧 IA procesó audio y respondió: '{clean_response}'")
-            
-            # Mostrar respuesta en UI
-            self.root.after(0, lambda: self.show_audio_response(clean_response))
-            
-        except Exception as e:
-            error_msg = f"Error al procesar audio con IA: {str(e)}"
-            print(f"Error en process_audio_with_model: {e}")
-            self.root.after(0, lambda: self.show_audio_response(error_msg))
+            self.ui.call(self.stop_voice_listening, stop)
     
-    def show_audio_response(self, response):
-        """Muestra la respuesta de la IA basada en audio"""
-        # Mostrar que se procesó audio
-        self.add_message("Tú (Voz)", "[Audio procesado en tiempo real]")
-        
-        # Mostrar respuesta de la IA según el modo configurado
-        mode = self.response_mode.get()
-        
-        if mode in ["TEXT", "TEXT + TTS"]:
-            self.add_message("IA", response)
-        
-        if mode in ["TTS", "TEXT + TTS"]:
-            # Responder con voz automáticamente
-            threading.Thread(target=self.speak_text, args=(response,), daemon=True).start()
-        
-        # Actualizar estado
-        if not self.is_listening:
-            self.status_var.set("¡Modelo cargado! Escribe tu mensaje en inglés o usa el micrófono")
-        else:
-            self.status_var.set("Escuchando... Habla ahora")
+    def on_response_start(self, record):
+        """Prepara el chat para los tokens de una respuesta"""
+        if record.kind == "text":
+            self.status_var.set("Procesando...")
+        self.begin_stream_message("IA")
     
     def add_message(self, sender, message):
-        """Añade un mensaje al área de chat"""
-        self.chat_area.insert(tk.END, f"{sender}: {message}\n\n")
-        self.chat_area.see(tk.END)
+        """Añade un mensaje al historial y al área de chat"""
+        self.transcript.append(self.messages.append(sender, message))
+    
+    def begin_stream_message(self, sender):
+        """Abre un mensaje en el chat que se irá completando con tokens"""
+        self.stream_active = self.response_mode.get() in ["TEXT", "TEXT + TTS"]
+        if not self.stream_active:
+            return
+        self.stream_message = self.messages.append(sender, "")
+        self.transcript.begin_stream(self.stream_message)
+    
+    def flush_stream_text(self, chunks):
+        """Vuelca en el chat los fragmentos generados desde el último frame"""
+        text = "".join(chunks)
+        if text and self.stream_active:
+            self.stream_message.text += text
+            self.transcript.stream_text(text)
+    
+    def end_stream_message(self, final_text):
+        """Cierra el mensaje en streaming con el texto final ya limpio"""
+        # Los tokens llegan antes que la respuesta: no queda nada pendiente
+        if not self.stream_active:
+            self.add_message("IA", final_text)
+            return
+        self.stream_active = False
+        # Reemplazar lo mostrado por la versión limpia (sin prefijos ni espacios sobrantes)
+        self.messages.update(self.stream_message.id, final_text)
+        self.transcript.end_stream()
+        self.stream_message = None
     
     def send_message(self, event=None):
         """Envía el mensaje del usuario"""
@@ -554,76 +721,39 @@ Keep responses concise and helpful for language practice.
         # Limpiar campo de entrada
         self.input_field.delete(0, tk.END)
         
-        # Mostrar mensaje del usuario
+        # Mostrar mensaje del usuario (volviendo al final si estaba leyendo mensajes antiguos)
+        self.transcript.show_latest()
         self.add_message("Tú", message)
         
-        # Procesar en hilo separado
-        threading.Thread(target=self.process_message, args=(message,), daemon=True).start()
-    
-    def process_message(self, message):
-        """Procesa el mensaje de texto con el modelo"""
-        try:
-            # Actualizar estado
-            self.root.after(0, lambda: self.status_var.set("Procesando..."))
-            
-            # Crear prompt
-            prompt = f"""<|im_start|>system
-You are a friendly English tutor. Respond naturally and conversationally in English. Keep responses concise and helpful for language practice. Always respond in English.
-<|im_end|>
-<|im_start|>user
-{message}
-<|im_end|>
-<|im_start|>assistant
-"""
-            
-            # Generar respuesta
-            response = self.model(prompt, max_new_tokens=200, temperature=0.7, 
-                                stop=["<|im_end|>", "<|im_start|>"])
-            
-            # Limpiar respuesta
-            clean_response = response.strip()
-            if clean_response.startswith("assistant"):
-                clean_response = clean_response[9:].strip()
-            
-            if not clean_response:
-                clean_response = "I'm sorry, I didn't understand that. Could you repeat?"
-            
-            print(f"Respuesta del modelo: '{clean_response}'")
-            
-            # Actualizar UI en el hilo principal
-            self.root.after(0, lambda: self.show_response(clean_response))
-            
-        except Exception as e:
-            error_msg = f"Error al procesar mensaje: {str(e)}"
-            print(f"Error en process_message: {e}")
-            self.root.after(0, lambda: self.show_response(error_msg))
+        # Procesar en el hilo de inferencia
+        self.pipeline.submit_text(message)
     
-    def show_response(self, response):
+    def show_response(self, response, stats=None):
         """Muestra la respuesta del modelo según el modo configurado"""
         mode = self.response_mode.get()
+        if stats is not None and stats.stop_reason == "cancelled":
+            # Cortada por un turno nuevo: se marca solo en el chat, no en la conversación
+            response = f"{response} …".strip()
         
-        if mode in ["TEXT", "TEXT + TTS"]:
+        if self.stream_active:
+            self.end_stream_message(response)
+        elif mode in ["TEXT", "TEXT + TTS"]:
             self.add_message("IA", response)
         
-        if mode in ["TTS", "TEXT + TTS"]:
-            # Responder con voz automáticamente
-            threading.Thread(target=self.speak_text, args=(response,), daemon=True).start()
+        # La voz de la respuesta ya se reproduce en streaming desde generate_response
         
         # Actualizar estado solo si no está escuchando voz
-        if not self.is_listening:
+        if stats is not None:
+            self.status_var.set(stats.summary())
+        elif not self.is_listening:
             self.status_var.set("¡Modelo cargado! Escribe tu mensaje en inglés o usa el micrófono")
         else:
             self.status_var.set("Escuchando... Habla ahora")
     
     def speak_text(self, text):
-        """Wrapper para ejecutar TTS en hilo separado"""
+        """Lee un texto completo en voz alta (no bloquea: se encola en el servicio de audio)"""
         try:
-            # Crear nuevo event loop para el hilo
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            # Ejecutar TTS
-            loop.run_until_complete(self.speak_text_async(text))
+            self.pipeline.speak_text(text)
             
         except Exception as e:
             print(f"Error al hablar: {e}")
@@ -631,24 +761,36 @@ You are a friendly English tutor. Respond naturally and conversationally in Engl
     def speak_last_response(self):
         """Lee en voz alta la última respuesta de la IA"""
         try:
-            # Obtener último mensaje de la IA
-            content = self.chat_area.get("1.0", tk.END)
-            lines = content.strip().split('\n')
-            # Buscar última respuesta de la IA
-            for line in reversed(lines):
-                if line.startswith("IA: "):
-                    text_to_speak = line[4:]  # Remover "IA: "
-                    if text_to_speak:
-                        self.speak_text(text_to_speak)
-                        return
-            self.speak_text("No hay respuesta para leer")
+            # Último mensaje de la IA (completo, aunque tenga varias líneas)
+            message = self.messages.last("assistant")
+            if message is not None and message.text.strip():
+                self.speak_text(message.text.strip())
+                return
+            self.speak_text(NO_RESPONSE_TEXT)
         except Exception as e:
             print(f"Error al hablar: {e}")
 
 def main():
-    root = tk.Tk()
-    app = ChatApp(root)
+    with STARTUP.span("tk_init"):
+        root = tk.Tk()
+    app = ChatApp(root, startup=STARTUP)
     root.mainloop()
+    app.ui.close()
+    # Cerrar el stream de captura persistente
+    app.is_listening = False
+    if app.listen_stop is not None:
+        app.listen_stop.set()
+    app.capture.stop()
+    app.pipeline.shutdown()
+    # Terminar el proceso del modelo (si está aislado) o cerrar las conexiones remotas
+    if app.governor is not None:
+        app.governor.stop()
+        loaded = app.governor.loaded
+        if loaded is not None and hasattr(loaded.model, "close"):
+            loaded.model.close()
+    app.pipeline.tracer.stop_export()
+    # Escribir lo que quede en la cola del historial
+    app.history.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,222 @@
+"""Estado de la conversación: historial ChatML y presupuesto de tokens"""
+import re
+
+IM_START = "<|im_start|>"
+IM_END = "<|im_end|>"
+
+
+def chatml_segment(role, content):
+    """Texto ChatML de un mensaje completo"""
+    return f"{IM_START}{role}\n{content}{IM_END}\n"
+
+
+def estimate_tokens(text):
+    """Estimación aproximada cuando no hay tokenizador (≈4 caracteres por token)"""
+    return len(text) // 4 + 1
+
+
+class Turn:
+    """Un mensaje del historial con sus tokens ya calculados"""
+
+    def __init__(self, role, text, tokens):
+        self.role = role
+        self.text = text
+        self.tokens = tokens
+
+
+class Conversation:
+    """Historial multi-turno con prompt incremental en tokens.
+
+    Cada mensaje se tokeniza una sola vez y el prompt se arma concatenando
+    esos tokens, de modo que el prompt de un turno es prefijo exacto del
+    siguiente y el modelo solo evalúa los tokens nuevos. Cuando el prompt
+    no cabe en el contexto se recortan los turnos más antiguos y se
+    resumen en el mensaje de sistema.
+    """
+
+    def __init__(self, system_prompt, tokenize=None, bos_token_id=None, context_length=2048,
+                 max_new_tokens=200, trim_ratio=0.6, summary_chars=600):
+        self.system_prompt = system_prompt
+        self.tokenize = tokenize
+        self.bos_token_id = bos_token_id
+        self.context_length = context_length
+        self.max_new_tokens = max_new_tokens
+        # Al recortar se baja hasta esta fracción del presupuesto para que
+        # los recortes (y la reevaluación completa que implican) sean raros
+        self.trim_ratio = trim_ratio
+        self.summary_chars = summary_chars
+        self.summary = ""
+        self.turns = []
+        self.trim_count = 0
+        self._update_system()
+        self.assistant_header = self._encode(f"{IM_START}assistant\n")
+        self.assistant_close = self._encode(f"{IM_END}\n")
+        self.newline = self._encode("\n")
+
+    @property
+    def prompt_budget(self):
+        """Tokens disponibles para el prompt dejando sitio a la respuesta"""
+        return self.context_length - self.max_new_tokens
+
+    def _encode(self, text):
+        if self.tokenize is None:
+            return [0] * estimate_tokens(text)
+        return list(self.tokenize(text))
+
+    def system_content(self):
+        """Mensaje de sistema incluyendo el resumen de turnos recortados"""
+        content = self.system_prompt
+        if self.summary:
+            content += f"\nEarlier in this conversation (summary):\n{self.summary}"
+        return content
+
+    def _update_system(self):
+        self.system_tokens = self._encode(chatml_segment("system", self.system_content()))
+
+    def add_user(self, text):
+        """Añade un mensaje del usuario"""
+        # Un único mensaje nunca debe ocupar más de la mitad del presupuesto
+        max_chars = self.prompt_budget * 2
+        if len(text) > max_chars:
+            text = text[-max_chars:]
+        self.turns.append(Turn("user", text, self._encode(chatml_segment("user", text))))
+
+    def add_assistant(self, text, token_ids=None, stop_reason=None):
+        """Añade la respuesta del modelo.
+
+        Si se pasan los token_ids generados se guardan tal cual, ya que son
+        exactamente los que el modelo tiene evaluados en su contexto.
+        """
+        if token_ids is None:
+            tokens = self._encode(chatml_segment("assistant", text))
+        elif stop_reason in ("stop", "eos"):
+            # El fin de turno ya está dentro de lo generado
+            tokens = self.assistant_header + list(token_ids) + self.newline
+        else:
+            tokens = self.assistant_header + list(token_ids) + self.assistant_close
+        self.turns.append(Turn("assistant", text, tokens))
+
+    def token_count(self):
+        """Tokens del prompt completo que se enviaría ahora"""
+        count = len(self.system_tokens) + len(self.assistant_header)
+        if self.bos_token_id is not None:
+            count += 1
+        return count + sum(len(turn.tokens) for turn in self.turns)
+
+    def _prompt_tokens(self, extra=()):
+        tokens = [] if self.bos_token_id is None else [self.bos_token_id]
+        tokens.extend(self.system_tokens)
+        for turn in self.turns:
+            tokens.extend(turn.tokens)
+        tokens.extend(extra)
+        tokens.extend(self.assistant_header)
+        return tokens
+
+    def build_prompt(self):
+        """Devuelve los tokens del prompt, recortando el historial si hace falta"""
+        self.enforce_budget()
+        return self._prompt_tokens()
+
+    def preview_prompt(self, text):
+        """Tokens del prompt si ahora llegara este mensaje del usuario (sin añadirlo).
+
+        Devuelve None si habría que recortar el historial: entonces el
+        prompt real no se puede anticipar.
+        """
+        if len(text) > self.prompt_budget * 2:
+            return None
+        user_tokens = self._encode(chatml_segment("user", text))
+        if self.token_count() + len(user_tokens) > self.prompt_budget:
+            return None
+        return self._prompt_tokens(user_tokens)
+
+    def render(self):
+        """Prompt ChatML en texto (para backends que tokenizan por su cuenta)"""
+        self.enforce_budget()
+        parts = [chatml_segment("system", self.system_content())]
+        parts.extend(chatml_segment(turn.role, turn.text) for turn in self.turns)
+        parts.append(f"{IM_START}assistant\n")
+        return "".join(parts)
+
+    def enforce_budget(self):
+        """Recorta y resume los turnos más antiguos si el prompt no cabe"""
+        if self.token_count() <= self.prompt_budget:
+            return False
+
+        target = int(self.prompt_budget * self.trim_ratio)
+        dropped = []
+        # Siempre se conserva el último mensaje
+        while len(self.turns) > 1 and self.token_count() > target:
+            dropped.append(self.turns.pop(0))
+        # No empezar el historial con una respuesta huérfana
+        if len(self.turns) > 1 and self.turns[0].role == "assistant":
+            dropped.append(self.turns.pop(0))
+
+        if dropped:
+            self.summarize(dropped)
+            self.trim_count += 1
+            print(f"✂️ Historial recortado: {len(dropped)} mensajes resumidos "
+                  f"({self.token_count()} tokens)")
+        return bool(dropped)
+
+    def summarize(self, turns):
+        """Resumen extractivo: la primera frase de cada mensaje descartado"""
+        lines = []
+        for turn in turns:
+            first = re.split(r"(?<=[.!?])\s", turn.text.strip(), maxsplit=1)[0]
+            if len(first) > 120:
+                first = first[:117] + "..."
+            speaker = "User" if turn.role == "user" else "Tutor"
+            lines.append(f"- {speaker}: {first}")
+
+        summary = "\n".join(filter(None, [self.summary] + lines))
+        # Mantener el resumen acotado quedándose con lo más reciente
+        while len(summary) > self.summary_chars and "\n" in summary:
+            summary = summary.split("\n", 1)[1]
+        self.summary = summary[-self.summary_chars:]
+        self._update_system()
+
+        # El resumen tampoco puede comerse el presupuesto del historial
+        max_tokens = len(self._encode(chatml_segment("system", self.system_prompt))) + self.prompt_budget // 4
+        while len(self.system_tokens) > max_tokens and self.summary:
+            self.summary = self.summary.split("\n", 1)[1] if "\n" in self.summary else ""
+            self._update_system()
+
+    def messages(self):
+        """Historial como lista de mensajes estilo OpenAI"""
+        return [{"role": "system", "content": self.system_content()}] + [
+            {"role": turn.role, "content": turn.text} for turn in self.turns]
+
+    def load(self, messages):
+        """Reconstruye el historial a partir de mensajes guardados [(rol, texto), ...].
+
+        Solo se tokenizan los más recientes que caben en el presupuesto; los
+        anteriores entran en el resumen, como si se hubieran recortado.
+        """
+        self.clear()
+        target = int(self.prompt_budget * self.trim_ratio)
+        used = self.token_count()
+        kept = []
+        for role, text in reversed(messages):
+            turn = Turn(role, text, self._encode(chatml_segment(role, text)))
+            if kept and used + len(turn.tokens) > target:
+                break
+            kept.append(turn)
+            used += len(turn.tokens)
+        kept.reverse()
+        # No empezar el historial con una respuesta huérfana
+        if len(kept) > 1 and kept[0].role == "assistant":
+            kept.pop(0)
+        older = messages[:len(messages) - len(kept)]
+        if older:
+            # El resumen se queda con lo más reciente: basta con la cola
+            self.summarize([Turn(role, text, None) for role, text in older[-40:]])
+        self.turns.extend(kept)
+        self.enforce_budget()
+        return len(kept)
+
+    def clear(self):
+        """Olvida el historial y el resumen"""
+        self.turns.clear()
+        self.summary = ""
+        self._update_system()
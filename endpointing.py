@@ -0,0 +1,105 @@
+"""Fin de frase adaptativo: cuánto silencio esperar según cómo habla el alumno y qué lleva dicho"""
+import re
+
+import numpy as np
+
+# Palabras con las que una frase casi nunca termina (el alumno está pensando la continuación)
+CONTINUATION_WORDS = {
+    "a", "an", "the", "and", "but", "or", "so", "because", "if", "when", "that", "which", "who",
+    "to", "of", "in", "on", "at", "with", "for", "from", "about", "my", "your", "his", "her", "our",
+    "their", "is", "are", "was", "were", "am", "be", "have", "has", "i", "we", "you", "they",
+    "um", "uh", "er", "erm", "hmm", "like", "then", "very", "really",
+}
+
+WORD_RE = re.compile(r"[A-Za-z']+")
+
+
+def text_cue(text):
+    """"complete", "incomplete" o None según cómo termina la transcripción provisional"""
+    text = (text or "").strip()
+    if not text:
+        return None
+    if text[-1] in ",-…" or text.endswith("..."):
+        return "incomplete"
+    words = WORD_RE.findall(text)
+    if words and words[-1].lower() in CONTINUATION_WORDS:
+        return "incomplete"
+    if text[-1] in ".?!":
+        return "complete"
+    return None
+
+
+class AdaptiveEndpointer:
+    """Silencio necesario para cerrar la frase en curso.
+
+    Parte del máximo configurado y lo acorta cuando:
+    - las pausas internas del alumno en esta frase son cortas (se espera
+      algo más que su pausa típica, no un valor fijo para todos);
+    - la transcripción provisional parece una frase terminada.
+    Si termina en "and", "the", "um"... se espera el máximo. Las pausas se
+    miden por frames del VAD, sin bucles en Python.
+    """
+
+    def __init__(self, max_silence=2.0, min_silence=0.5, pause_factor=1.6, pause_margin=0.15,
+                 complete_factor=0.6, min_pause=0.12, short_utterance=0.8):
+        self.max_silence = max_silence
+        self.min_silence = min_silence
+        self.pause_factor = pause_factor
+        self.pause_margin = pause_margin
+        self.complete_factor = complete_factor
+        self.min_pause = min_pause
+        self.short_utterance = short_utterance
+        self.reset()
+
+    def reset(self):
+        self.pauses = []
+        self.speech_seconds = 0.0
+        self.gap = 0.0            # Silencio acumulado desde el último frame con voz
+        self.speech_seen = False
+
+    def observe(self, voiced, frame_seconds):
+        """Registra las decisiones por frame (ya sin eco) de un bloque de la frase"""
+        voiced = np.asarray(voiced, dtype=bool)
+        if voiced.size == 0:
+            return
+        index = np.flatnonzero(voiced)
+        if index.size == 0:
+            self.gap += voiced.size * frame_seconds
+            return
+        self.speech_seconds += index.size * frame_seconds
+        gaps = (np.diff(index) - 1) * frame_seconds
+        if self.speech_seen:
+            # La pausa que venía del bloque anterior termina en el primer frame con voz
+            gaps = np.concatenate(([self.gap + index[0] * frame_seconds], gaps))
+        self.pauses.extend(gaps[gaps >= self.min_pause].tolist())
+        self.gap = (voiced.size - 1 - index[-1]) * frame_seconds
+        self.speech_seen = True
+
+    def words_per_second(self, text):
+        if not text or self.speech_seconds <= 0:
+            return None
+        return len(WORD_RE.findall(text)) / self.speech_seconds
+
+    def threshold(self, text=None, max_silence=None):
+        """Silencio (s) que cierra la frase ahora"""
+        ceiling = self.max_silence if max_silence is None else max_silence
+        floor = min(self.min_silence, ceiling)
+        silence = ceiling
+        if len(self.pauses) >= 2:
+            # Algo más que las pausas más largas que ya hizo el alumno sin terminar
+            typical = float(np.percentile(self.pauses, 90))
+            silence = min(silence, typical * self.pause_factor + self.pause_margin)
+
+        cue = text_cue(text)
+        if cue == "incomplete":
+            return ceiling
+        if cue == "complete":
+            silence *= self.complete_factor
+        elif self.speech_seconds < self.short_utterance and text:
+            # Respuestas cortas ("yes", "okay") rara vez continúan
+            silence *= self.complete_factor
+        rate = self.words_per_second(text)
+        if rate is not None and rate < 1.5:
+            # Habla lenta (nivel inicial): más margen para pensar
+            silence = min(ceiling, silence * 1.3)
+        return max(floor, min(ceiling, silence))
@@ -0,0 +1,142 @@
+"""Métricas de fluidez y entonación de una frase, calculadas del audio capturado.
+
+Todo se hace en una sola pasada vectorizada sobre la matriz de frames
+(vista sin copia del audio): energía, pausas, núcleos silábicos y tono
+por autocorrelación con FFT. Una frase de varios segundos se analiza en
+pocos milisegundos, así que cabe en el camino en vivo.
+"""
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from endpointing import WORD_RE
+
+
+def frame_matrix(samples, frame_length, hop):
+    """Frames solapados (n_frames, frame_length) como vista del audio, sin copiar"""
+    if samples.size < frame_length:
+        samples = np.pad(samples, (0, frame_length - samples.size))
+    return sliding_window_view(samples, frame_length)[::hop]
+
+
+def estimate_pitch(frames, rate, fmin=70.0, fmax=400.0, min_clarity=0.45):
+    """Tono (Hz) por frame mediante autocorrelación normalizada; NaN donde no hay voz sonora"""
+    n = frames.shape[1]
+    centered = frames - frames.mean(axis=1, keepdims=True)
+    windowed = centered * np.hanning(n)
+    # Autocorrelación de todos los frames a la vez: |FFT|² → IFFT (con relleno para que no sea circular)
+    spectrum = np.fft.rfft(windowed, 2 * n, axis=1)
+    autocorr = np.fft.irfft(spectrum * np.conj(spectrum), axis=1)[:, :n]
+    energy = autocorr[:, 0]
+    min_lag = max(1, int(rate / fmax))
+    max_lag = min(n - 1, int(rate / fmin))
+    lags = autocorr[:, min_lag:max_lag + 1]
+    best = np.argmax(lags, axis=1)
+    clarity = lags[np.arange(len(lags)), best] / np.maximum(energy, 1e-12)
+    pitch = rate / (best + min_lag)
+    return np.where((clarity >= min_clarity) & (energy > 0), pitch, np.nan)
+
+
+def runs(mask):
+    """(inicios, finales) de los tramos True de un array bool"""
+    padded = np.concatenate(([False], mask, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return edges[0::2], edges[1::2]
+
+
+def analyze_utterance(samples, rate, text=None, frame_seconds=0.032, hop_seconds=0.01,
+                      min_pause=0.25, speech_margin_db=12.0):
+    """Métricas de una frase (audio int16 o float mono) en un dict; None si no hay voz"""
+    x = np.asarray(samples)
+    x = x.astype(np.float32) / 32768.0 if x.dtype == np.int16 else x.astype(np.float32)
+    frame_length, hop = int(frame_seconds * rate), int(hop_seconds * rate)
+    frames = frame_matrix(x, frame_length, hop)
+    if len(frames) < 3:
+        return None
+
+    energy_db = 10.0 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+    floor, peak = np.percentile(energy_db, [10, 99])
+    speech = energy_db > max(floor + speech_margin_db, peak - 40.0)
+    speech_index = np.flatnonzero(speech)
+    if speech_index.size < 3:
+        return None
+
+    # Pausas: tramos sin voz entre el primer y el último frame con voz
+    first, last = speech_index[0], speech_index[-1]
+    inner = speech[first:last + 1]
+    starts, ends = runs(~inner)
+    pauses = (ends - starts) * hop_seconds
+    pauses = pauses[pauses >= min_pause]
+    span = (last - first + 1) * hop_seconds
+    speech_seconds = speech_index.size * hop_seconds
+    phonation = span - pauses.sum()
+
+    # Núcleos silábicos: máximos locales de la energía suavizada, separados y sobre el umbral
+    smooth = np.convolve(energy_db, np.ones(5) / 5, mode="same")
+    local_max = (smooth[1:-1] > smooth[:-2]) & (smooth[1:-1] >= smooth[2:]) & speech[1:-1]
+    peaks = np.flatnonzero(local_max) + 1
+    prominent = peaks[smooth[peaks] > np.median(smooth[speech]) - 3.0]
+    if prominent.size > 1:
+        # Dos picos a menos de 100 ms son la misma sílaba
+        prominent = prominent[np.concatenate(([True], np.diff(prominent) * hop_seconds >= 0.1))]
+    syllables = int(prominent.size)
+
+    pitch = estimate_pitch(frames[speech], rate)
+    voiced_pitch = pitch[~np.isnan(pitch)]
+    features = {
+        "duration": round(float(span), 2),
+        "speech_seconds": round(speech_seconds, 2),
+        "pauses": int(pauses.size),
+        "longest_pause": round(float(pauses.max()), 2) if pauses.size else 0.0,
+        "mean_pause": round(float(pauses.mean()), 2) if pauses.size else 0.0,
+        "pause_ratio": round(float(pauses.sum() / span), 2) if span > 0 else 0.0,
+        "articulation_rate": round(float(syllables / phonation), 2) if phonation > 0 else None,
+        "energy_std_db": round(float(np.std(energy_db[speech])), 1),
+        "words": None,
+        "words_per_minute": None,
+        "pitch_median_hz": None,
+        "pitch_range_st": None,
+        "pitch_std_st": None,
+        "final_contour": None,
+    }
+    if text:
+        words = len(WORD_RE.findall(text))
+        features["words"] = words
+        features["words_per_minute"] = round(float(words / span * 60.0)) if span > 0 else None
+
+    if voiced_pitch.size >= 5:
+        median = float(np.median(voiced_pitch))
+        semitones = 12.0 * np.log2(voiced_pitch / median)
+        p10, p90 = np.percentile(semitones, [10, 90])
+        features.update(pitch_median_hz=round(median), pitch_range_st=round(float(p90 - p10), 1),
+                        pitch_std_st=round(float(np.std(semitones)), 1))
+        # Entonación final: pendiente del tono en el último medio segundo con voz sonora
+        speech_times = speech_index * hop_seconds
+        times = speech_times[~np.isnan(pitch)]
+        tail = times >= times[-1] - 0.5
+        if np.count_nonzero(tail) >= 5:
+            slope = np.polyfit(times[tail], semitones[tail], 1)[0]
+            features["final_contour"] = "rising" if slope > 4.0 else "falling" if slope < -4.0 else "flat"
+    return features
+
+
+def describe(features):
+    """Resumen compacto en inglés para el prompt del tutor"""
+    if not features:
+        return ""
+    parts = []
+    if features["words_per_minute"] is not None:
+        parts.append(f"{features['words_per_minute']} words/min")
+    if features["articulation_rate"] is not None:
+        parts.append(f"{features['articulation_rate']:.1f} syllables/s while speaking")
+    if features["pauses"]:
+        parts.append(f"{features['pauses']} pauses (longest {features['longest_pause']:.1f}s, "
+                     f"{features['pause_ratio']:.0%} of the time)")
+    else:
+        parts.append("no long pauses")
+    if features["pitch_range_st"] is not None:
+        tone = "monotone" if features["pitch_range_st"] < 3.0 else "varied"
+        parts.append(f"pitch range {features['pitch_range_st']:.0f} semitones ({tone})")
+    if features["final_contour"]:
+        parts.append(f"{features['final_contour']} intonation at the end")
+    parts.append(f"loudness variation {features['energy_std_db']:.0f} dB")
+    return "Audio analysis: " + ", ".join(parts) + "."
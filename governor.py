@@ -0,0 +1,222 @@
+"""Gobernador de memoria: descarga el modelo cuando no se usa y lo recarga al volver a necesitarlo.
+
+En los equipos compartidos la aplicación puede quedarse abierta horas sin
+que nadie hable con el tutor, con el modelo (varios GB) ocupando la RAM.
+El gobernador vigila el tiempo sin actividad y la memoria (RSS propia y
+RAM libre del sistema) y, si hace falta, suelta el modelo y la caché de
+audio en memoria. La conversación se conserva: el siguiente turno recarga
+el modelo (los pesos están mapeados y suelen seguir en la caché de disco
+del sistema) antes de generar, sin que la interfaz tenga que enterarse.
+
+Todo lo que toca el modelo se hace en el hilo de inferencia, como
+trabajos de control del planificador; el hilo del gobernador solo decide.
+"""
+import ctypes
+import gc
+import threading
+import time
+
+from scheduler import InferenceJob, PRIORITY_CONTROL
+import model_registry
+
+MB = 1024 * 1024
+
+
+def trim_heap():
+    """Devuelve al sistema la memoria libre del heap (glibc); en otros sistemas no hace nada"""
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+class ModelGovernor:
+    """Descarga y recarga el modelo de un TutorPipeline según el uso y la memoria.
+
+    loader() debe devolver un LoadedModel nuevo (p. ej. el de
+    model_registry.load_model para el mismo ModelSpec). Con pinned el
+    modelo no se descarga nunca. Los modelos remotos se ignoran.
+    """
+
+    def __init__(self, pipeline, loader, loaded=None, idle_seconds=900.0, min_available_mb=1024,
+                 max_rss_mb=None, pressure_grace=60.0, check_interval=15.0, pinned=False):
+        self.pipeline = pipeline
+        self.loader = loader
+        self.loaded = loaded
+        self.idle_seconds = idle_seconds        # Sin actividad durante esto → descargar (0/None = nunca)
+        self.min_available_mb = min_available_mb  # RAM libre del sistema por debajo de esto → descargar
+        self.max_rss_mb = max_rss_mb            # RSS propio (más el del proceso del modelo) por encima → descargar
+        self.pressure_grace = pressure_grace    # Inactividad mínima antes de descargar por memoria
+        self.check_interval = check_interval
+        self.pinned = pinned
+        self.last_activity = time.monotonic()
+        self.reload_pending = False
+        self.unload_pending = False
+        self.unloads = 0
+        self.reloads = 0
+        self.last_reload_seconds = None
+        self.last_reclaimed = None
+        self.running = False
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.on_state = None    # (estado, detalle) "unloaded", "loading" o "loaded"; desde hilos de trabajo
+        pipeline.governor = self
+
+    @property
+    def active(self):
+        """El gobernador solo actúa sobre modelos locales"""
+        return self.loaded is None or not self.loaded.spec.remote
+
+    @property
+    def unloaded(self):
+        return self.loaded is None
+
+    def start(self):
+        if self.running:
+            return self
+        self.running = True
+        self.thread = threading.Thread(target=self._monitor, name="memory-governor", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+
+    # --- Actividad ---
+
+    def touch(self, prefetch=False):
+        """Hubo actividad; con prefetch y el modelo descargado, empieza ya la recarga"""
+        self.last_activity = time.monotonic()
+        if prefetch and self.unloaded and not self.reload_pending:
+            # Como trabajo de control: se adelanta al turno que lo va a necesitar
+            self.reload_pending = True
+            self.pipeline.scheduler.submit(InferenceJob(lambda job: self.ensure_loaded(),
+                                                        priority=PRIORITY_CONTROL, kind="reload"))
+
+    def set_pinned(self, pinned):
+        """Modo fijo: no se descarga; si ya estaba descargado se recarga enseguida"""
+        self.pinned = pinned
+        print(f"📌 Modelo fijo en memoria: {'sí' if pinned else 'no'}")
+        if pinned:
+            self.touch(prefetch=True)
+
+    # --- Decisión (hilo del gobernador) ---
+
+    def memory_usage(self):
+        """RSS de este proceso más el del proceso del modelo si está aislado"""
+        rss = model_registry.process_memory()
+        process = getattr(self.loaded.model, "process", None) if self.loaded is not None else None
+        if rss is not None and process is not None and process.pid is not None:
+            rss += model_registry.process_memory(process.pid) or 0
+        return rss
+
+    def busy(self):
+        pipeline = self.pipeline
+        return (pipeline.scheduler.busy or pipeline.scheduler.depth or pipeline.utterance_started
+                or pipeline.audio_output.busy)
+
+    def unload_reason(self):
+        """Motivo para descargar ahora, o None"""
+        if self.pinned or self.unloaded or not self.active or self.busy():
+            return None
+        idle = time.monotonic() - self.last_activity
+        if self.idle_seconds and idle >= self.idle_seconds:
+            return f"{idle / 60:.0f} min sin uso" if idle >= 120 else f"{idle:.0f}s sin uso"
+        if idle < self.pressure_grace:
+            return None
+        available = model_registry.available_memory()
+        if self.min_available_mb and available is not None and available < self.min_available_mb * MB:
+            return f"poca RAM libre ({available // MB} MB)"
+        if self.max_rss_mb:
+            rss = self.memory_usage()
+            if rss is not None and rss > self.max_rss_mb * MB:
+                return f"RSS {rss // MB} MB > {self.max_rss_mb} MB"
+        return None
+
+    def check(self):
+        reason = self.unload_reason()
+        if reason is not None and not self.unload_pending:
+            self.request_unload(reason)
+
+    def _monitor(self):
+        while self.running:
+            self.wakeup.wait(self.check_interval)
+            self.wakeup.clear()
+            if self.running:
+                self.check()
+
+    # --- Descarga y recarga (hilo de inferencia) ---
+
+    def request_unload(self, reason):
+        """Encola la descarga; se anula si entretanto hubo actividad"""
+        requested = time.monotonic()
+        self.unload_pending = True
+
+        def unload(job):
+            self.unload_pending = False
+            if (self.last_activity > requested or self.pinned or self.unloaded
+                    or self.pipeline.scheduler.depth or self.pipeline.utterance_started):
+                return
+            self.unload(reason)
+
+        self.pipeline.scheduler.submit(InferenceJob(unload, priority=PRIORITY_CONTROL, kind="unload"))
+
+    def unload(self, reason=""):
+        """Suelta el modelo y los buffers de audio en memoria (en el hilo de inferencia)"""
+        before = self.memory_usage()
+        model = self.pipeline.release_model()
+        self.loaded = None
+        close = getattr(model, "close", None)
+        if close is not None:
+            # Modelo aislado: termina el proceso hijo
+            close()
+        del model, close
+        audio = self.pipeline.tts_cache.clear_memory() if self.pipeline.tts_cache is not None else 0
+        gc.collect()
+        trim_heap()
+        after = self.memory_usage()
+        self.last_reclaimed = before - after if before is not None and after is not None else None
+        self.unloads += 1
+        freed = f"{self.last_reclaimed / MB:.0f} MB liberados" if self.last_reclaimed is not None else "memoria liberada"
+        print(f"💤 Modelo descargado ({reason}): {freed}, {audio // 1024} KB de audio en caché")
+        if self.on_state:
+            self.on_state("unloaded", reason)
+
+    def ensure_loaded(self):
+        """Recarga el modelo si está descargado (en el hilo de inferencia); devuelve el LoadedModel"""
+        self.reload_pending = False
+        if self.loaded is not None:
+            return self.loaded
+        if self.on_state:
+            self.on_state("loading", "")
+        started = time.perf_counter()
+        before = self.memory_usage()
+        loaded = self.loader()
+        self.pipeline.restore_model(loaded.model)
+        if loaded.spec.warmup:
+            # Deja el prompt de sistema evaluado: el turno solo paga la conversación
+            self.pipeline.warm_up(loaded)
+        self.loaded = loaded
+        self.reloads += 1
+        self.last_reload_seconds = time.perf_counter() - started
+        after = self.memory_usage()
+        grown = f" · +{(after - before) / MB:.0f} MB" if before is not None and after is not None else ""
+        self.pipeline.tracer.record("model_reload", self.last_reload_seconds, load=loaded.load_time,
+                                    warm_up=loaded.warmup_time)
+        print(f"⏰ Modelo recargado en {self.last_reload_seconds:.1f}s "
+              f"(carga {loaded.load_time:.1f}s{grown})")
+        if self.on_state:
+            self.on_state("loaded", loaded.summary())
+        return loaded
+
+    def summary(self):
+        if not self.active:
+            return "modelo remoto (sin descargas)"
+        state = "descargado" if self.unloaded else "fijo" if self.pinned else "cargado"
+        text = f"{state} · {self.unloads} descargas · {self.reloads} recargas"
+        if self.last_reload_seconds is not None:
+            text += f" · última recarga {self.last_reload_seconds:.1f}s"
+        if self.last_reclaimed is not None:
+            text += f" · {self.last_reclaimed / MB:.0f} MB liberados"
+        return text
@@ -0,0 +1,245 @@
+"""Historial persistente de sesiones en SQLite con búsqueda de texto completo (FTS5).
+
+Las escrituras van a una cola y un hilo las agrupa en transacciones, así
+ni el hilo de Tk ni el de inferencia esperan al disco.
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+import wave
+
+DEFAULT_HISTORY_PATH = os.path.join(os.path.expanduser("~"), ".cache", "chat_local", "history.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    started REAL NOT NULL,
+    updated REAL NOT NULL,
+    model TEXT,
+    title TEXT
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL REFERENCES sessions(id),
+    role TEXT NOT NULL,
+    sender TEXT,
+    text TEXT NOT NULL,
+    prompt_text TEXT,
+    created REAL NOT NULL,
+    turn_id INTEGER,
+    kind TEXT,
+    status TEXT,
+    ttft REAL,
+    ttfa REAL,
+    end_to_end REAL,
+    tokens_per_second REAL,
+    prompt_tokens INTEGER,
+    generated_tokens INTEGER,
+    audio_path TEXT
+);
+CREATE INDEX IF NOT EXISTS messages_session ON messages(session_id, id);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(text, content='messages', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts(rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts(messages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+"""
+
+MESSAGE_COLUMNS = ["session_id", "role", "sender", "text", "prompt_text", "created", "turn_id", "kind",
+                   "status", "ttft", "ttfa", "end_to_end", "tokens_per_second", "prompt_tokens",
+                   "generated_tokens", "audio_path"]
+
+
+class HistoryStore:
+    """Sesiones y mensajes en SQLite.
+
+    Las escrituras (add_message, save_audio, ...) se encolan y el hilo
+    escritor las aplica por lotes: espera hasta batch_delay segundos a que
+    se junten varias y las confirma en una sola transacción; el audio se
+    escribe después, cada archivo por su cuenta, para que un WAV que no
+    se pudo guardar no se lleve los mensajes. Las lecturas (search,
+    load_session) comparten una conexión propia protegida con un lock,
+    desde cualquier hilo; con WAL no esperan al escritor.
+    """
+
+    def __init__(self, path=DEFAULT_HISTORY_PATH, batch_delay=0.5, batch_size=200):
+        self.path = path
+        self.batch_delay = batch_delay
+        self.batch_size = batch_size
+        self.queue = queue.Queue()
+        self.reader = None
+        self.read_lock = threading.Lock()
+        self.fts = True
+        self.ready = threading.Event()
+        self.written = 0
+        self.thread = threading.Thread(target=self._writer, name="history-writer", daemon=True)
+        self.thread.start()
+
+    # --- Conexiones ---
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _read(self, sql, params=()):
+        """Ejecuta una consulta en la conexión de lectura y devuelve todas las filas"""
+        self.ready.wait()
+        with self.read_lock:
+            if self.reader is None:
+                # Las búsquedas llegan desde hilos distintos: una sola conexión para todos
+                self.reader = self._connect()
+                self.reader.row_factory = sqlite3.Row
+            return self.reader.execute(sql, params).fetchall()
+
+    # --- Escritura en segundo plano ---
+
+    def _writer(self):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = self._connect()
+            connection.executescript(SCHEMA)
+            try:
+                connection.executescript(FTS_SCHEMA)
+            except sqlite3.OperationalError:
+                # SQLite sin FTS5: la búsqueda usa LIKE
+                self.fts = False
+                print("⚠️ SQLite sin FTS5: búsqueda del historial sin índice")
+            connection.commit()
+        except (OSError, sqlite3.Error) as e:
+            print(f"⚠️ Historial desactivado: {e}")
+            connection = None
+        finally:
+            self.ready.set()
+
+        while True:
+            item = self.queue.get()
+            batch = [item]
+            deadline = time.monotonic() + self.batch_delay
+            # Juntar lo que llegue mientras tanto (o hasta una señal de flush/cierre)
+            while item is not None and not isinstance(item, threading.Event) and len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                batch.append(item)
+
+            operations = [op for op in batch if op is not None and not isinstance(op, threading.Event)]
+            if connection is not None and operations:
+                self._apply(connection, operations)
+            for op in batch:
+                if isinstance(op, threading.Event):
+                    op.set()
+            if None in batch:
+                if connection is not None:
+                    connection.close()
+                return
+
+    def _apply(self, connection, operations):
+        statements = [args for kind, args in operations if kind == "sql"]
+        if statements:
+            try:
+                with connection:
+                    for args in statements:
+                        connection.execute(*args)
+                self.written += len(statements)
+            except sqlite3.Error as e:
+                print(f"⚠️ No se pudo guardar el historial: {e}")
+        # Tras confirmar los mensajes: si falla un WAV solo se pierde esa grabación
+        for kind, args in operations:
+            if kind != "audio":
+                continue
+            try:
+                self._write_wav(*args)
+                self.written += 1
+            except (OSError, wave.Error) as e:
+                print(f"⚠️ No se pudo guardar el audio {args[0]}: {e}")
+
+    @staticmethod
+    def _write_wav(path, samples, rate):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with wave.open(path, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(rate)
+            wav.writeframes(samples.tobytes())
+
+    def _execute(self, sql, params=()):
+        self.queue.put(("sql", (sql, params)))
+
+    def start_session(self, model=None, title=None):
+        """Crea una sesión y devuelve su id (sin esperar al disco)"""
+        session_id = uuid.uuid4().hex
+        now = time.time()
+        self._execute("INSERT INTO sessions (id, started, updated, model, title) VALUES (?, ?, ?, ?, ?)",
+                      (session_id, now, now, model, title))
+        return session_id
+
+    def add_message(self, session_id, role, text, sender=None, created=None, **fields):
+        """Encola un mensaje; fields admite prompt_text, métricas y audio_path"""
+        row = dict(fields, session_id=session_id, role=role, sender=sender, text=text,
+                   created=created or time.time())
+        columns = [c for c in MESSAGE_COLUMNS if c in row]
+        self._execute(f"INSERT INTO messages ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                      tuple(row[c] for c in columns))
+        self._execute("UPDATE sessions SET updated = ? WHERE id = ?", (row["created"], session_id))
+
+    def save_audio(self, path, samples, rate):
+        """Guarda audio int16 mono como WAV desde el hilo escritor"""
+        self.queue.put(("audio", (path, samples, rate)))
+
+    def flush(self, timeout=None):
+        """Espera a que todo lo encolado esté en disco"""
+        done = threading.Event()
+        self.queue.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join(timeout=5)
+        with self.read_lock:
+            if self.reader is not None:
+                self.reader.close()
+                self.reader = None
+
+    # --- Lectura ---
+
+    def search(self, text, limit=50):
+        """Mensajes que contienen las palabras buscadas, los más recientes primero"""
+        words = [w.replace('"', "") for w in text.split() if w.replace('"', "")]
+        if not words:
+            return []
+        if self.fts:
+            # Cada palabra como prefijo entre comillas: sin sintaxis FTS del usuario
+            query = " ".join(f'"{w}"*' for w in words)
+            sql = ("SELECT m.*, snippet(messages_fts, 0, '[', ']', '…', 12) AS snippet "
+                   "FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid "
+                   "WHERE messages_fts MATCH ? ORDER BY m.created DESC LIMIT ?")
+            return self._read(sql, (query, limit))
+        conditions = " AND ".join("text LIKE ?" for _ in words)
+        sql = f"SELECT *, text AS snippet FROM messages WHERE {conditions} ORDER BY created DESC LIMIT ?"
+        return self._read(sql, [f"%{w}%" for w in words] + [limit])
+
+    def recent_sessions(self, limit=20):
+        """Sesiones más recientes con su número de mensajes y el primero del usuario"""
+        sql = ("SELECT s.*, COUNT(m.id) AS messages, "
+               "(SELECT text FROM messages WHERE session_id = s.id AND role = 'user' ORDER BY id LIMIT 1) AS first "
+               "FROM sessions s LEFT JOIN messages m ON m.session_id = s.id "
+               "GROUP BY s.id ORDER BY s.updated DESC LIMIT ?")
+        return self._read(sql, (limit,))
+
+    def load_session(self, session_id):
+        """Mensajes de una sesión en orden"""
+        return self._read("SELECT * FROM messages WHERE session_id = ? ORDER BY id", (session_id,))
@@ -0,0 +1,72 @@
+"""Historial de mensajes del chat en memoria, con acceso indexado"""
+import itertools
+import time
+
+# Remitentes de la interfaz → rol del mensaje
+SENDER_ROLES = {"IA": "assistant", "Tú": "user", "Tú (Voz)": "user", "Sistema": "system"}
+
+
+class Message:
+    """Un mensaje mostrado en el chat"""
+
+    def __init__(self, id, sender, text, role):
+        self.id = id
+        self.sender = sender
+        self.text = text
+        self.role = role
+        self.timestamp = time.time()
+
+    def render(self):
+        return f"{self.sender}: {self.text}\n\n"
+
+
+class MessageStore:
+    """Lista de mensajes de la sesión.
+
+    Guarda la posición del último mensaje de cada rol, así "última
+    respuesta de la IA" es O(1) aunque la sesión dure horas. Se usa solo
+    desde el hilo de Tk.
+    """
+
+    def __init__(self):
+        self.messages = []
+        self.positions = {}         # id -> índice en messages
+        self.last_by_role = {}      # rol -> índice del último mensaje de ese rol
+        self.ids = itertools.count(1)
+
+    def __len__(self):
+        return len(self.messages)
+
+    def __getitem__(self, index):
+        return self.messages[index]
+
+    def append(self, sender, text, role=None):
+        """Añade un mensaje y lo devuelve"""
+        message = Message(next(self.ids), sender, text, role or SENDER_ROLES.get(sender, "system"))
+        self.positions[message.id] = len(self.messages)
+        self.last_by_role[message.role] = len(self.messages)
+        self.messages.append(message)
+        return message
+
+    def clear(self):
+        """Vacía el historial (p. ej. al reanudar otra sesión); los ids siguen creciendo"""
+        self.messages = []
+        self.positions = {}
+        self.last_by_role = {}
+
+    def index_of(self, message_id):
+        return self.positions.get(message_id)
+
+    def update(self, message_id, text):
+        """Cambia el texto de un mensaje (p. ej. al terminar una respuesta en streaming)"""
+        message = self.messages[self.positions[message_id]]
+        message.text = text
+        return message
+
+    def last(self, role):
+        """Último mensaje con ese rol, o None"""
+        index = self.last_by_role.get(role)
+        return None if index is None else self.messages[index]
+
+    def range(self, start, end):
+        return self.messages[max(0, start):end]
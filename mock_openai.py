@@ -0,0 +1,123 @@
+"""Servidor falso compatible con la API de OpenAI para pruebas y benchmarks.
+
+Imita /v1/models y /v1/chat/completions en streaming (SSE) sin modelo
+ni red, para ejercitar OpenAIChatClient: keep-alive, reintentos y
+cancelación.
+"""
+import json
+import socket
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockChatServer:
+    """Servidor local que imita /v1/models y /v1/chat/completions en streaming.
+
+    Responde frases fijas (elegidas por el último mensaje) palabra a
+    palabra, con keep-alive. fail_next hace que las próximas peticiones
+    devuelvan 503, para probar los reintentos.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, seconds_per_token=0.01, first_token_delay=0.05,
+                 replies=None, model="mock-tutor"):
+        from model_registry import STUB_REPLIES
+        self.replies = replies or STUB_REPLIES
+        self.seconds_per_token = seconds_per_token
+        self.first_token_delay = first_token_delay
+        self.model = model
+        self.fail_next = 0
+        self.requests = 0
+        self.connections = 0
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="mock-openai", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reply_for(self, messages):
+        last = messages[-1]["content"] if messages else ""
+        return self.replies[zlib.crc32(last.encode("utf-8")) % len(self.replies)]
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                mock.connections += 1
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, data):
+                body = json.dumps(data).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _chunk(self, data):
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def do_GET(self):
+                if self.path.rstrip("/") == "/v1/models":
+                    self._send(200, {"object": "list", "data": [{"id": mock.model, "object": "model"}]})
+                else:
+                    self._send(404, {"error": {"message": "not found"}})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                request = json.loads(self.rfile.read(length) or b"{}")
+                mock.requests += 1
+                if mock.fail_next > 0:
+                    mock.fail_next -= 1
+                    self._send(503, {"error": {"message": "model busy"}})
+                    return
+                if self.path.rstrip("/") != "/v1/chat/completions":
+                    self._send(404, {"error": {"message": "not found"}})
+                    return
+                messages = request.get("messages", [])
+                words = mock.reply_for(messages).split(" ")
+                words = words[:request.get("max_tokens") or len(words)]
+                prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4 + 1
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    time.sleep(mock.first_token_delay)
+                    for i, word in enumerate(words):
+                        delta = {"content": word if i == 0 else " " + word}
+                        chunk = {"object": "chat.completion.chunk", "model": mock.model,
+                                 "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+                        self._chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                        time.sleep(mock.seconds_per_token)
+                    final = {"object": "chat.completion.chunk", "model": mock.model,
+                             "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                             "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(words)}}
+                    self._chunk(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+                    self._chunk(b"")
+                except (BrokenPipeError, ConnectionResetError, socket.timeout):
+                    # El cliente canceló la generación
+                    self.close_connection = True
+
+        return Handler
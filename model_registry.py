@@ -0,0 +1,377 @@
+"""Registro de modelos GGUF: variantes por cuantización, ajuste al hardware y calentamiento"""
+import json
+import ntpath
+import os
+import time
+import zlib
+
+DEFAULT_REGISTRY_PATH = os.environ.get(
+    "CHAT_LOCAL_MODELS", os.path.join(os.path.dirname(os.path.abspath(__file__)), "models.json"))
+
+# Si no hay archivo de configuración se usa el modelo de siempre
+DEFAULT_REGISTRY = {
+    "default": "openhermes-2.5-mistral-7b",
+    "models": {
+        "openhermes-2.5-mistral-7b": {
+            "model_type": "mistral",
+            "context_length": 2048,
+            "max_new_tokens": 200,
+            "variants": [
+                {"quantization": "Q8_0",
+                 "path": r"G:\.ollama\models\TheBloke\OpenHermes-2.5-Mistral-7B-GGUF\openhermes-2.5-mistral-7b.Q8_0.gguf"},
+            ],
+        },
+    },
+}
+
+
+class ModelVariant:
+    """Un archivo GGUF concreto (una cuantización) de un modelo"""
+
+    def __init__(self, path, quantization="", ram_overhead_mb=None):
+        self.path = path
+        self.quantization = quantization
+        self.ram_overhead_mb = ram_overhead_mb
+
+    @property
+    def exists(self):
+        return os.path.isfile(self.path)
+
+    @property
+    def file_size(self):
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+
+class ModelSpec:
+    """Un modelo del registro con sus ajustes de carga y sus variantes.
+
+    Las variantes van de mayor a menor calidad; se usa la primera que
+    quepa en la RAM disponible.
+    """
+
+    def __init__(self, name, variants, model_type="llama", context_length=2048, max_new_tokens=200,
+                 gpu_layers=0, threads="auto", batch_size="auto", mmap=True, mlock=False,
+                 ram_overhead_mb=512, warmup=True, backend="ctransformers", base_url=None,
+                 remote_model=None, api_key_env=None, timeout=60.0, retries=2, isolate=False,
+                 idle_unload=900, pinned=False):
+        self.name = name
+        self.variants = variants
+        self.model_type = model_type
+        self.context_length = context_length
+        self.max_new_tokens = max_new_tokens
+        self.gpu_layers = gpu_layers
+        self.threads = threads
+        self.batch_size = batch_size
+        self.mmap = mmap
+        self.mlock = mlock
+        self.ram_overhead_mb = ram_overhead_mb
+        self.warmup = warmup
+        # backend "openai": servidor compatible con OpenAI (LM Studio) en base_url, sin archivos locales
+        self.backend = backend
+        self.base_url = base_url
+        self.remote_model = remote_model
+        self.api_key_env = api_key_env
+        self.timeout = timeout
+        self.retries = retries
+        # isolate: el modelo se carga y ejecuta en un proceso aparte (ver model_worker.py)
+        self.isolate = isolate
+        # idle_unload: segundos sin uso tras los que se descarga el modelo (0 = nunca);
+        # pinned: siempre en memoria, para cuando la latencia importa más que la RAM (ver governor.py)
+        self.idle_unload = idle_unload
+        self.pinned = pinned
+
+    @property
+    def remote(self):
+        return self.backend == "openai"
+
+    @classmethod
+    def from_dict(cls, name, data, base_dir="."):
+        data = dict(data)
+        variants = []
+        for variant in data.pop("variants", []):
+            path = os.path.expanduser(variant["path"])
+            # Rutas relativas al archivo de configuración (admite rutas absolutas de Windows)
+            if not os.path.isabs(path) and not ntpath.isabs(path):
+                path = os.path.join(base_dir, path)
+            variants.append(ModelVariant(path, variant.get("quantization", ""),
+                                         variant.get("ram_overhead_mb")))
+        if not variants and data.get("backend", "ctransformers") != "openai":
+            raise ValueError(f"El modelo '{name}' no tiene variantes")
+        return cls(name, variants, **data)
+
+    def required_bytes(self, variant):
+        """RAM estimada: pesos + contexto y buffers de trabajo"""
+        overhead = variant.ram_overhead_mb if variant.ram_overhead_mb is not None else self.ram_overhead_mb
+        return variant.file_size + overhead * 1024 * 1024
+
+
+def load_registry(path=DEFAULT_REGISTRY_PATH):
+    """Lee el registro (JSON) y devuelve (nombre_por_defecto, {nombre: ModelSpec})"""
+    if path and os.path.isfile(path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        base_dir = os.path.dirname(os.path.abspath(path))
+    else:
+        data, base_dir = DEFAULT_REGISTRY, "."
+    models = {name: ModelSpec.from_dict(name, spec, base_dir) for name, spec in data["models"].items()}
+    default = data.get("default") or next(iter(models))
+    return default, models
+
+
+def available_memory():
+    """Bytes de RAM disponibles, o None si no se pueden averiguar"""
+    try:
+        import psutil
+        return psutil.virtual_memory().available
+    except ImportError:
+        pass
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def process_memory(pid=None):
+    """RSS en bytes de un proceso (por defecto este), o None si no se puede averiguar"""
+    pid = os.getpid() if pid is None else pid
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss
+    except ImportError:
+        pass
+    except Exception:
+        return None
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def physical_cores():
+    """Núcleos físicos (los hilos lógicos extra no aceleran la inferencia en CPU)"""
+    try:
+        import psutil
+        cores = psutil.cpu_count(logical=False)
+        if cores:
+            return cores
+    except ImportError:
+        pass
+    try:
+        cores = set()
+        physical_id = "0"
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                key, value = key.strip(), value.strip()
+                if key == "physical id":
+                    physical_id = value
+                elif key == "core id":
+                    cores.add((physical_id, value))
+        if cores:
+            return len(cores)
+    except OSError:
+        pass
+    logical = os.cpu_count() or 2
+    return max(1, logical // 2)
+
+
+def choose_variant(spec, free_bytes=None):
+    """Primera variante existente que cabe en memoria; si ninguna cabe, la más pequeña"""
+    existing = [v for v in spec.variants if v.exists]
+    if not existing:
+        raise FileNotFoundError(
+            f"No se encontró ningún archivo del modelo '{spec.name}': "
+            + ", ".join(v.path for v in spec.variants))
+    if free_bytes is None:
+        return existing[0]
+    for variant in existing:
+        if spec.required_bytes(variant) <= free_bytes:
+            return variant
+    smallest = min(existing, key=spec.required_bytes)
+    print(f"⚠️ Ninguna variante de {spec.name} cabe en {free_bytes / 2**30:.1f} GB libres; "
+          f"usando {smallest.quantization or smallest.path}")
+    return smallest
+
+
+def tune_threads(spec, cores=None):
+    """Hilos y tamaño de lote de prompt para este equipo (respetando los valores fijos)"""
+    cores = cores or physical_cores()
+    threads = cores if spec.threads == "auto" else int(spec.threads)
+    if spec.batch_size == "auto":
+        # Lotes más grandes aprovechan mejor muchos núcleos al evaluar el prompt
+        batch_size = min(512, max(64, 64 * threads), spec.context_length)
+    else:
+        batch_size = int(spec.batch_size)
+    return threads, batch_size
+
+
+class LoadedModel:
+    """Modelo cargado junto con lo que se eligió y cuánto tardó"""
+
+    def __init__(self, model, spec, variant, threads, batch_size, load_time):
+        self.model = model
+        self.spec = spec
+        self.variant = variant
+        self.threads = threads
+        self.batch_size = batch_size
+        self.load_time = load_time
+        self.warmup_time = None
+
+    def summary(self):
+        if self.spec.remote:
+            return f"{self.spec.name} · {self.model.summary()} · conexión {self.load_time:.1f}s"
+        text = (f"{self.spec.name} {self.variant.quantization} · {self.threads} hilos · "
+                f"lote {self.batch_size} · carga {self.load_time:.1f}s")
+        if self.spec.isolate:
+            text += f" · {self.model.summary()}"
+        if self.warmup_time is not None:
+            text += f" · calentamiento {self.warmup_time:.1f}s"
+        return text
+
+
+def load_model(spec, loader=None, isolate=None):
+    """Elige variante, ajusta hilos y carga el modelo con los pesos mapeados en memoria"""
+    if spec.remote:
+        return connect_remote(spec)
+    if spec.isolate if isolate is None else isolate:
+        return load_isolated(spec)
+    if loader is None:
+        from ctransformers import AutoModelForCausalLM
+        loader = AutoModelForCausalLM.from_pretrained
+    variant = choose_variant(spec, available_memory())
+    threads, batch_size = tune_threads(spec)
+    start = time.perf_counter()
+    model = loader(
+        variant.path,
+        model_type=spec.model_type,
+        gpu_layers=spec.gpu_layers,
+        context_length=spec.context_length,
+        threads=threads,
+        batch_size=batch_size,
+        mmap=spec.mmap,
+        mlock=spec.mlock,
+    )
+    return LoadedModel(model, spec, variant, threads, batch_size, time.perf_counter() - start)
+
+
+def connect_remote(spec):
+    """Cliente del servidor remoto; comprueba que responde antes de darlo por cargado"""
+    from openai_backend import OpenAIChatClient, DEFAULT_BASE_URL
+    client = OpenAIChatClient(spec.base_url or DEFAULT_BASE_URL, model=spec.remote_model,
+                              api_key=os.environ.get(spec.api_key_env) if spec.api_key_env else None,
+                              read_timeout=spec.timeout, retries=spec.retries)
+    start = time.perf_counter()
+    client.warm_up()
+    variant = ModelVariant(client.base_url, "remoto")
+    return LoadedModel(client, spec, variant, None, None, time.perf_counter() - start)
+
+
+def load_isolated(spec):
+    """Carga el modelo en un proceso hijo; el modelo devuelto es su proxy (ProcessModel)"""
+    from model_worker import ProcessModel, load_spec
+    start = time.perf_counter()
+    model = ProcessModel(load_spec, spec)
+    info = model.info
+    variant = ModelVariant(info["path"], info["quantization"])
+    return LoadedModel(model, spec, variant, info["threads"], info["batch_size"], time.perf_counter() - start)
+
+
+def warm_up(loaded, prefix_tokens, cache=None):
+    """Evalúa un prefijo fijo (BOS + sistema) para que el primer turno no pague la carga en frío.
+
+    Con mmap los pesos se leen de disco al usarse por primera vez; evaluar
+    el prompt de sistema los trae a memoria y además deja ese prefijo en el
+    contexto del modelo, que el PromptCache reutiliza en el primer turno.
+    """
+    start = time.perf_counter()
+    model = loaded.model
+    if getattr(model, "remote", False):
+        # El servidor guarda su propio contexto: basta con mantener la conexión abierta
+        model.warm_up()
+    elif hasattr(model, "eval"):
+        model.reset()
+        model.eval(prefix_tokens, batch_size=loaded.batch_size, threads=loaded.threads)
+        if cache is not None:
+            cache.update(prefix_tokens)
+    else:
+        for _ in zip(range(1), model.generate(prefix_tokens, reset=True)):
+            pass
+        if cache is not None:
+            cache.invalidate()
+    loaded.warmup_time = time.perf_counter() - start
+    return loaded.warmup_time
+
+
+STUB_REPLIES = [
+    "That sounds great! Your sentence is clear and natural. What did you do after that?",
+    "Nice try. A small correction: say \"I went\" instead of \"I goed\". Can you tell me more?",
+    "Good question! In English we usually say it like this. Would you like to practice another example?",
+]
+
+
+class StubModel:
+    """Modelo determinista con la interfaz de ctransformers (benchmarks sin pesos).
+
+    Tokeniza por bytes, elige la respuesta a partir del contexto y simula
+    el coste de evaluar el prompt y de generar cada token, así que también
+    refleja cuánto prefijo se reutiliza entre turnos.
+    """
+
+    bos_token_id = 1
+    eos_token_id = 2
+    offset = 3
+
+    def __init__(self, replies=None, prompt_seconds_per_token=0.0002, seconds_per_token=0.01,
+                 stop_text="<|im_end|>"):
+        self.replies = replies or STUB_REPLIES
+        self.prompt_seconds_per_token = prompt_seconds_per_token
+        self.seconds_per_token = seconds_per_token
+        self.stop_text = stop_text
+        self.context = []
+
+    def tokenize(self, text, add_bos_token=True):
+        tokens = [b + self.offset for b in text.encode("utf-8")]
+        return [self.bos_token_id] + tokens if add_bos_token else tokens
+
+    def detokenize(self, tokens, decode=True):
+        data = bytes(t - self.offset for t in tokens if t >= self.offset)
+        return data.decode("utf-8", errors="ignore") if decode else data
+
+    def reset(self):
+        self.context = []
+
+    def eval(self, tokens, batch_size=None, threads=None):
+        if self.prompt_seconds_per_token:
+            time.sleep(len(tokens) * self.prompt_seconds_per_token)
+        self.context.extend(tokens)
+
+    def prepare_inputs_for_generation(self, tokens, reset=True):
+        # Como ctransformers: conserva el prefijo común ya evaluado y deja al menos un token
+        if not reset:
+            return tokens
+        n = min(len(tokens) - 1, len(self.context))
+        common = 0
+        while common < n and tokens[common] == self.context[common]:
+            common += 1
+        self.context = self.context[:common]
+        return tokens[common:]
+
+    def generate(self, tokens, temperature=0.7, reset=True, **kwargs):
+        self.eval(self.prepare_inputs_for_generation(list(tokens), reset=reset))
+        reply = self.replies[zlib.crc32(bytes(t % 256 for t in self.context)) % len(self.replies)]
+        for token in self.tokenize(reply + self.stop_text, add_bos_token=False):
+            if self.seconds_per_token:
+                time.sleep(self.seconds_per_token)
+            self.context.append(token)
+            yield token
@@ -0,0 +1,353 @@
+"""Inferencia en un proceso aparte: el modelo no compite por el GIL con la captura ni con Tk.
+
+El proceso hijo carga el modelo y atiende peticiones por un Pipe; los
+tokens generados vuelven uno a uno por el mismo Pipe. ProcessModel
+ofrece en el proceso principal la misma interfaz que un modelo de
+ctransformers, así el pipeline no distingue entre uno y otro.
+"""
+import multiprocessing
+import threading
+import time
+
+
+class ModelWorkerError(RuntimeError):
+    """El proceso del modelo falló o se cerró"""
+
+
+def _describe(loaded):
+    """Datos del modelo cargado que el proceso principal necesita"""
+    model = getattr(loaded, "model", loaded)
+    info = {"bos_token_id": getattr(model, "bos_token_id", None),
+            "eos_token_id": getattr(model, "eos_token_id", None)}
+    if model is not loaded:
+        info.update(path=loaded.variant.path, quantization=loaded.variant.quantization,
+                    threads=loaded.threads, batch_size=loaded.batch_size, load_time=loaded.load_time)
+    return model, info
+
+
+def _generate(connection, model, tokens, options):
+    """Genera y envía cada token con sus bytes; se detiene si llega ("stop", (contexto,))"""
+    reset = options.pop("reset", True)
+    if reset and hasattr(model, "prepare_inputs_for_generation"):
+        # Se recorta aquí al prefijo común para poder contarle al proceso principal cuánto se conservó
+        feed = model.prepare_inputs_for_generation(tokens, reset=True)
+        reset = False
+    else:
+        feed = tokens
+    connection.send(("start", len(tokens) - len(feed) if not reset else 0))
+    for token in model.generate(feed, reset=reset, **options):
+        connection.send(("token", token, model.detokenize([token], decode=False)))
+        if connection.poll():
+            message = connection.recv()
+            if message[0] == "stop":
+                _rollback(model, *message[1])
+                break
+    connection.send(("end", None))
+
+
+def _rollback(model, context):
+    """Deja en el modelo exactamente context, los tokens que el proceso principal consumió.
+
+    Cuando el principal deja de leer (longitud, cancelación, secuencia de
+    parada) el hijo ya ha evaluado tokens que nadie vio; sin esto el
+    siguiente turno con reset=False se añadiría detrás de ellos.
+    """
+    context = list(context)
+    if not context:
+        model.reset()
+    elif hasattr(model, "prepare_inputs_for_generation"):
+        # Conserva el prefijo común y reevalúa lo que falte (al menos el último token)
+        model.eval(model.prepare_inputs_for_generation(context, reset=True))
+    else:
+        model.reset()
+        model.eval(context)
+
+
+def serve(connection, factory, args, kwargs):
+    """Bucle del proceso hijo: carga el modelo con factory(*args, **kwargs) y atiende peticiones"""
+    try:
+        model, info = _describe(factory(*args, **kwargs))
+    except Exception as e:
+        connection.send(("error", f"No se pudo cargar el modelo: {e}"))
+        return
+    connection.send(("ready", info))
+
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            return
+        method, call_args, options = message
+        if method == "close":
+            return
+        if method == "stop":
+            # Llegó tarde: la generación ya había terminado, pero el contexto
+            # puede llevar tokens que el proceso principal descartó
+            try:
+                _rollback(model, *call_args)
+            except Exception as e:
+                print(f"⚠️ No se pudo recortar el contexto del modelo: {e}")
+            continue
+        try:
+            if method == "generate":
+                _generate(connection, model, *call_args, options)
+            else:
+                connection.send(("result", getattr(model, method)(*call_args, **options)))
+        except Exception as e:
+            connection.send(("error", f"{type(e).__name__}: {e}"))
+
+
+class ProcessModel:
+    """Modelo con la interfaz de ctransformers que vive en un proceso hijo.
+
+    Se crea con la función que carga el modelo (debe poder importarse
+    desde el hijo) y sus argumentos. Si el proceso muere se vuelve a
+    lanzar sin tocar la interfaz: se guarda una copia de los tokens que
+    el modelo tiene en contexto y se reevalúan antes de seguir, así el
+    PromptCache del pipeline sigue siendo válido. Solo falla el turno
+    cuya generación ya había empezado a devolver texto.
+
+    Las llamadas se serializan con un lock; como en ctransformers, un
+    solo hilo (el de inferencia) debe usar el modelo.
+    """
+
+    def __init__(self, factory, *args, start_timeout=600.0, name="model-worker", **kwargs):
+        self.factory = factory
+        self.args = args
+        self.kwargs = kwargs
+        self.start_timeout = start_timeout
+        self.name = name
+        self.context = []         # Tokens que el modelo tiene evaluados (espejo del hijo)
+        self.replay = False       # El hijo es nuevo: hay que reevaluar context antes de seguir
+        self.token_bytes = {}     # token -> bytes, aprendidos al generar
+        self.lock = threading.RLock()
+        self.process = None
+        self.connection = None
+        self.info = {}
+        self.starts = 0
+        self.restarts = 0
+        self.on_restart = None    # (modelo) se relanzó el proceso tras un fallo
+        self.start()
+
+    @property
+    def bos_token_id(self):
+        return self.info.get("bos_token_id")
+
+    @property
+    def eos_token_id(self):
+        return self.info.get("eos_token_id")
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    # --- Proceso ---
+
+    def start(self):
+        """Lanza el proceso hijo y espera a que el modelo esté cargado"""
+        context = multiprocessing.get_context("spawn")
+        parent, child = context.Pipe()
+        process = context.Process(target=serve, args=(child, self.factory, self.args, self.kwargs),
+                                  name=self.name, daemon=True)
+        started = time.perf_counter()
+        process.start()
+        # Sin la copia del padre, recv() da EOFError en cuanto el hijo muere
+        child.close()
+        try:
+            if not parent.poll(self.start_timeout):
+                raise ModelWorkerError(f"El proceso del modelo no respondió en {self.start_timeout:.0f}s")
+            kind, data = parent.recv()
+        except (EOFError, OSError):
+            process.join(timeout=1)
+            kind, data = "error", f"El proceso del modelo terminó al arrancar (código {process.exitcode})"
+        if kind != "ready":
+            process.terminate()
+            parent.close()
+            raise ModelWorkerError(data)
+        self.process, self.connection, self.info = process, parent, data
+        self.starts += 1
+        print(f"🧩 Modelo en proceso aparte (pid {process.pid}, {time.perf_counter() - started:.1f}s)")
+
+    def restart(self):
+        """Relanza el proceso caído; el contexto se reevalúa en la siguiente llamada"""
+        self._terminate()
+        self.restarts += 1
+        print(f"♻️ Relanzando el proceso del modelo (reinicio {self.restarts})...")
+        self.start()
+        self.replay = bool(self.context)
+        if self.on_restart:
+            self.on_restart(self)
+
+    def _terminate(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+        if self.process is not None:
+            if self.process.is_alive():
+                self.process.terminate()
+            self.process.join(timeout=5)
+            self.process = None
+
+    def close(self):
+        with self.lock:
+            if self.alive:
+                try:
+                    self.connection.send(("close", (), {}))
+                except OSError:
+                    pass
+                self.process.join(timeout=5)
+            self._terminate()
+
+    # --- Comunicación ---
+
+    def _send(self, method, args=(), options=None):
+        if not self.alive:
+            raise ModelWorkerError("El proceso del modelo no está en marcha")
+        try:
+            self.connection.send((method, args, options or {}))
+        except OSError as e:
+            raise ModelWorkerError(f"No se pudo hablar con el proceso del modelo: {e}") from None
+
+    def _recv(self):
+        try:
+            message = self.connection.recv()
+        except (EOFError, OSError):
+            code = None
+            if self.process is not None:
+                self.process.join(timeout=1)
+                code = self.process.exitcode
+            raise ModelWorkerError(f"El proceso del modelo terminó (código {code})") from None
+        if message[0] == "error":
+            raise RuntimeError(message[1])
+        return message
+
+    def _call(self, method, *args, **options):
+        """Llamada sencilla; si el proceso murió se relanza y se repite una vez"""
+        with self.lock:
+            for attempt in range(2):
+                try:
+                    self._prepare(method)
+                    self._send(method, args, options)
+                    return self._recv()[1]
+                except ModelWorkerError:
+                    if attempt:
+                        raise
+                    self.restart()
+
+    def _prepare(self, method):
+        """Tras un reinicio, reevalúa el contexto perdido antes de una llamada que lo necesita"""
+        if not self.alive:
+            raise ModelWorkerError("El proceso del modelo no está en marcha")
+        if not self.replay or method in ("tokenize", "detokenize"):
+            return
+        self.replay = False
+        print(f"♻️ Reevaluando {len(self.context)} tokens de contexto tras el reinicio")
+        self._send("eval", (list(self.context),))
+        self._recv()
+
+    # --- Interfaz de ctransformers ---
+
+    def tokenize(self, text, add_bos_token=True):
+        return self._call("tokenize", text, add_bos_token=add_bos_token)
+
+    def detokenize(self, tokens, decode=True):
+        tokens = list(tokens)
+        if all(token in self.token_bytes for token in tokens):
+            # Los tokens recién generados no necesitan ir y volver
+            data = b"".join(self.token_bytes[token] for token in tokens)
+            return data.decode("utf-8", errors="ignore") if decode else data
+        return self._call("detokenize", tokens, decode=decode)
+
+    def reset(self):
+        with self.lock:
+            self.context = []
+            self.replay = False
+            if self.alive:
+                self._call("reset")
+
+    def eval(self, tokens, batch_size=None, threads=None):
+        tokens = list(tokens)
+        with self.lock:
+            self._call("eval", tokens, batch_size=batch_size, threads=threads)
+            self.context.extend(tokens)
+
+    def prepare_inputs_for_generation(self, tokens, reset=True):
+        tokens = list(tokens)
+        with self.lock:
+            if reset and self.replay:
+                # El hijo empezó vacío: no hay prefijo que conservar
+                self.replay = False
+                self.context = []
+            feed = self._call("prepare_inputs_for_generation", tokens, reset=reset)
+            if reset:
+                self.context = tokens[:len(tokens) - len(feed)]
+            return feed
+
+    def generate(self, tokens, temperature=0.7, reset=True, **kwargs):
+        """Generador de tokens; al cerrarlo antes de tiempo se detiene también el hijo"""
+        tokens = list(tokens)
+        options = dict(kwargs, temperature=temperature, reset=reset)
+        with self.lock:
+            for attempt in range(2):
+                try:
+                    if reset and self.replay:
+                        self.replay = False
+                        self.context = []
+                    self._prepare("generate")
+                    self._send("generate", (tokens,), options)
+                    kept = self._recv()[1]
+                    break
+                except ModelWorkerError:
+                    # Aún no salió ningún token: se puede relanzar y repetir
+                    if attempt:
+                        raise
+                    self.restart()
+            self.context = (self.context[:kept] if reset else self.context) + tokens[kept:]
+
+            finished = False
+            try:
+                while True:
+                    message = self._recv()
+                    if message[0] == "end":
+                        finished = True
+                        return
+                    _, token, data = message
+                    self.token_bytes[token] = data
+                    self.context.append(token)
+                    yield token
+            except ModelWorkerError:
+                # Murió a mitad de respuesta: el contexto del hijo nuevo se reconstruye
+                # con lo que ya se había generado
+                finished = True
+                self.restart()
+                raise
+            except RuntimeError:
+                # Error dentro del hijo: no llegará "end"
+                finished = True
+                raise
+            finally:
+                if not finished:
+                    # Se dejó de consumir el generador: parar al hijo, que vuelva al
+                    # contexto consumido, y descartar lo que ya envió
+                    try:
+                        self._send("stop", (list(self.context),))
+                        while self._recv()[0] != "end":
+                            pass
+                    except ModelWorkerError:
+                        # Se relanzará en la próxima llamada
+                        pass
+                    except RuntimeError as e:
+                        # Falló el recorte en el hijo: no llegará "end"
+                        print(f"⚠️ Error al detener la generación del modelo: {e}")
+
+    def summary(self):
+        text = f"proceso aparte (pid {self.process.pid if self.process else '-'})"
+        if self.restarts:
+            text += f" · {self.restarts} reinicios"
+        return text
+
+
+def load_spec(spec):
+    """Carga un modelo del registro dentro del proceso hijo (el de siempre, sin aislar)"""
+    import model_registry
+    return model_registry.load_model(spec, isolate=False)
@@ -0,0 +1,246 @@
+"""Backend remoto compatible con la API de OpenAI (servidor local de LM Studio, llama.cpp, ...).
+
+Genera en streaming (SSE) sobre conexiones HTTP persistentes, con
+timeouts y reintentos, y ofrece la misma forma de resultado que
+stream_generate: (texto, GenerationStats).
+"""
+import http.client
+import json
+import queue
+import threading
+import time
+from urllib.parse import urlsplit
+
+from streaming import GenerationStats, StopSequenceFilter, STOP_SEQUENCES
+
+DEFAULT_BASE_URL = "http://localhost:1234/v1"
+
+# Respuestas que merece la pena reintentar (servidor ocupado o reiniciándose)
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+class RemoteModelError(RuntimeError):
+    """El servidor no respondió o devolvió un error"""
+
+
+class ConnectionPool:
+    """Conexiones keep-alive a un mismo servidor, reutilizadas entre peticiones"""
+
+    def __init__(self, host, port, https=False, size=4, connect_timeout=3.0):
+        self.host = host
+        self.port = port
+        self.https = https
+        self.size = size
+        self.connect_timeout = connect_timeout
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+        self.created = 0
+
+    def get(self):
+        """Una conexión ociosa (o nueva) y si es reutilizada"""
+        try:
+            return self.idle.get_nowait(), True
+        except queue.Empty:
+            pass
+        factory = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        # Varios hilos de inferencia comparten el pool
+        with self.lock:
+            self.created += 1
+        return factory(self.host, self.port, timeout=self.connect_timeout), False
+
+    def put(self, connection):
+        """Devuelve una conexión cuya respuesta se leyó entera"""
+        if self.idle.qsize() < self.size:
+            self.idle.put(connection)
+        else:
+            connection.close()
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class OpenAIChatClient:
+    """Cliente de /v1/chat/completions con streaming.
+
+    Se usa como "modelo" del pipeline: remote=True indica que el prompt se
+    envía como mensajes (el servidor tokeniza y aplica la plantilla de chat).
+    Los reintentos solo ocurren antes del primer token, así nunca se
+    repite texto ya mostrado o hablado.
+    """
+
+    remote = True
+    bos_token_id = None
+    eos_token_id = None
+
+    def __init__(self, base_url=DEFAULT_BASE_URL, model=None, api_key=None, connect_timeout=3.0,
+                 read_timeout=60.0, retries=2, backoff=0.5, pool_size=4, stop=None):
+        parts = urlsplit(base_url)
+        self.base_url = base_url.rstrip("/")
+        self.path = parts.path.rstrip("/")
+        self.model = model
+        self.api_key = api_key
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.stop = list(stop or STOP_SEQUENCES)
+        self.pool = ConnectionPool(parts.hostname, parts.port, https=parts.scheme == "https",
+                                   size=pool_size, connect_timeout=connect_timeout)
+        self.requests = 0
+        self.retried = 0
+
+    # --- HTTP ---
+
+    def _headers(self, body):
+        headers = {"Content-Type": "application/json", "Accept": "text/event-stream, application/json",
+                   "Connection": "keep-alive"}
+        if body is not None:
+            headers["Content-Length"] = str(len(body))
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+    def _open(self, method, path, payload=None):
+        """Envía la petición (con reintentos) y devuelve (conexión, respuesta) con estado 200"""
+        body = None if payload is None else json.dumps(payload).encode("utf-8")
+        attempt = 0
+        while True:
+            connection, reused = self.pool.get()
+            try:
+                if connection.sock is None:
+                    connection.connect()
+                # Conectar tiene su propio timeout; la lectura del stream, otro más largo
+                connection.sock.settimeout(self.read_timeout)
+                connection.request(method, self.path + path, body=body, headers=self._headers(body))
+                response = connection.getresponse()
+            except (OSError, http.client.HTTPException) as e:
+                connection.close()
+                if reused:
+                    # El servidor cerró la conexión ociosa: probar con otra sin contarlo
+                    continue
+                error, retry = e, True
+            else:
+                self.requests += 1
+                if response.status == 200:
+                    return connection, response
+                detail = response.read()[:300].decode("utf-8", errors="replace")
+                if response.will_close:
+                    connection.close()
+                else:
+                    self.pool.put(connection)
+                error, retry = f"HTTP {response.status}: {detail}", response.status in RETRY_STATUSES
+            if not retry or attempt >= self.retries:
+                raise RemoteModelError(f"Sin respuesta de {self.base_url}{path}: {error}")
+            attempt += 1
+            self.retried += 1
+            time.sleep(self.backoff * 2 ** (attempt - 1))
+
+    def _get_json(self, path):
+        connection, response = self._open("GET", path)
+        try:
+            data = json.loads(response.read())
+        except (OSError, http.client.HTTPException, ValueError) as e:
+            connection.close()
+            raise RemoteModelError(f"Respuesta inválida de {self.base_url}{path}: {e}") from None
+        self.pool.put(connection)
+        return data
+
+    # --- API usada por el pipeline ---
+
+    def list_models(self):
+        return [m.get("id") for m in self._get_json("/models").get("data", [])]
+
+    def warm_up(self):
+        """Comprueba el servidor y deja una conexión abierta para el primer turno"""
+        models = self.list_models()
+        if self.model is None and models:
+            self.model = models[0]
+        return models
+
+    def stream_chat(self, messages, on_text=None, max_new_tokens=200, temperature=0.7,
+                    should_stop=None, prompt_tokens=0):
+        """Genera una respuesta a partir de mensajes [{role, content}] llamando a on_text por fragmento.
+
+        Devuelve (texto, stats); prompt_tokens es la estimación local que se
+        usa si el servidor no informa del uso.
+        """
+        stats = GenerationStats()
+        stop_filter = StopSequenceFilter(self.stop)
+        payload = {"messages": messages, "max_tokens": max_new_tokens, "temperature": temperature,
+                   "stream": True, "stop": self.stop, "stream_options": {"include_usage": True}}
+        if self.model:
+            payload["model"] = self.model
+        connection, response = self._open("POST", "/chat/completions", payload)
+
+        parts = []
+        usage = None
+        finished = False
+
+        def emit(text):
+            if text:
+                parts.append(text)
+                if on_text:
+                    on_text(text)
+
+        try:
+            while True:
+                line = response.readline()
+                if not line:
+                    break
+                line = line.strip()
+                # Líneas vacías separan eventos; las que empiezan por ":" son comentarios
+                if not line.startswith(b"data:"):
+                    continue
+                data = line[5:].strip()
+                if data == b"[DONE]":
+                    finished = True
+                    break
+                chunk = json.loads(data)
+                usage = chunk.get("usage") or usage
+                for choice in chunk.get("choices") or []:
+                    text = (choice.get("delta") or {}).get("content")
+                    if text:
+                        stats.mark_token()
+                        emit(stop_filter.feed(text))
+                    if choice.get("finish_reason"):
+                        stats.stop_reason = choice["finish_reason"]
+                if stop_filter.stopped:
+                    stats.stop_reason = "stop"
+                    break
+                if should_stop and should_stop():
+                    stats.stop_reason = "cancelled"
+                    break
+            emit(stop_filter.flush())
+        except (OSError, http.client.HTTPException, ValueError) as e:
+            connection.close()
+            raise RemoteModelError(f"Se cortó la respuesta de {self.base_url}: {e}") from None
+        finally:
+            stats.finish()
+
+        if finished:
+            response.read()
+            self.pool.put(connection)
+        else:
+            # Stream sin terminar: la conexión no puede reutilizarse
+            connection.close()
+            if stats.stop_reason is None:
+                raise RemoteModelError(f"El servidor {self.base_url} cerró el stream antes de terminar")
+
+        if stats.stop_reason is None:
+            stats.stop_reason = "stop"
+        stats.prompt_tokens = (usage or {}).get("prompt_tokens") or prompt_tokens
+        stats.evaluated_prompt_tokens = stats.prompt_tokens
+        if usage and usage.get("completion_tokens"):
+            stats.generated_tokens = usage["completion_tokens"]
+        return "".join(parts), stats
+
+    def close(self):
+        self.pool.close()
+
+    def summary(self):
+        return (f"{self.model or 'modelo del servidor'} en {self.base_url} · "
+                f"{self.requests} peticiones · {self.retried} reintentos · "
+                f"{self.pool.created} conexiones abiertas")
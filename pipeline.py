@@ -0,0 +1,850 @@
+"""Núcleo del tutor sin interfaz: captura → VAD → transcripción → generación → voz.
+
+La ventana de Tk (chat_local.py), el modo sin interfaz y los benchmarks
+usan este mismo camino; la interfaz solo se engancha con callbacks.
+"""
+import asyncio
+import contextlib
+import itertools
+import os
+import threading
+import time
+
+import numpy as np
+
+from audio_output import AudioOutput
+from conversation import Conversation
+from endpointing import AdaptiveEndpointer
+from fluency import analyze_utterance, describe as describe_fluency
+from scheduler import InferenceScheduler, InferenceJob, PRIORITY_CONTROL, PRIORITY_VOICE, PRIORITY_TEXT
+from speech_to_text import StreamingTranscriber
+from streaming import stream_generate, prefill_prompt, PromptCache
+from synthesizers import CachedSynthesizer
+from tts import SpeechStream, speech_sentences
+from tts_cache import TTSCache
+from tracing import Tracer
+from vad import VoiceActivityDetector, EchoSuppressor
+import model_registry
+
+# Un único mensaje de sistema para texto y voz: así el prefijo evaluado
+# se reutiliza en todos los turnos de la sesión
+TUTOR_SYSTEM_PROMPT = """You are a friendly English tutor. Respond naturally and conversationally in English. Keep responses concise and helpful for language practice. Always respond in English.
+Some user turns are spoken: you can "hear" that audio directly. Analyze their speech and, if you detect pronunciation issues, mention them politely.
+Spoken turns may include an automatic audio analysis (speech rate, pauses, pitch, loudness). Use it to give brief, encouraging feedback on fluency and intonation when it is relevant."""
+
+AUDIO_USER_PLACEHOLDER = "[Audio input - user speaking in English]"
+AUDIO_USER_TEMPLATE = "[Spoken] {transcript}"
+FLUENCY_TEMPLATE = "\n[{summary}]"
+
+TEXT_FALLBACK = "I'm sorry, I didn't understand that. Could you repeat?"
+AUDIO_FALLBACK = "I heard you speak! That's great pronunciation practice. Keep going!"
+
+
+def voice_user_text(transcript, fluency=None):
+    """Texto del turno de voz para el modelo: transcripción y, si la hay, el resumen de fluidez"""
+    text = AUDIO_USER_TEMPLATE.format(transcript=transcript)
+    summary = describe_fluency(fluency)
+    return text + FLUENCY_TEMPLATE.format(summary=summary) if summary else text
+
+
+def tutor_conversation(model, context_length=2048, max_new_tokens=200):
+    """Conversación nueva con el prompt del tutor para un modelo local o remoto.
+
+    Con un backend remoto (model.remote) el servidor tokeniza: el
+    presupuesto de contexto se lleva con una estimación por caracteres.
+    """
+    remote = getattr(model, "remote", False)
+    return Conversation(
+        TUTOR_SYSTEM_PROMPT,
+        tokenize=None if remote else lambda text: model.tokenize(text, add_bos_token=False),
+        bos_token_id=model.bos_token_id,
+        context_length=context_length,
+        max_new_tokens=max_new_tokens
+    )
+
+
+def generate_reply(model, conversation, user_text, on_text=None, should_stop=None, cache=None,
+                   temperature=0.7, tracer=None, turn=None, lock=None):
+    """Añade el turno del usuario a la conversación y genera la respuesta en streaming.
+
+    Sirve para modelos locales (solo se evalúan los tokens nuevos del
+    prompt gracias al PromptCache) y para backends remotos (model.remote).
+    Devuelve (texto limpio, stats); la respuesta aún no queda en la
+    conversación: eso lo hace remember_reply. lock protege los cambios en
+    la conversación si otros hilos la leen (no se mantiene al generar).
+    """
+    remote = getattr(model, "remote", False)
+    with tracer.span("prompt_build", turn) if tracer else contextlib.nullcontext():
+        with lock or contextlib.nullcontext():
+            conversation.add_user(user_text)
+            prompt_tokens = conversation.build_prompt()
+            messages = conversation.messages() if remote else None
+
+    if remote:
+        response, stats = model.stream_chat(messages, on_text=on_text,
+                                            max_new_tokens=conversation.max_new_tokens,
+                                            temperature=temperature, should_stop=should_stop,
+                                            prompt_tokens=len(prompt_tokens))
+    else:
+        response, stats = stream_generate(model, prompt_tokens, on_text=on_text,
+                                          max_new_tokens=conversation.max_new_tokens,
+                                          temperature=temperature, should_stop=should_stop,
+                                          cache=cache)
+
+    if tracer is not None:
+        tracer.record("prompt_eval", stats.time_to_first_token, turn,
+                      prompt_tokens=stats.prompt_tokens, evaluated=stats.evaluated_prompt_tokens)
+        if stats.first_token_time is not None:
+            tracer.record("generation", stats.end_time - stats.first_token_time, turn,
+                          tokens=stats.generated_tokens, stop_reason=stats.stop_reason)
+
+    # Limpiar respuesta
+    clean_response = response.strip()
+    if clean_response.startswith("assistant"):
+        clean_response = clean_response[9:].strip()
+    # Una respuesta cancelada se devuelve tal cual (el "…" lo añade la interfaz):
+    # el texto debe seguir correspondiendo a los tokens que quedan en la conversación
+    return clean_response, stats
+
+
+def remember_reply(model, conversation, text, stats, generated=True):
+    """Guarda la respuesta en la conversación.
+
+    Con un modelo local se guardan los tokens generados tal cual quedaron
+    en su contexto; con un backend remoto no hay tokens y se estiman.
+    generated=False indica un texto que no salió del modelo (la respuesta
+    de reserva): entonces se tokeniza en vez de usar los tokens generados.
+    """
+    remote = getattr(model, "remote", False)
+    token_ids = None if remote or not generated else stats.output_tokens
+    conversation.add_assistant(text, token_ids, stats.stop_reason)
+
+
+class TurnRecord:
+    """Un turno del usuario y sus tiempos (perf_counter).
+
+    El turno termina cuando la generación acabó y, si se habló, cuando
+    terminó de sonar la respuesta.
+    """
+
+    ids = itertools.count(1)
+
+    def __init__(self, kind, user_text, shown_text=None):
+        self.id = next(TurnRecord.ids)
+        self.kind = kind
+        self.user_text = user_text
+        self.shown_text = shown_text if shown_text is not None else user_text
+        self.created = time.perf_counter()   # Texto enviado o fin de frase detectado
+        self.created_at = time.time()
+        self.submitted = None                # Encolado en el planificador
+        self.started = None                  # Empieza en el hilo de inferencia
+        self.first_token = None
+        self.generated = None
+        self.first_audio = None
+        self.finished = None
+        self.response = None
+        self.stats = None
+        self.status = "queued"               # queued, done, dropped, error
+        self.error = None
+        self.audio_path = None
+        self.speculative = False             # La transcripción salió de la especulación
+        self.fluency = None                  # Métricas de fluidez del audio (fluency.analyze_utterance)
+        self.done = threading.Event()
+        self.lock = threading.Lock()
+        self.parts_left = 1                  # Generación (+ voz si se habla)
+
+    def _elapsed(self, moment):
+        return None if moment is None else moment - self.created
+
+    @property
+    def queue_wait(self):
+        if self.started is None or self.submitted is None:
+            return None
+        return self.started - self.submitted
+
+    @property
+    def ttft(self):
+        return self._elapsed(self.first_token)
+
+    @property
+    def ttfa(self):
+        return self._elapsed(self.first_audio)
+
+    @property
+    def end_to_end(self):
+        return self._elapsed(self.finished)
+
+    def expect_speech(self):
+        with self.lock:
+            self.parts_left += 1
+
+    def part_done(self):
+        with self.lock:
+            self.parts_left -= 1
+            last = self.parts_left == 0
+        if last:
+            self.finished = time.perf_counter()
+            if self.status == "queued":
+                self.status = "done"
+            self.done.set()
+
+    def drop(self):
+        self.status = "dropped"
+        self.finished = time.perf_counter()
+        self.done.set()
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)
+
+    def to_dict(self):
+        stats = self.stats
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "user_text": self.shown_text,
+            "response": self.response,
+            "queue_wait": self.queue_wait,
+            "ttft": self.ttft,
+            "ttfa": self.ttfa,
+            "end_to_end": self.end_to_end,
+            "tokens_per_second": stats.tokens_per_second if stats else None,
+            "prompt_tokens": stats.prompt_tokens if stats else None,
+            "evaluated_prompt_tokens": stats.evaluated_prompt_tokens if stats else None,
+            "generated_tokens": stats.generated_tokens if stats else None,
+            "stop_reason": stats.stop_reason if stats else None,
+            "speculative": self.speculative,
+            "fluency": self.fluency,
+            "error": self.error,
+        }
+
+
+class Speculation:
+    """Transcripción y prefill adelantados durante el silencio final de una frase.
+
+    Solo vale si el usuario no vuelve a hablar: speech_position es el
+    último audio con voz que cubre.
+    """
+
+    def __init__(self, speech_position):
+        self.speech_position = speech_position
+        self.text = None
+        self.fluency = None
+        self.done = threading.Event()
+        self.job = None
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+        if self.job is not None:
+            self.job.cancel()
+
+
+class TutorPipeline:
+    """Modelo, conversación, planificador, voz de entrada y de salida.
+
+    Los callbacks se llaman desde hilos de trabajo; una interfaz gráfica
+    debe reenviarlos a su propio hilo.
+    """
+
+    def __init__(self, rate=16000, chunk=512, speak=True, tts_speed=1.0, silence_threshold=2.0,
+                 preroll_seconds=0.25, preempt_on_new_turn=True, max_turn_age=30.0,
+                 audio_output=None, tts_cache=None):
+        self.rate = rate
+        self.chunk = chunk
+
+        # Estado del modelo (la conversación se crea al cargar el modelo)
+        self.model = None
+        self.conversation = None
+        self.kv_cache = PromptCache()
+        self.temperature = 0.7
+
+        # Un único hilo de inferencia es dueño del modelo y de la conversación
+        self.scheduler = InferenceScheduler()
+        self.preempt_on_new_turn = preempt_on_new_turn  # Un turno nuevo interrumpe la respuesta en curso
+        self.max_turn_age = max_turn_age  # Segundos en cola antes de descartar un turno
+
+        # Entrada de voz: VAD adaptativo + transcripción incremental
+        self.vad = VoiceActivityDetector(sample_rate=rate)
+        self.transcriber = StreamingTranscriber(None, sample_rate=rate,
+                                                on_partial=self._on_partial_transcript)
+        self.silence_threshold = silence_threshold  # Segundos de audio sin voz para cerrar la frase
+        # Fin de frase adaptativo: el umbral es el máximo y se acorta según las pausas del
+        # alumno y la transcripción provisional
+        self.adaptive_endpointing = True
+        self.endpointer = AdaptiveEndpointer(silence_threshold)
+        self.endpoint_threshold = silence_threshold  # Umbral en vigor para la frase en curso
+        # Durante el silencio final se transcribe y se evalúa el prompt por adelantado
+        self.speculative_prefill = True
+        self.speculate_after = 0.3
+        self.speculation = None
+        self.speculations = 0
+        self.speculation_hits = 0
+        # Métricas de fluidez (ritmo, pausas, tono) del audio de cada frase, resumidas en el prompt
+        self.fluency_analysis = True
+        self.preroll_seconds = preroll_seconds  # Audio previo a la detección que se envía al reconocedor
+        self.utterance_started = False
+        self.utterance_start = 0  # Posición (muestra absoluta) donde empezó la frase
+        self.last_speech_position = 0
+        self.last_speech_time = 0  # perf_counter del último bloque con voz (para la etapa "endpoint")
+        self.capture_seconds = 0.0  # Tiempo de procesado de la captura durante la frase
+        self.capture_blocks = 0
+        self.capture = None
+        self.last_cursor = 0
+        self.last_noise_report = 0
+
+        # Barge-in: si el alumno habla mientras el tutor habla o genera, se le cede la palabra.
+        # Mientras suena la respuesta solo cuenta la voz que supera el eco del altavoz
+        self.barge_in = True
+        self.echo = EchoSuppressor(self.vad.frame_duration)
+        self.interrupted = False    # Ya se interrumpió al tutor durante la frase en curso
+        self.barge_ins = 0
+
+        # Spans por etapa de cada turno (histogramas móviles + JSONL opcional)
+        self.tracer = Tracer()
+
+        # Historial persistente (opcional): turnos con métricas y, si hay audio_dir, la voz grabada
+        self.history = None
+        self.session_id = None
+        self.audio_dir = None
+
+        # Gobernador de memoria (opcional, ver governor.py): descarga el modelo sin uso y lo recarga
+        self.governor = None
+
+        # Salida de voz
+        self.speak = speak
+        self.tts_speed = tts_speed
+        self.audio_output = audio_output or AudioOutput()
+        self.tts_cache = tts_cache if tts_cache is not None else TTSCache()
+        self.synthesizer = None
+
+        # Callbacks de la interfaz
+        self.on_response_start = None   # (record) empieza la respuesta
+        self.on_token = None            # (texto) fragmento generado
+        self.on_response = None         # (record) respuesta o error listos
+        self.on_turn_done = None        # (record) texto y voz terminados
+        self.on_user_voice = None       # (record) turno de voz reconocido
+        self.on_partial = None          # (texto) transcripción provisional
+        self.on_queued = None           # (pendientes) el turno espera en cola
+        self.on_noise_floor = None      # (dB) como mucho una vez por segundo
+        self.on_level = None            # (dB) energía del último frame de cada bloque capturado
+        self.on_barge_in = None         # () el alumno interrumpió al tutor
+        self.on_speech_finished = None  # (stream) terminó de sonar una respuesta
+
+    def start(self):
+        self.scheduler.start()
+        self.audio_output.start()
+        return self
+
+    def shutdown(self):
+        self.scheduler.stop()
+        self.audio_output.shutdown()
+        self.transcriber.stop()
+
+    # --- Modelo ---
+
+    def set_model(self, model, context_length=2048, max_new_tokens=200):
+        """Usa un modelo ya cargado (con la interfaz de ctransformers) o un cliente remoto"""
+        self.model = model
+        self.kv_cache.invalidate()
+        self.conversation = tutor_conversation(model, context_length, max_new_tokens)
+
+    def release_model(self):
+        """Suelta el modelo (hilo de inferencia) conservando la conversación; lo devuelve"""
+        model, self.model = self.model, None
+        self.kv_cache.invalidate()
+        if self.conversation is not None and self.conversation.tokenize is not None:
+            # Si hay que tokenizar antes del próximo turno (p. ej. un turno descartado), se recarga entonces
+            self.conversation.tokenize = lambda text: self.require_model().tokenize(text, add_bos_token=False)
+        return model
+
+    def restore_model(self, model):
+        """Vuelve a usar un modelo recargado (mismo tokenizador) con la conversación de antes"""
+        self.model = model
+        self.kv_cache.invalidate()
+        if self.conversation is not None and self.conversation.tokenize is not None:
+            self.conversation.tokenize = lambda text: model.tokenize(text, add_bos_token=False)
+
+    def require_model(self):
+        """El modelo, recargándolo si el gobernador lo había descargado (hilo de inferencia)"""
+        if self.model is None and self.governor is not None:
+            self.governor.ensure_loaded()
+        return self.model
+
+    def warm_up(self, loaded):
+        """Evalúa BOS + sistema para que el primer turno no pague la carga en frío"""
+        prefix = [] if self.model.bos_token_id is None else [self.model.bos_token_id]
+        return model_registry.warm_up(loaded, prefix + self.conversation.system_tokens, cache=self.kv_cache)
+
+    @property
+    def ready(self):
+        return self.conversation is not None
+
+    # --- Turnos ---
+
+    def generate_response(self, user_text, fallback, job=None, record=None):
+        """Añade el turno del usuario a la conversación y genera la respuesta en streaming.
+
+        Se ejecuta en el hilo de inferencia. Devuelve (texto, stats). Solo se
+        evalúan los tokens nuevos del prompt.
+        """
+        # La voz empieza con la primera frase completa, sin esperar al resto
+        speech = None
+        if self.speak and self.synthesizer is not None:
+            speech = self.start_speech_stream(record)
+
+        def on_text(text):
+            if record is not None and record.first_token is None:
+                record.first_token = time.perf_counter()
+            if self.on_token:
+                self.on_token(text)
+            if speech is not None:
+                speech.add_text(text)
+
+        def should_stop():
+            return job is not None and job.cancelled
+
+        try:
+            response, stats = generate_reply(self.model, self.conversation, user_text, on_text=on_text,
+                                             should_stop=should_stop, cache=self.kv_cache,
+                                             temperature=self.temperature, tracer=self.tracer,
+                                             turn=record.id if record is not None else None)
+        except Exception:
+            if speech is not None:
+                speech.cancel()
+            raise
+
+        generated = True
+        if stats.stop_reason == "cancelled":
+            # Interrumpida por un turno más nuevo del usuario: no se sigue hablando
+            if speech is not None:
+                speech.cancel()
+        elif not response:
+            response = fallback
+            generated = False
+            if speech is not None:
+                speech.add_text(fallback)
+
+        if speech is not None:
+            speech.close()
+
+        remember_reply(self.model, self.conversation, response, stats, generated)
+
+        if job is not None and job.queue_wait is not None:
+            print(f"⏱️ Espera en cola: {job.queue_wait:.2f}s")
+        print(stats.summary())
+        return response, stats
+
+    def run_turn(self, record, fallback, job=None):
+        """Ejecuta un turno en el hilo de inferencia"""
+        record.started = time.perf_counter()
+        self.tracer.record("queue", record.queue_wait, record.id, kind=record.kind)
+        try:
+            self.require_model()
+            if record.kind == "voice" and self.on_user_voice:
+                self.on_user_voice(record)
+            if self.on_response_start:
+                self.on_response_start(record)
+            record.response, record.stats = self.generate_response(record.user_text, fallback, job, record)
+            print(f"Respuesta del modelo: '{record.response}'")
+        except Exception as e:
+            print(f"Error en el turno ({record.kind}): {e}")
+            record.status = "error"
+            record.error = str(e)
+            if record.kind == "voice":
+                record.response = f"Error al procesar audio con IA: {str(e)}"
+            else:
+                record.response = f"Error al procesar mensaje: {str(e)}"
+        finally:
+            record.generated = time.perf_counter()
+            if self.on_response:
+                self.on_response(record)
+            self._turn_part_done(record)
+
+    def _turn_part_done(self, record):
+        record.part_done()
+        if record.done.is_set():
+            self._trace_turn(record)
+            if self.on_turn_done:
+                self.on_turn_done(record)
+
+    def _save_turn(self, record):
+        if self.history is None or self.session_id is None:
+            return
+        self.history.add_message(self.session_id, "user", record.shown_text, created=record.created_at,
+                                 prompt_text=record.user_text, turn_id=record.id, kind=record.kind,
+                                 status=record.status, audio_path=record.audio_path)
+        if record.response:
+            stats = record.stats
+            self.history.add_message(
+                self.session_id, "assistant", record.response, turn_id=record.id, kind=record.kind,
+                status=record.status, ttft=record.ttft, ttfa=record.ttfa, end_to_end=record.end_to_end,
+                tokens_per_second=stats.tokens_per_second if stats else None,
+                prompt_tokens=stats.prompt_tokens if stats else None,
+                generated_tokens=stats.generated_tokens if stats else None)
+
+    def _trace_turn(self, record):
+        self._save_turn(record)
+        self.tracer.record("playback_start", record.ttfa, record.id, kind=record.kind)
+        self.tracer.record("turn", record.end_to_end, record.id, kind=record.kind, status=record.status)
+
+    def submit_turn(self, record, fallback, priority):
+        """Encola un turno del usuario en el planificador de inferencia"""
+        def on_drop(job):
+            # El mensaje queda en el historial y en la ventana, pero no en el prompt:
+            # un turno del usuario sin respuesta solo gastaría contexto
+            record.drop()
+            self._trace_turn(record)
+            if self.on_turn_done:
+                self.on_turn_done(record)
+
+        def on_error(job, error):
+            record.status = "error"
+            record.error = str(error)
+            self._turn_part_done(record)
+
+        if self.governor is not None:
+            self.governor.touch(prefetch=True)
+
+        if self.preempt_on_new_turn:
+            # Un turno nuevo también corta la voz de la respuesta anterior
+            self.audio_output.stop()
+
+        job = InferenceJob(lambda job: self.run_turn(record, fallback, job),
+                           priority=priority, kind=record.kind, max_age=self.max_turn_age,
+                           on_drop=on_drop, on_error=on_error)
+        if (self.scheduler.busy or self.scheduler.depth) and self.on_queued:
+            self.on_queued(self.scheduler.depth + 1)
+        record.submitted = time.perf_counter()
+        self.scheduler.submit(job, preempt=self.preempt_on_new_turn)
+        return record
+
+    def submit_text(self, message):
+        """Turno escrito; devuelve su TurnRecord"""
+        return self.submit_turn(TurnRecord("text", message), TEXT_FALLBACK, PRIORITY_TEXT)
+
+    def resume_conversation(self, messages):
+        """Recarga mensajes guardados [(rol, texto), ...] en la conversación (hilo de inferencia)"""
+        def load(job):
+            kept = self.conversation.load(messages)
+            print(f"↩️ Conversación reanudada: {kept} de {len(messages)} mensajes en contexto")
+        self.scheduler.submit(InferenceJob(load, priority=PRIORITY_CONTROL, kind="control"))
+
+    def clear_conversation(self):
+        """Olvida el historial (en el hilo de inferencia, que es su dueño)"""
+        self.scheduler.submit(InferenceJob(lambda job: self.conversation.clear(),
+                                           priority=PRIORITY_CONTROL, kind="control"))
+
+    # --- Entrada de voz ---
+
+    def begin_listening(self, capture):
+        """Prepara una sesión de escucha sobre una captura ya creada"""
+        self.utterance_started = False
+        self.capture = capture
+        self.last_speech_position = capture.position
+        self.capture_seconds = 0.0
+        self.capture_blocks = 0
+        self.cancel_speculation()
+        self.endpointer.reset()
+        self.transcriber.reset()
+        self.transcriber.start()
+
+    def listen(self, capture, is_active):
+        """Bucle de escucha: lee la captura mientras is_active() y envía un turno por frase.
+
+        Devuelve los TurnRecord de voz enviados.
+        """
+        records = []
+        # El stream se abre una vez y sigue capturando entre turnos
+        capture.start()
+        print("🎤 Iniciando escucha en tiempo real...")
+
+        cursor = capture.position
+        while is_active():
+            try:
+                # Vistas (sin copia) del audio nuevo en el buffer circular
+                views, new_cursor = capture.read(cursor, self.chunk)
+                if not views:
+                    continue
+                record = self.process_block(capture, views, new_cursor)
+                cursor = new_cursor
+                if record is not None:
+                    records.append(record)
+            except Exception as e:
+                print(f"Error en captura de audio: {e}")
+                continue
+
+        # Procesar cualquier audio restante
+        if self.utterance_started:
+            record = self.end_utterance()
+            if record is not None:
+                records.append(record)
+
+        if capture.overflows:
+            print(f"⚠️ Desbordes de captura: {capture.overflows}")
+        return records
+
+    def process_block(self, capture, views, cursor):
+        """VAD + transcripción de un bloque nuevo; devuelve un TurnRecord al cerrar una frase"""
+        block_start = cursor - sum(len(view) for view in views)
+        started = time.perf_counter()
+        self.last_cursor = cursor
+
+        # Detectar si hay voz activa (decisión por frame del VAD), sin contar el eco del tutor
+        decisions, energies = [], []
+        for view in views:
+            decisions.append(self.vad.process(view))
+            energies.append(self.vad.last_frame_energy_db)
+        # (los tiempos del supresor de eco se miden en audio capturado, como el silencio)
+        playing, now = self.audio_output.playing, cursor / self.rate
+        user_voice, sustained = self.echo.process(np.concatenate(energies), np.concatenate(decisions),
+                                                  playing, now)
+        # Con el tutor sonando una frase solo empieza con voz sostenida por encima del eco
+        voiced = sustained if self.echo.echo_active(playing, now) and not self.utterance_started else user_voice.any()
+
+        if voiced:
+            self.last_speech_position = cursor
+            self.last_speech_time = started
+            if not self.utterance_started:
+                print(f"🎤 Voz detectada - Ruido de fondo: {self.vad.noise_floor_db:.0f} dB")
+                # Inicio de frase: incluir un poco de audio previo (y el tramo que hizo
+                # falta para confirmar que no era eco)
+                self.utterance_started = True
+                self.interrupted = False
+                if self.governor is not None:
+                    # La recarga (si hace falta) se solapa con la frase del alumno
+                    self.governor.touch(prefetch=True)
+                self.endpointer.reset()
+                self.capture_seconds = 0.0
+                self.capture_blocks = 0
+                preroll = int((self.preroll_seconds + self.echo.run_seconds) * self.rate)
+                self.utterance_start = max(block_start - preroll, capture.ring.oldest)
+                views = capture.ring.views(self.utterance_start, cursor)
+
+        if (sustained and self.barge_in and self.utterance_started and not self.interrupted
+                and (playing or self.scheduler.busy)):
+            self.interrupt()
+
+        if voiced and self.speculation is not None:
+            # El usuario siguió hablando: lo adelantado ya no vale
+            self.cancel_speculation()
+
+        # Transcribir mientras el usuario sigue hablando
+        if self.utterance_started:
+            self.endpointer.observe(user_voice, self.vad.frame_duration)
+            for view in views:
+                self.transcriber.feed(view)
+
+        self.report_noise_floor()
+        if self.on_level:
+            self.on_level(self.vad.last_energy_db)
+        if self.utterance_started:
+            self.capture_seconds += time.perf_counter() - started
+            self.capture_blocks += 1
+
+        # El silencio se mide en audio capturado, no en tiempo de reloj
+        silence_duration = (cursor - self.last_speech_position) / self.rate
+        if not self.utterance_started or voiced:
+            return None
+        threshold = self.silence_threshold
+        if self.adaptive_endpointing:
+            # La transcripción especulada (si ya está) es más reciente que la provisional
+            spec = self.speculation
+            text = spec.text if spec is not None and spec.text else self.transcriber.text
+            threshold = self.endpointer.threshold(text, self.silence_threshold)
+        self.endpoint_threshold = threshold
+        if silence_duration > threshold:
+            print(f"🔇 Silencio detectado ({silence_duration:.1f}s de {threshold:.1f}s) - Procesando audio...")
+            # La captura sigue activa: la siguiente frase no se pierde
+            return self.end_utterance()
+        if (self.speculative_prefill and self.speculation is None and self.transcriber.engine is not None
+                and silence_duration >= min(self.speculate_after, threshold / 2)):
+            self.start_speculation()
+        return None
+
+    def start_speculation(self):
+        """Transcribe lo dicho y evalúa el prompt mientras se confirma el fin de frase"""
+        spec = self.speculation = Speculation(self.last_speech_position)
+        self.speculations += 1
+
+        def prefill(job):
+            if spec.cancelled or self.conversation is None or self.model is None:
+                return
+            started = time.perf_counter()
+            tokens = self.conversation.preview_prompt(voice_user_text(spec.text, spec.fluency))
+            if tokens is None:
+                return
+            evaluated = prefill_prompt(self.model, tokens, self.kv_cache,
+                                       should_stop=lambda: job.cancelled)
+            self.tracer.record("prefill", time.perf_counter() - started, tokens=evaluated,
+                               cancelled=job.cancelled)
+
+        def run():
+            spec.text = self.transcriber.speculate()
+            if spec.text and not spec.cancelled:
+                # Mismo audio que analizará end_utterance si la frase termina aquí
+                spec.fluency = self.analyze_fluency(spec.text, spec.speech_position)
+            spec.done.set()
+            if (not spec.text or spec.cancelled or self.model is None
+                    or getattr(self.model, "remote", False)):
+                return
+            # Como trabajo de control: el turno que lo aprovecha no lo cancela al encolarse
+            spec.job = self.scheduler.submit(InferenceJob(prefill, priority=PRIORITY_CONTROL, kind="prefill"))
+            if spec.cancelled:
+                spec.job.cancel()
+
+        threading.Thread(target=run, name="speculation", daemon=True).start()
+
+    def analyze_fluency(self, transcript, end_position):
+        """Métricas de fluidez de la frase en curso hasta end_position (None si no aplica)"""
+        if not (self.fluency_analysis and transcript and self.capture is not None):
+            return None
+        started = time.perf_counter()
+        audio = self.capture.ring.copy(self.utterance_start, end_position)
+        fluency = analyze_utterance(audio, self.rate, transcript)
+        self.tracer.record("fluency", time.perf_counter() - started, audio_seconds=len(audio) / self.rate)
+        return fluency
+
+    def cancel_speculation(self):
+        if self.speculation is not None:
+            self.speculation.cancel()
+            self.speculation = None
+
+    def interrupt(self):
+        """Barge-in: corta la voz y la generación en curso para escuchar al alumno"""
+        self.interrupted = True
+        self.barge_ins += 1
+        self.audio_output.stop()
+        self.scheduler.cancel_current()
+        # Cuánta voz hizo falta para estar seguros de que no era eco ni un ruido
+        self.tracer.record("barge_in", self.echo.run_seconds)
+        print(f"✋ Interrupción del alumno ({self.echo.run_seconds:.2f}s de voz)")
+        if self.on_barge_in:
+            self.on_barge_in()
+
+    def end_utterance(self):
+        """Cierra la frase en curso y envía el turno de voz (o None si no hubo texto)"""
+        if not self.utterance_started:
+            return None
+        self.utterance_started = False
+        started = time.perf_counter()
+        endpoint = started - self.last_speech_time if self.last_speech_time else None
+
+        print("🎧 Procesando audio en tiempo real...")
+
+        # La mayor parte ya se transcribió mientras el usuario hablaba: aquí solo se
+        # decodifica la cola pendiente, o nada si la especulación cubre toda la frase
+        spec, self.speculation = self.speculation, None
+        speculative = False
+        if spec is not None and spec.speech_position == self.last_speech_position:
+            spec.done.wait()
+            speculative = spec.text is not None
+        if speculative:
+            transcript, fluency = spec.text, spec.fluency
+            self.speculation_hits += 1
+            self.transcriber.reset()
+        else:
+            if spec is not None:
+                spec.cancel()
+            transcript = self.transcriber.finish()
+        transcription = time.perf_counter() - started
+        if not speculative:
+            fluency = self.analyze_fluency(transcript, self.last_speech_position)
+
+        if self.transcriber.engine is None:
+            # Sin motor de reconocimiento: el modelo solo sabe que hubo voz
+            record = TurnRecord("voice", AUDIO_USER_PLACEHOLDER, "[Audio procesado en tiempo real]")
+        elif transcript:
+            print(f"📝 Transcripción: '{transcript}'")
+            record = TurnRecord("voice", voice_user_text(transcript, fluency), transcript)
+            record.speculative = speculative
+            record.fluency = fluency
+        else:
+            print("🔇 No se reconoció ninguna frase")
+            record = None
+
+        turn = record.id if record is not None else None
+        self.tracer.record("capture", self.capture_seconds, turn, blocks=self.capture_blocks)
+        self.tracer.record("endpoint", endpoint, turn, silence_threshold=self.endpoint_threshold)
+        self.tracer.record("transcription", transcription, turn, chars=len(transcript or ""),
+                           speculative=speculative)
+        if record is None:
+            return None
+
+        if self.history is not None and self.audio_dir and self.capture is not None:
+            # La frase se copia ahora (el buffer circular se sobrescribe) y se escribe en segundo plano
+            record.audio_path = os.path.join(self.audio_dir, f"{self.session_id}_{record.id}.wav")
+            self.history.save_audio(record.audio_path,
+                                    self.capture.ring.copy(self.utterance_start, self.last_cursor), self.rate)
+
+        # El turno cuenta desde el fin de la frase, incluida la transcripción final
+        record.created = started
+        # Los turnos de voz pasan delante de los de texto
+        return self.submit_turn(record, AUDIO_FALLBACK, PRIORITY_VOICE)
+
+    def _on_partial_transcript(self, text):
+        if self.on_partial:
+            self.on_partial(text)
+
+    def report_noise_floor(self):
+        """Avisa del piso de ruido estimado (como mucho una vez por segundo)"""
+        now = time.time()
+        if now - self.last_noise_report < 1.0 or self.vad.noise_floor_db is None:
+            return
+        self.last_noise_report = now
+        if self.on_noise_floor:
+            self.on_noise_floor(self.vad.noise_floor_db)
+
+    # --- Salida de voz ---
+
+    def set_synthesizer(self, engine):
+        """Usa un motor de TTS (a través de la caché de audio)"""
+        self.synthesizer = CachedSynthesizer(engine, self.tts_cache)
+
+    def start_speech_stream(self, record=None):
+        """Crea un stream de voz y lo encola en el servicio de reproducción.
+
+        La síntesis es por frases y en memoria; el audio sale en orden
+        detrás de lo que ya esté sonando.
+        """
+        synthesizer, speed = self.synthesizer, self.tts_speed
+        if record is not None:
+            record.expect_speech()
+
+        def finished(stream):
+            if record is not None:
+                record.first_audio = stream.first_audio_time
+                self._turn_part_done(record)
+            if self.on_speech_finished:
+                self.on_speech_finished(stream)
+
+        turn = record.id if record is not None else None
+
+        async def synthesize(sentence):
+            with self.tracer.span("tts_synthesis", turn, chars=len(sentence), engine=synthesizer.name):
+                return await synthesizer.synthesize(sentence, speed)
+
+        # Las frases repetidas salen de la caché sin volver a sintetizarse
+        stream = SpeechStream(synthesize, loop=self.audio_output.loop, on_finished=finished)
+        return self.audio_output.submit(stream)
+
+    def speak_text(self, text):
+        """Lee un texto completo en voz alta (no bloquea: se encola en el servicio de audio)"""
+        speech = self.start_speech_stream()
+        speech.add_text(text)
+        speech.close()
+        return speech
+
+    def stop_speaking(self):
+        """Corta la voz actual y descarta la que estaba en espera"""
+        self.audio_output.stop()
+
+    def prewarm_tts(self, phrases):
+        """Sintetiza por adelantado frases fijas (bloquea: llamar desde un hilo de trabajo)"""
+        sentences = [sentence for phrase in phrases for sentence in speech_sentences(phrase)]
+        try:
+            warmed = asyncio.run(self.synthesizer.prewarm(sentences, self.tts_speed))
+            if warmed:
+                print(f"🗃️ Caché TTS precalentada: {warmed} frases")
+        except Exception as e:
+            print(f"⚠️ No se pudo precalentar la caché de TTS: {e}")
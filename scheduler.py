@@ -0,0 +1,211 @@
+"""Planificador de inferencia: un único hilo ejecuta todos los trabajos del modelo"""
+import itertools
+import queue
+import threading
+import time
+
+# Menor número = mayor prioridad
+PRIORITY_CONTROL = 0
+PRIORITY_VOICE = 1
+PRIORITY_TEXT = 2
+
+
+class InferenceJob:
+    """Trabajo para el hilo de inferencia.
+
+    run(job) se ejecuta en el hilo del planificador y debe consultar
+    job.cancelled para abortar la generación cuanto antes. on_drop(job)
+    se llama (también en ese hilo) si el trabajo se descarta sin ejecutarse.
+    group agrupa trabajos que comparten contexto en el modelo (p. ej. la
+    sesión de un alumno) para el planificador con afinidad.
+    """
+
+    def __init__(self, run, priority=PRIORITY_TEXT, kind="text", max_age=None,
+                 on_done=None, on_drop=None, on_error=None, group=None):
+        self.run = run
+        self.priority = priority
+        self.kind = kind
+        self.group = group
+        self.sequence = None
+        self.max_age = max_age
+        self.on_done = on_done
+        self.on_drop = on_drop
+        self.on_error = on_error
+        self.created = time.monotonic()
+        self.started = None
+        self.finished = None
+        self._cancel_event = threading.Event()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def is_stale(self, now=None):
+        if self.max_age is None:
+            return False
+        return ((now or time.monotonic()) - self.created) > self.max_age
+
+    @property
+    def queue_wait(self):
+        if self.started is None:
+            return None
+        return self.started - self.created
+
+
+class InferenceScheduler:
+    """Serializa el acceso al modelo desde una cola con prioridades.
+
+    Los turnos de voz pasan delante de los de texto; un turno nuevo puede
+    cancelar la generación en curso y descartar los pendientes para que la
+    latencia no crezca cuando se escribe y se habla a la vez.
+
+    Con affinity > 0, entre trabajos de la misma prioridad se adelantan
+    los del mismo group que el último ejecutado (su prefijo sigue en el
+    contexto del modelo), como mucho affinity seguidos para no dejar
+    esperando a los demás.
+    """
+
+    def __init__(self, name="inference", affinity=0):
+        self.queue = queue.PriorityQueue()
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+        self.pending = []
+        self.current = None
+        self.running = False
+        self.name = name
+        self.affinity = affinity
+        self.last_group = None
+        self.streak = 0
+        self.thread = None
+        self.completed = 0
+        self.dropped = 0
+        self.cancelled = 0
+
+    def start(self):
+        """Arranca el hilo de inferencia"""
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._worker, name=self.name, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Cancela todo y detiene el hilo"""
+        self.running = False
+        self.cancel_all()
+        self.queue.put((-1, next(self.counter), None))
+
+    def submit(self, job, preempt=False):
+        """Encola un trabajo.
+
+        Con preempt=True se cancela la generación en curso y se descartan
+        los turnos pendientes de igual o menor prioridad.
+        """
+        with self.lock:
+            if preempt:
+                if self.current is not None and self.current.priority >= job.priority:
+                    self.current.cancel()
+                for other in self.pending:
+                    if other.priority >= job.priority:
+                        other.cancel()
+            self.pending.append(job)
+            job.sequence = next(self.counter)
+        self.queue.put((job.priority, job.sequence, job))
+        return job
+
+    def cancel_current(self):
+        """Aborta la generación en curso (si la hay)"""
+        with self.lock:
+            if self.current is not None:
+                self.current.cancel()
+
+    def cancel_all(self):
+        """Aborta la generación en curso y descarta los pendientes"""
+        with self.lock:
+            if self.current is not None:
+                self.current.cancel()
+            for job in self.pending:
+                job.cancel()
+
+    @property
+    def depth(self):
+        """Trabajos en espera"""
+        with self.lock:
+            return len(self.pending)
+
+    @property
+    def busy(self):
+        with self.lock:
+            return self.current is not None
+
+    def _worker(self):
+        while self.running:
+            _, _, job = self.queue.get()
+            if job is None:
+                break
+
+            with self.lock:
+                if job not in self.pending:
+                    # Ya se ejecutó antes de su turno por afinidad
+                    continue
+                job = self._affine(job)
+                self.pending.remove(job)
+                if job.cancelled or job.is_stale():
+                    skip = True
+                else:
+                    skip = False
+                    self.current = job
+
+            if skip:
+                self.dropped += 1
+                print(f"🗑️ Trabajo {job.kind} descartado "
+                      f"({time.monotonic() - job.created:.1f}s en cola)")
+                self._callback(job.on_drop, job)
+                continue
+
+            job.started = time.monotonic()
+            try:
+                result = job.run(job)
+            except Exception as e:
+                print(f"Error en trabajo de inferencia: {e}")
+                self._callback(job.on_error, job, e)
+            else:
+                self._callback(job.on_done, job, result)
+            finally:
+                job.finished = time.monotonic()
+                if job.cancelled:
+                    self.cancelled += 1
+                else:
+                    self.completed += 1
+                with self.lock:
+                    self.current = None
+
+    def _affine(self, job):
+        """El trabajo a ejecutar en lugar de job (con el lock tomado)"""
+        if self.affinity and job.group is not None:
+            if (self.last_group is not None and job.group != self.last_group
+                    and self.streak < self.affinity):
+                for other in self.pending:
+                    # pending está en orden de llegada: el primero es el más antiguo
+                    if (other.group == self.last_group and other.priority == job.priority
+                            and not other.cancelled):
+                        self.queue.put((job.priority, job.sequence, job))
+                        job = other
+                        break
+            if job.group == self.last_group:
+                self.streak += 1
+            else:
+                self.last_group = job.group
+                self.streak = 1
+        return job
+
+    def _callback(self, callback, *args):
+        if callback is None:
+            return
+        try:
+            callback(*args)
+        except Exception as e:
+            print(f"Error en callback de inferencia: {e}")
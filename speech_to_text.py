@@ -0,0 +1,240 @@
+"""Reconocimiento de voz local e incremental (sin red, solo CPU)"""
+import threading
+import time
+
+import numpy as np
+
+
+class Segment:
+    """Fragmento reconocido con tiempos relativos al audio decodificado"""
+
+    def __init__(self, start, end, text):
+        self.start = start
+        self.end = end
+        self.text = text
+
+
+class ASREngine:
+    """Interfaz de los motores de reconocimiento.
+
+    transcribe recibe audio float32 mono en [-1, 1] y devuelve una lista
+    de Segment.
+    """
+
+    name = "asr"
+
+    def transcribe(self, audio, sample_rate=16000):
+        raise NotImplementedError
+
+
+class WhisperEngine(ASREngine):
+    """Whisper local mediante faster-whisper (CTranslate2, int8 en CPU)"""
+
+    name = "whisper"
+
+    def __init__(self, model="base.en", language="en", threads=0):
+        from faster_whisper import WhisperModel
+
+        # local_files_only: nunca intentar descargar nada
+        self.model = WhisperModel(model, device="cpu", compute_type="int8",
+                                  cpu_threads=threads, local_files_only=True)
+        self.language = language
+
+    def transcribe(self, audio, sample_rate=16000):
+        segments, _ = self.model.transcribe(
+            audio, language=self.language, beam_size=1,
+            condition_on_previous_text=False, vad_filter=False)
+        return [Segment(s.start, s.end, s.text.strip()) for s in segments]
+
+
+class StubEngine(ASREngine):
+    """Motor determinista para pruebas: emite palabras según la duración del audio"""
+
+    name = "stub"
+
+    def __init__(self, text="hello this is a test of the speech pipeline", words_per_second=2.5,
+                 delay=0.0):
+        self.words = text.split()
+        self.words_per_second = words_per_second
+        self.delay = delay
+
+    def transcribe(self, audio, sample_rate=16000):
+        if self.delay:
+            time.sleep(self.delay)
+        duration = len(audio) / sample_rate
+        count = int(duration * self.words_per_second)
+        step = 1.0 / self.words_per_second
+        return [Segment(i * step, (i + 1) * step, self.words[i % len(self.words)])
+                for i in range(count)]
+
+
+def create_asr_engine(name="whisper", **kwargs):
+    """Crea el motor indicado; devuelve None si no está disponible"""
+    try:
+        if name == "whisper":
+            return WhisperEngine(**kwargs)
+        if name == "stub":
+            return StubEngine(**kwargs)
+        print(f"Motor de reconocimiento desconocido: {name}")
+    except ImportError:
+        print("⚠️ faster-whisper no está instalado: sin transcripción de voz")
+    except Exception as e:
+        print(f"⚠️ No se pudo cargar el motor de reconocimiento: {e}")
+    return None
+
+
+def pcm16_to_float(data):
+    """Convierte bytes/array int16 a float32 normalizado"""
+    samples = np.frombuffer(data, dtype=np.int16) if isinstance(data, (bytes, bytearray)) else data
+    return samples.astype(np.float32) / 32768.0
+
+
+class StreamingTranscriber:
+    """Transcribe la frase mientras el usuario todavía está hablando.
+
+    Un hilo decodifica periódicamente el audio aún no confirmado; los
+    segmentos que terminan lo bastante antes del final se dan por
+    definitivos y se descartan del buffer. Al detectar el fin de frase
+    solo queda decodificar la cola corta pendiente.
+    """
+
+    def __init__(self, engine, sample_rate=16000, partial_interval=1.0, commit_margin=1.5,
+                 on_partial=None):
+        self.engine = engine
+        self.sample_rate = sample_rate
+        self.partial_interval = partial_interval
+        self.commit_margin = commit_margin
+        self.on_partial = on_partial
+        self.condition = threading.Condition()
+        self.decode_lock = threading.Lock()
+        self.thread = None
+        self.running = False
+        self.reset()
+
+    def reset(self):
+        """Empieza una frase nueva"""
+        with self.condition:
+            self.chunks = []
+            self.new_samples = 0
+            self.committed = []
+            self.tentative = ""
+            self.active = False
+
+    def start(self):
+        """Arranca el hilo de decodificación parcial"""
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._worker, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        with self.condition:
+            self.condition.notify_all()
+
+    def feed(self, data):
+        """Añade audio int16 (bytes o array) de la frase en curso"""
+        samples = pcm16_to_float(data)
+        with self.condition:
+            self.chunks.append(samples)
+            self.new_samples += len(samples)
+            self.active = True
+            if self.new_samples >= self.partial_interval * self.sample_rate:
+                self.condition.notify()
+
+    @property
+    def text(self):
+        """Transcripción provisional (confirmada + tentativa)"""
+        with self.condition:
+            return " ".join(self.committed + ([self.tentative] if self.tentative else []))
+
+    def finish(self):
+        """Cierra la frase y devuelve la transcripción final"""
+        with self.condition:
+            self.active = False
+        # Esperar a que termine una decodificación parcial en curso
+        with self.decode_lock:
+            self._decode(final=True)
+        with self.condition:
+            text = " ".join(self.committed).strip()
+        self.reset()
+        return text
+
+    def speculate(self):
+        """Transcripción final anticipada de lo dicho hasta ahora, sin cerrar la frase.
+
+        Decodifica el audio pendiente como lo haría finish() pero no
+        confirma nada: si el usuario sigue hablando la frase continúa igual.
+        """
+        with self.decode_lock:
+            with self.condition:
+                committed = list(self.committed)
+                if not self.chunks or self.engine is None:
+                    return " ".join(committed).strip()
+                audio = np.concatenate(self.chunks) if len(self.chunks) > 1 else self.chunks[0]
+                self.chunks = [audio]
+            try:
+                segments = self.engine.transcribe(audio, self.sample_rate)
+            except Exception as e:
+                print(f"Error en transcripción: {e}")
+                return None
+        return " ".join(committed + [s.text for s in segments if s.text]).strip()
+
+    def _worker(self):
+        while self.running:
+            with self.condition:
+                while self.running and not (
+                        self.active and self.new_samples >= self.partial_interval * self.sample_rate):
+                    self.condition.wait(timeout=0.5)
+                if not self.running:
+                    break
+                self.new_samples = 0
+            with self.decode_lock:
+                if self.active:
+                    self._decode(final=False)
+
+    def _decode(self, final):
+        with self.condition:
+            if not self.chunks:
+                return
+            audio = np.concatenate(self.chunks) if len(self.chunks) > 1 else self.chunks[0]
+            self.chunks = [audio]
+
+        if self.engine is None:
+            return
+        try:
+            segments = self.engine.transcribe(audio, self.sample_rate)
+        except Exception as e:
+            print(f"Error en transcripción: {e}")
+            return
+
+        duration = len(audio) / self.sample_rate
+        with self.condition:
+            if final:
+                self.committed.extend(s.text for s in segments if s.text)
+                self.chunks = []
+                self.tentative = ""
+                return
+
+            # Confirmar los segmentos que ya no pueden cambiar y recortar el buffer
+            cut = 0.0
+            tentative = []
+            for segment in segments:
+                if segment.end <= duration - self.commit_margin:
+                    if segment.text:
+                        self.committed.append(segment.text)
+                    cut = segment.end
+                else:
+                    tentative.append(segment.text)
+            self.tentative = " ".join(t for t in tentative if t)
+
+            if cut > 0:
+                cut_samples = int(cut * self.sample_rate)
+                # Se conserva el audio que llegó durante la decodificación
+                merged = np.concatenate(self.chunks) if len(self.chunks) > 1 else self.chunks[0]
+                self.chunks = [merged[cut_samples:]]
+            partial = " ".join(self.committed + ([self.tentative] if self.tentative else []))
+
+        if self.on_partial and partial:
+            self.on_partial(partial)
@@ -0,0 +1,79 @@
+"""Perfil de arranque: cuánto tarda cada subsistema y cuándo se pudo usar la ventana.
+
+Este módulo no importa nada pesado: se importa el primero para que el
+origen del perfil sea el comienzo real del programa.
+"""
+import threading
+import time
+
+# Instante en que se importó este módulo (el comienzo del arranque si se importa el primero)
+IMPORTED_AT = time.perf_counter()
+
+
+class StartupProfile:
+    """Hitos y spans del arranque medidos desde el origen (perf_counter).
+
+    Los hitos marcan momentos (primer frame de la ventana); los spans,
+    trabajos con duración (imports, dispositivo de audio, carga del
+    modelo, calentamiento), que pueden solaparse si corren en paralelo.
+    """
+
+    def __init__(self, origin=None):
+        self.origin = time.perf_counter() if origin is None else origin
+        self.lock = threading.Lock()
+        self.milestones = {}
+        self.spans = []
+
+    def elapsed(self):
+        return time.perf_counter() - self.origin
+
+    def mark(self, name):
+        """Registra un hito (la primera vez que ocurre)"""
+        with self.lock:
+            self.milestones.setdefault(name, self.elapsed())
+
+    def record(self, name, start, end=None, **attrs):
+        """Añade un span entre dos instantes perf_counter"""
+        end = time.perf_counter() if end is None else end
+        with self.lock:
+            self.spans.append({"name": name, "start": start - self.origin, "end": end - self.origin,
+                               "thread": threading.current_thread().name, **attrs})
+
+    def span(self, name, **attrs):
+        """Context manager que mide el bloque como span"""
+        return _StartupSpan(self, name, attrs)
+
+    def to_dict(self):
+        with self.lock:
+            return {"milestones": dict(self.milestones), "spans": [dict(span) for span in self.spans]}
+
+    def report_lines(self):
+        """Spans en orden de inicio (inicio → fin, duración) y los hitos al final"""
+        data = self.to_dict()
+        lines = []
+        for span in sorted(data["spans"], key=lambda s: s["start"]):
+            duration = span["end"] - span["start"]
+            error = f" ⚠️ {span['error']}" if span.get("error") else ""
+            lines.append(f"{span['name']:16s} {span['start'] * 1000:7.0f} → {span['end'] * 1000:7.0f} ms "
+                         f"({duration * 1000:6.0f} ms, {span['thread']}){error}")
+        for name, moment in sorted(data["milestones"].items(), key=lambda item: item[1]):
+            lines.append(f"{name:16s} {moment * 1000:7.0f} ms")
+        return lines
+
+
+class _StartupSpan:
+    def __init__(self, profile, name, attrs):
+        self.profile = profile
+        self.name = name
+        self.attrs = attrs
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.profile.record(self.name, self.start, **self.attrs)
+        return False
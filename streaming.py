@@ -0,0 +1,229 @@
+"""Generación en streaming: entrega tokens a medida que salen del modelo"""
+import codecs
+import time
+
+# Secuencias ChatML que marcan el fin del turno del asistente
+STOP_SEQUENCES = ["<|im_end|>", "<|im_start|>"]
+
+
+class StopSequenceFilter:
+    """Detecta secuencias de parada en texto que llega por fragmentos.
+
+    Retiene la cola que podría ser el comienzo de un stop, así nunca se
+    muestra un "<|im_" a medias en el chat.
+    """
+
+    def __init__(self, stops=None):
+        self.stops = list(stops or STOP_SEQUENCES)
+        self.pending = ""
+        self.stopped = False
+
+    def feed(self, text):
+        """Añade texto y devuelve la parte que ya es seguro mostrar"""
+        if self.stopped:
+            return ""
+        self.pending += text
+
+        # ¿Apareció algún stop completo?
+        cut = -1
+        for stop in self.stops:
+            idx = self.pending.find(stop)
+            if idx != -1 and (cut == -1 or idx < cut):
+                cut = idx
+        if cut != -1:
+            safe = self.pending[:cut]
+            self.pending = ""
+            self.stopped = True
+            return safe
+
+        # Retener el sufijo más largo que sea prefijo de algún stop
+        hold = 0
+        for stop in self.stops:
+            for n in range(min(len(stop) - 1, len(self.pending)), 0, -1):
+                if self.pending.endswith(stop[:n]):
+                    hold = max(hold, n)
+                    break
+        safe = self.pending[:len(self.pending) - hold]
+        self.pending = self.pending[len(self.pending) - hold:]
+        return safe
+
+    def flush(self):
+        """Devuelve lo retenido al terminar la generación"""
+        if self.stopped:
+            return ""
+        rest, self.pending = self.pending, ""
+        return rest
+
+
+class GenerationStats:
+    """Métricas de un turno: tiempo al primer token y tokens/seg"""
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.first_token_time = None
+        self.end_time = None
+        self.prompt_tokens = 0
+        self.evaluated_prompt_tokens = 0
+        self.generated_tokens = 0
+        self.output_tokens = []
+        self.stop_reason = None
+
+    def mark_token(self):
+        now = time.perf_counter()
+        if self.first_token_time is None:
+            self.first_token_time = now
+        self.generated_tokens += 1
+
+    def finish(self):
+        self.end_time = time.perf_counter()
+
+    @property
+    def time_to_first_token(self):
+        if self.first_token_time is None:
+            return None
+        return self.first_token_time - self.start_time
+
+    @property
+    def tokens_per_second(self):
+        # Velocidad de decodificación, sin contar la evaluación del prompt
+        if self.first_token_time is None or self.generated_tokens < 2:
+            return 0.0
+        end = self.end_time or time.perf_counter()
+        elapsed = end - self.first_token_time
+        if elapsed <= 0:
+            return 0.0
+        return (self.generated_tokens - 1) / elapsed
+
+    def summary(self):
+        ttft = self.time_to_first_token
+        ttft_text = f"{ttft:.2f}s" if ttft is not None else "-"
+        return (f"⚡ Primer token: {ttft_text} · {self.tokens_per_second:.1f} tok/s "
+                f"· {self.generated_tokens} tokens "
+                f"· prompt {self.evaluated_prompt_tokens}/{self.prompt_tokens} evaluados")
+
+
+class PromptCache:
+    """Refleja los tokens que el modelo tiene evaluados en su contexto (KV cache).
+
+    Si el nuevo prompt empieza por esos tokens solo se evalúa la parte nueva.
+    """
+
+    def __init__(self):
+        self.tokens = []
+        self.valid = False
+
+    def plan(self, prompt_tokens):
+        """Devuelve (reset, tokens_a_evaluar) para el prompt dado"""
+        cached = len(self.tokens)
+        if (self.valid and 0 < cached < len(prompt_tokens)
+                and prompt_tokens[:cached] == self.tokens):
+            return False, prompt_tokens[cached:]
+        return True, list(prompt_tokens)
+
+    def update(self, tokens):
+        self.tokens = list(tokens)
+        self.valid = True
+
+    def invalidate(self):
+        self.tokens = []
+        self.valid = False
+
+
+def stream_generate(model, prompt, on_text=None, max_new_tokens=200, temperature=0.7,
+                    stop=None, should_stop=None, cache=None):
+    """Genera una respuesta token a token llamando a on_text con cada fragmento visible.
+
+    prompt puede ser texto o una lista de tokens. Con un PromptCache se
+    reutiliza el prefijo ya evaluado. Devuelve (texto, stats).
+    should_stop permite abortar la generación desde fuera.
+    """
+    stats = GenerationStats()
+    stop_filter = StopSequenceFilter(stop)
+    # Los tokens pueden partir caracteres UTF-8 multibyte
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    parts = []
+
+    tokens = model.tokenize(prompt) if isinstance(prompt, str) else list(prompt)
+    reset, feed = (True, tokens) if cache is None else cache.plan(tokens)
+    stats.prompt_tokens = len(tokens)
+    stats.evaluated_prompt_tokens = len(feed)
+
+    def emit(text):
+        if text:
+            parts.append(text)
+            if on_text:
+                on_text(text)
+
+    generated = stats.output_tokens
+    try:
+        for token in model.generate(feed, temperature=temperature, reset=reset):
+            generated.append(token)
+            stats.mark_token()
+            emit(stop_filter.feed(decoder.decode(model.detokenize([token], decode=False))))
+            if stop_filter.stopped:
+                stats.stop_reason = "stop"
+                break
+            if stats.generated_tokens >= max_new_tokens:
+                stats.stop_reason = "length"
+                break
+            if should_stop and should_stop():
+                stats.stop_reason = "cancelled"
+                break
+        else:
+            # El generador terminó por EOS: ese token también quedó evaluado
+            stats.stop_reason = "eos"
+            eos = getattr(model, "eos_token_id", None)
+            if eos is not None:
+                generated.append(eos)
+        emit(stop_filter.feed(decoder.decode(b"", final=True)))
+        emit(stop_filter.flush())
+    except Exception:
+        if cache is not None:
+            cache.invalidate()
+        raise
+    finally:
+        stats.finish()
+
+    if cache is not None:
+        cache.update(tokens + generated)
+    return "".join(parts), stats
+
+
+def prefill_prompt(model, tokens, cache, should_stop=None, batch_size=64):
+    """Evalúa por adelantado el prompt (menos su último token) sin generar nada.
+
+    Sirve para adelantar la evaluación mientras se confirma el fin de
+    frase: si después llega exactamente este prompt, stream_generate solo
+    tiene que evaluar el último token. Se evalúa por lotes para poder
+    abandonar (should_stop) si el usuario sigue hablando; lo evaluado
+    hasta entonces queda en el PromptCache. Devuelve los tokens evaluados.
+    """
+    target = list(tokens[:-1])
+    if not target or cache.tokens == target:
+        return 0
+    reset, feed = cache.plan(target)
+    base = len(target) - len(feed)
+    if reset:
+        if hasattr(model, "prepare_inputs_for_generation"):
+            # ctransformers recorta su contexto al prefijo común y devuelve el resto
+            # (siempre deja al menos un token: el último, que aquí no se evalúa)
+            feed = list(model.prepare_inputs_for_generation(list(tokens), reset=True))[:-1]
+            base = len(target) - len(feed)
+        else:
+            model.reset()
+            base = 0
+            feed = target
+
+    evaluated = 0
+    try:
+        for start in range(0, len(feed), batch_size):
+            if should_stop and should_stop():
+                break
+            chunk = feed[start:start + batch_size]
+            model.eval(chunk)
+            evaluated += len(chunk)
+    except Exception:
+        cache.invalidate()
+        raise
+    cache.update(target[:base + evaluated])
+    return evaluated
@@ -0,0 +1,291 @@
+"""Motores de síntesis de voz intercambiables que devuelven PCM en memoria"""
+import asyncio
+import io
+import time
+import wave
+from collections import deque
+
+import numpy as np
+
+from tts import synthesize_edge, edge_rate_string
+from tts_cache import cache_key
+
+
+class AudioClip:
+    """Audio PCM int16 en memoria, con el motor y la voz que lo generaron"""
+
+    def __init__(self, pcm, sample_rate, channels=1, engine=None, voice=None):
+        self.pcm = pcm
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.engine = engine
+        self.voice = voice
+
+    def __len__(self):
+        return len(self.pcm)
+
+    @property
+    def duration(self):
+        return len(self.pcm) / (2 * self.channels * self.sample_rate)
+
+    def samples(self):
+        return np.frombuffer(self.pcm, dtype=np.int16)
+
+    def to_wav(self):
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as wav:
+            wav.setnchannels(self.channels)
+            wav.setsampwidth(2)
+            wav.setframerate(self.sample_rate)
+            wav.writeframes(self.pcm)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_wav(cls, data):
+        with wave.open(io.BytesIO(data), "rb") as wav:
+            return cls(wav.readframes(wav.getnframes()), wav.getframerate(), wav.getnchannels())
+
+
+class SynthesizerMetrics:
+    """Latencias recientes de un motor de síntesis"""
+
+    def __init__(self, window=100):
+        self.latencies = deque(maxlen=window)
+        self.requests = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.audio_seconds = 0.0
+
+    def record(self, latency, clip):
+        self.requests += 1
+        self.latencies.append(latency)
+        self.audio_seconds += clip.duration
+
+    def percentile(self, q):
+        if not self.latencies:
+            return None
+        return float(np.percentile(np.fromiter(self.latencies, dtype=float), q))
+
+    def summary(self, name):
+        if not self.latencies:
+            return f"{name}: sin datos (errores {self.errors}, timeouts {self.timeouts})"
+        return (f"{name}: {self.requests} frases · p50 {self.percentile(50):.2f}s · "
+                f"p95 {self.percentile(95):.2f}s · errores {self.errors} · timeouts {self.timeouts}")
+
+
+class Synthesizer:
+    """Interfaz común: synthesize(texto, velocidad) -> AudioClip"""
+
+    name = "tts"
+    voice = ""
+
+    def __init__(self):
+        self.metrics = SynthesizerMetrics()
+
+    async def synthesize(self, text, speed=1.0):
+        start = time.perf_counter()
+        try:
+            clip = await self._synthesize(text, speed)
+        except Exception:
+            self.metrics.errors += 1
+            raise
+        self.metrics.record(time.perf_counter() - start, clip)
+        if clip.engine is None:
+            # Un motor compuesto deja la marca del motor interno que respondió
+            clip.engine, clip.voice = self.name, self.voice
+        return clip
+
+    async def _synthesize(self, text, speed):
+        raise NotImplementedError
+
+    def cache_sources(self):
+        """(motor, voz) cuyo audio en caché sirve ahora, por orden de preferencia"""
+        return [(self.name, self.voice)]
+
+    def metrics_summary(self):
+        return self.metrics.summary(self.name)
+
+
+def decode_mp3(data):
+    """Decodifica MP3 a PCM con el mixer de pygame (en el formato del mixer)"""
+    import pygame
+
+    if not pygame.mixer.get_init():
+        pygame.mixer.init(frequency=24000, size=-16, channels=1)
+    frequency, _, channels = pygame.mixer.get_init()
+    sound = pygame.mixer.Sound(file=io.BytesIO(data))
+    return AudioClip(sound.get_raw(), frequency, channels)
+
+
+class EdgeSynthesizer(Synthesizer):
+    """Edge TTS (voces neuronales en la nube, requiere red)"""
+
+    name = "edge"
+
+    def __init__(self, voice="en-US-AriaNeural"):
+        super().__init__()
+        self.voice = voice
+
+    async def _synthesize(self, text, speed):
+        mp3 = await synthesize_edge(text, self.voice, edge_rate_string(speed))
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, decode_mp3, mp3)
+
+
+class PiperSynthesizer(Synthesizer):
+    """Piper: síntesis neuronal local en CPU, sin red"""
+
+    name = "piper"
+
+    def __init__(self, model_path="en_US-lessac-medium.onnx"):
+        super().__init__()
+        from piper.voice import PiperVoice
+
+        self.piper = PiperVoice.load(model_path)
+        self.voice = model_path
+        self.sample_rate = self.piper.config.sample_rate
+
+    def _synthesize_blocking(self, text, speed):
+        # length_scale > 1 habla más lento
+        pcm = b"".join(self.piper.synthesize_stream_raw(text, length_scale=1.0 / speed))
+        return AudioClip(pcm, self.sample_rate)
+
+    async def _synthesize(self, text, speed):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._synthesize_blocking, text, speed)
+
+
+class StubSynthesizer(Synthesizer):
+    """Motor determinista para pruebas: silencio con duración proporcional al texto"""
+
+    name = "stub"
+    voice = "stub"
+
+    def __init__(self, sample_rate=24000, seconds_per_char=0.06, delay=0.0):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.seconds_per_char = seconds_per_char
+        self.delay = delay
+
+    async def _synthesize(self, text, speed):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        samples = int(len(text) * self.seconds_per_char / speed * self.sample_rate)
+        return AudioClip(bytes(2 * samples), self.sample_rate)
+
+
+class FallbackSynthesizer(Synthesizer):
+    """Usa el motor principal y cae al secundario si falla o tarda demasiado.
+
+    Tras un fallo el principal se evita durante cooldown segundos para no
+    pagar el timeout en cada frase mientras no haya red.
+    """
+
+    def __init__(self, primary, fallback, timeout=2.5, cooldown=60.0):
+        super().__init__()
+        self.primary = primary
+        self.fallback = fallback
+        self.timeout = timeout
+        self.cooldown = cooldown
+        self.primary_blocked_until = 0.0
+        self.name = f"{primary.name}→{fallback.name}"
+        self.voice = primary.voice
+
+    async def _synthesize(self, text, speed):
+        if time.monotonic() >= self.primary_blocked_until:
+            try:
+                return await asyncio.wait_for(self.primary.synthesize(text, speed), self.timeout)
+            except asyncio.TimeoutError:
+                self.primary.metrics.timeouts += 1
+                print(f"⚠️ {self.primary.name} tardó más de {self.timeout:.1f}s: usando {self.fallback.name}")
+            except Exception as e:
+                print(f"⚠️ {self.primary.name} no disponible ({e}): usando {self.fallback.name}")
+            self.primary_blocked_until = time.monotonic() + self.cooldown
+        return await self.fallback.synthesize(text, speed)
+
+    def cache_sources(self):
+        # Mientras se evita el principal también vale el audio del secundario;
+        # con el principal disponible solo se reutiliza su voz
+        sources = self.primary.cache_sources()
+        if time.monotonic() < self.primary_blocked_until:
+            sources = sources + self.fallback.cache_sources()
+        return sources
+
+    def metrics_summary(self):
+        return f"{self.primary.metrics_summary()} | {self.fallback.metrics_summary()}"
+
+
+class CachedSynthesizer(Synthesizer):
+    """Envuelve un motor con la caché de audio (clave: texto, motor, voz, velocidad).
+
+    La clave es la del motor que generó cada clip: con FallbackSynthesizer
+    el audio del respaldo no se confunde con el del principal.
+    """
+
+    def __init__(self, inner, cache):
+        super().__init__()
+        self.inner = inner
+        self.cache = cache
+        self.name = inner.name
+        self.voice = inner.voice
+
+    def key(self, text, speed, engine, voice):
+        return cache_key(text, engine, voice, f"{speed:.2f}")
+
+    async def synthesize(self, text, speed=1.0):
+        # Sin métricas propias: solo cuentan las síntesis reales del motor
+        for engine, voice in self.inner.cache_sources():
+            data = self.cache.get(self.key(text, speed, engine, voice))
+            if data is not None:
+                clip = AudioClip.from_wav(data)
+                clip.engine, clip.voice = engine, voice
+                return clip
+        clip = await self.inner.synthesize(text, speed)
+        self.cache.put(self.key(text, speed, clip.engine, clip.voice), clip.to_wav())
+        return clip
+
+    def cached(self, text, speed=1.0):
+        return any(self.cache.contains(self.key(text, speed, engine, voice))
+                   for engine, voice in self.inner.cache_sources())
+
+    async def prewarm(self, sentences, speed=1.0):
+        """Sintetiza por adelantado las frases que todavía no están en caché"""
+        warmed = 0
+        for sentence in sentences:
+            if self.cached(sentence, speed):
+                continue
+            try:
+                await self.synthesize(sentence, speed)
+                warmed += 1
+            except Exception as e:
+                print(f"⚠️ No se pudo precalentar '{sentence[:30]}': {e}")
+        return warmed
+
+    def metrics_summary(self):
+        return self.inner.metrics_summary()
+
+
+def create_synthesizer(name="auto", voice="en-US-AriaNeural", piper_model="en_US-lessac-medium.onnx",
+                       timeout=2.5):
+    """Crea el motor configurado: "edge", "piper", "auto" (edge con respaldo local) o "stub" """
+    if name == "stub":
+        return StubSynthesizer()
+    if name == "edge":
+        return EdgeSynthesizer(voice)
+
+    try:
+        local = PiperSynthesizer(piper_model)
+    except ImportError:
+        local = None
+        print("⚠️ piper-tts no está instalado: sin voz local")
+    except Exception as e:
+        local = None
+        print(f"⚠️ No se pudo cargar la voz local: {e}")
+
+    if name == "piper":
+        if local is None:
+            raise RuntimeError("La voz local (piper) no está disponible")
+        return local
+    if local is None:
+        return EdgeSynthesizer(voice)
+    return FallbackSynthesizer(EdgeSynthesizer(voice), local, timeout=timeout)
@@ -0,0 +1,73 @@
+"""Modo por lotes: una ejecución interrumpida se retoma sin repetir archivos"""
+import json
+import os
+import wave
+
+import numpy as np
+
+from batch import file_key, load_done, process_batch, wav_paths
+
+RATE = 16000
+
+
+def write_wav(path, seconds=2.0):
+    """Silencio con una ráfaga de tono en medio (una frase para el VAD)"""
+    t = np.arange(int(seconds * RATE)) / RATE
+    samples = np.zeros_like(t)
+    burst = (t > 0.5) & (t < seconds - 0.5)
+    samples[burst] = 0.3 * np.sin(2 * np.pi * 220 * t[burst])
+    with wave.open(str(path), "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(RATE)
+        wav.writeframes((samples * 32767).astype(np.int16).tobytes())
+    return str(path)
+
+
+def read_results(output):
+    with open(output, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_file_key_changes_with_the_file(tmp_path):
+    path = write_wav(tmp_path / "a.wav")
+    key = file_key(path)
+    assert key == (os.path.abspath(path), os.path.getsize(path), int(os.path.getmtime(path)))
+    write_wav(path, seconds=3.0)
+    os.utime(path, (1_000_000, 1_000_000))
+    assert file_key(path) != key
+
+
+def test_load_done_keeps_only_finished_files(tmp_path):
+    output = tmp_path / "results.jsonl"
+    assert load_done(str(output)) == set()
+    lines = [{"path": "/a.wav", "size": 10, "mtime": 1, "status": "ok"},
+             {"path": "/b.wav", "size": 20, "mtime": 2, "status": "error", "error": "boom"}]
+    # La última línea quedó a medias al interrumpir
+    output.write_text("".join(json.dumps(line) + "\n" for line in lines) + '{"path": "/c.wav", "si')
+    assert load_done(str(output)) == {("/a.wav", 10, 1)}
+
+
+def test_process_batch_resumes_where_it_stopped(tmp_path):
+    recordings = tmp_path / "recordings"
+    recordings.mkdir()
+    first = write_wav(recordings / "first.wav")
+    write_wav(recordings / "second.wav")
+    output = str(tmp_path / "results.jsonl")
+    paths = wav_paths([str(recordings)])
+    assert [os.path.basename(p) for p in paths] == ["first.wav", "second.wav"]
+
+    processed, errors, audio_seconds = process_batch(paths, output, 1, "stub", {})
+    assert (processed, errors, audio_seconds) == (2, 0, 4.0)
+    results = read_results(output)
+    assert [r["status"] for r in results] == ["ok", "ok"]
+    assert all(len(r["utterances"]) == 1 for r in results)
+
+    # Segunda ejecución: nada que hacer
+    assert process_batch(paths, output, 1, "stub", {}) == (0, 0, 0.0)
+
+    # Un archivo cambiado se vuelve a procesar; el resto no
+    write_wav(first, seconds=3.0)
+    os.utime(first, (2_000_000, 2_000_000))
+    assert process_batch(paths, output, 1, "stub", {})[:2] == (1, 0)
+    assert len(read_results(output)) == 3
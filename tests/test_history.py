@@ -0,0 +1,75 @@
+"""Historial en SQLite: escritura por lotes en segundo plano y búsqueda"""
+import sqlite3
+import threading
+
+import numpy as np
+import pytest
+
+from history import HistoryStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.db"), batch_delay=0.05)
+    yield store
+    store.close()
+
+
+def test_writes_are_batched_in_the_background(store):
+    session = store.start_session(model="stub")
+    for i in range(20):
+        store.add_message(session, "user" if i % 2 == 0 else "assistant", f"message number {i}")
+    # add_message no espera al disco: todo llega al confirmar el lote
+    assert store.flush(timeout=5)
+    rows = store.load_session(session)
+    assert [row["text"] for row in rows] == [f"message number {i}" for i in range(20)]
+    assert store.written == 1 + 2 * 20
+    [recent] = store.recent_sessions()
+    assert recent["messages"] == 20 and recent["first"] == "message number 0"
+
+
+def test_search_matches_word_prefixes(store):
+    session = store.start_session()
+    store.add_message(session, "user", "I went to the library yesterday")
+    store.add_message(session, "assistant", "What did you borrow from the library?")
+    store.add_message(session, "user", "A book about dinosaurs")
+    store.flush(timeout=5)
+
+    assert [row["text"] for row in store.search("librar")] == [
+        "What did you borrow from the library?", "I went to the library yesterday"]
+    assert [row["text"] for row in store.search('dino "book')] == ["A book about dinosaurs"]
+    assert store.search("   ") == []
+
+
+def test_failed_recording_keeps_the_messages(store, tmp_path):
+    session = store.start_session()
+    store.add_message(session, "user", "I like swimming", audio_path=str(tmp_path / "ok.wav"))
+    blocked = tmp_path / "not-a-dir"
+    blocked.write_text("")
+    store.save_audio(str(blocked / "lost.wav"), np.zeros(160, dtype=np.int16), 16000)
+    store.save_audio(str(tmp_path / "ok.wav"), np.zeros(160, dtype=np.int16), 16000)
+    store.add_message(session, "assistant", "Swimming is great exercise!")
+    store.flush(timeout=5)
+
+    assert [row["text"] for row in store.load_session(session)] == [
+        "I like swimming", "Swimming is great exercise!"]
+    assert (tmp_path / "ok.wav").stat().st_size > 0
+
+
+def test_searches_from_many_threads_share_one_connection(store):
+    session = store.start_session()
+    store.add_message(session, "user", "Hello there")
+    store.flush(timeout=5)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(store.search("hello"))) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(len(rows) == 1 for rows in results) and len(results) == 10
+    reader = store.reader
+    store.close()
+    assert store.reader is None
+    with pytest.raises(sqlite3.ProgrammingError):
+        reader.execute("SELECT 1")
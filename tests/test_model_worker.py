@@ -0,0 +1,101 @@
+"""Modelo en un proceso aparte: misma salida, reinicio tras un fallo y contexto al parar antes de tiempo"""
+import time
+
+import pytest
+
+from model_registry import StubModel
+from model_worker import ProcessModel
+from streaming import PromptCache, stream_generate
+
+
+def prompt(model, text):
+    return model.tokenize(f"<|im_start|>user\n{text}<|im_end|>\n<|im_start|>assistant\n")
+
+
+def local_model():
+    return StubModel(seconds_per_token=0.0, prompt_seconds_per_token=0.0)
+
+
+def conversation(model, kill_between=False):
+    """Dos turnos completos; el segundo reutiliza el prefijo del primero"""
+    cache = PromptCache()
+    first, _ = stream_generate(model, prompt(model, "Tell me a story"), cache=cache)
+    if kill_between:
+        model.process.kill()
+        model.process.join()
+    follow = cache.tokens + prompt(model, "And then?")[1:]
+    second, stats = stream_generate(model, follow, cache=cache)
+    return first, second, stats
+
+
+def two_turns(model):
+    """Un turno cortado a los 5 tokens y otro que reutiliza el prefijo (reset=False)"""
+    cache = PromptCache()
+    first = prompt(model, "Tell me a story")
+    # Un on_text lento deja que el hijo se adelante a lo que se consume
+    stream_generate(model, first, on_text=lambda text: time.sleep(0.02), max_new_tokens=5, cache=cache)
+    follow = cache.tokens + prompt(model, "And then?")[1:]
+    second, stats = stream_generate(model, follow, max_new_tokens=40, cache=cache)
+    return second, stats, cache
+
+
+def child_context(model):
+    """Tokens que el StubModel del proceso hijo tiene en contexto"""
+    return model._call("__getattribute__", "context")
+
+
+@pytest.fixture
+def process_model():
+    model = ProcessModel(StubModel, seconds_per_token=0.0, prompt_seconds_per_token=0.0)
+    yield model
+    model.close()
+
+
+def test_same_interface_and_output_as_in_process(process_model):
+    local = local_model()
+    assert process_model.bos_token_id == local.bos_token_id
+    assert process_model.tokenize("Hi there") == local.tokenize("Hi there")
+    assert process_model.detokenize(local.tokenize("Hi there", add_bos_token=False)) == "Hi there"
+
+    first, second, stats = conversation(process_model)
+    assert (first, second) == conversation(local)[:2]
+    assert stats.evaluated_prompt_tokens < stats.prompt_tokens
+
+
+def test_restart_replays_the_context_after_a_crash(process_model):
+    restarted = []
+    process_model.on_restart = restarted.append
+    first, second, stats = conversation(process_model, kill_between=True)
+
+    assert restarted == [process_model] and process_model.restarts == 1
+    # El hijo nuevo reevaluó el contexto: el turno siguiente sigue reutilizando el prefijo
+    assert (first, second) == conversation(local_model())[:2]
+    assert stats.evaluated_prompt_tokens < stats.prompt_tokens
+
+
+def test_early_stop_rolls_back_child_context(process_model):
+    expected, _, _ = two_turns(local_model())
+    second, stats, cache = two_turns(process_model)
+
+    # El segundo turno solo evaluó lo nuevo y el hijo partía del mismo contexto
+    assert stats.evaluated_prompt_tokens < stats.prompt_tokens
+    assert second == expected
+    assert process_model.context == cache.tokens
+    assert child_context(process_model) == cache.tokens
+
+
+def test_stop_after_child_finished_rolls_back(process_model):
+    tokens = prompt(process_model, "Hello")
+    generator = process_model.generate(tokens)
+    consumed = tokens + [next(generator) for _ in range(3)]
+    # El hijo termina toda la respuesta antes de que el principal la deje
+    time.sleep(0.5)
+    generator.close()
+    assert process_model.context == consumed
+    assert child_context(process_model) == consumed
+
+    local = local_model()
+    local.context = list(consumed)
+    follow = prompt(local, "Thanks")[1:]
+    expected = list(local.generate(follow, reset=False))
+    assert list(process_model.generate(follow, reset=False)) == expected
@@ -0,0 +1,108 @@
+"""Cliente OpenAI contra el servidor simulado local (sin red)"""
+import threading
+
+import pytest
+
+from mock_openai import MockChatServer
+from openai_backend import ConnectionPool, OpenAIChatClient, RemoteModelError
+
+REPLY = "That sounds great! What did you do after that?"
+
+
+@pytest.fixture
+def server():
+    mock = MockChatServer(seconds_per_token=0.0, first_token_delay=0.0, replies=[REPLY]).start()
+    yield mock
+    mock.stop()
+
+
+def client_for(server, **options):
+    options.setdefault("backoff", 0.01)
+    return OpenAIChatClient(server.url, read_timeout=5.0, **options)
+
+
+def messages(text="Hello"):
+    return [{"role": "user", "content": text}]
+
+
+def test_streams_tokens_as_they_arrive(server):
+    client = client_for(server)
+    chunks = []
+    text, stats = client.stream_chat(messages(), on_text=chunks.append)
+    assert text == REPLY
+    assert "".join(chunks) == REPLY
+    assert len(chunks) == len(REPLY.split(" "))
+    assert stats.stop_reason == "stop"
+    assert stats.generated_tokens == len(chunks)
+    assert stats.prompt_tokens > 0
+    client.close()
+
+
+def test_stop_sequence_is_filtered(server):
+    server.replies = ["Nice try.<|im_end|> <|im_start|>user leaked"]
+    client = client_for(server)
+    chunks = []
+    text, stats = client.stream_chat(messages(), on_text=chunks.append)
+    assert text == "Nice try."
+    assert "<|im_" not in "".join(chunks)
+    assert stats.stop_reason == "stop"
+    client.close()
+
+
+def test_retries_503_with_backoff(server):
+    server.fail_next = 2
+    client = client_for(server, retries=2)
+    text, _ = client.stream_chat(messages())
+    assert text == REPLY
+    assert client.retried == 2
+    assert server.requests == 3
+    client.close()
+
+
+def test_error_after_retries_exhausted(server):
+    server.fail_next = 5
+    client = client_for(server, retries=1)
+    with pytest.raises(RemoteModelError, match="503"):
+        client.stream_chat(messages())
+    assert server.requests == 2
+    client.close()
+
+
+def test_should_stop_cancels_mid_stream(server):
+    server.seconds_per_token = 0.02
+    client = client_for(server)
+    chunks = []
+    text, stats = client.stream_chat(messages(), on_text=chunks.append,
+                                     should_stop=lambda: len(chunks) >= 2)
+    assert stats.stop_reason == "cancelled"
+    assert len(chunks) == 2
+    assert text == "".join(chunks) != REPLY
+    client.close()
+
+
+def test_keep_alive_reuses_connection(server):
+    client = client_for(server)
+    client.warm_up()
+    for _ in range(3):
+        client.stream_chat(messages())
+    assert client.pool.created == 1
+    assert server.connections == 1
+    assert client.requests == 4
+    client.close()
+
+
+def test_pool_counts_connections_from_many_threads():
+    pool = ConnectionPool("127.0.0.1", 9, size=4)
+    barrier = threading.Barrier(16)
+
+    def open_many():
+        barrier.wait()
+        for _ in range(200):
+            pool.get()
+
+    threads = [threading.Thread(target=open_many) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert pool.created == 16 * 200
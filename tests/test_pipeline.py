@@ -0,0 +1,56 @@
+"""La conversación guarda textos que corresponden a sus tokens (base de la reutilización del prefijo)"""
+from conversation import chatml_segment
+from model_registry import StubModel
+from pipeline import TutorPipeline, generate_reply, remember_reply, tutor_conversation
+
+
+def stub(**options):
+    options.setdefault("seconds_per_token", 0.0)
+    options.setdefault("prompt_seconds_per_token", 0.0)
+    return StubModel(**options)
+
+
+def test_cancelled_reply_is_stored_without_ellipsis():
+    model = stub()
+    conversation = tutor_conversation(model)
+    chunks = []
+    response, stats = generate_reply(model, conversation, "Tell me something", on_text=chunks.append,
+                                     should_stop=lambda: len(chunks) >= 5)
+    assert stats.stop_reason == "cancelled"
+    assert "…" not in response
+    remember_reply(model, conversation, response, stats)
+
+    turn = conversation.turns[-1]
+    assert turn.text == response
+    assert response == model.detokenize(stats.output_tokens).strip()
+
+
+def test_fallback_reply_is_tokenized_from_its_text():
+    pipeline = TutorPipeline(speak=False)
+    model = stub(replies=[""])
+    pipeline.set_model(model)
+    response, stats = pipeline.generate_response("Hello", "Could you repeat?")
+    assert response == "Could you repeat?"
+
+    turn = pipeline.conversation.turns[-1]
+    assert turn.text == "Could you repeat?"
+    assert turn.tokens == model.tokenize(chatml_segment("assistant", response), add_bos_token=False)
+    # El siguiente prompt contiene la respuesta de reserva, no una respuesta vacía
+    assert model.detokenize(pipeline.conversation.build_prompt()).count("Could you repeat?") == 1
+
+
+def test_dropped_turn_stays_out_of_the_prompt():
+    pipeline = TutorPipeline(speak=False)
+    pipeline.set_model(stub())
+    # Encolados antes de arrancar: el segundo descarta al primero
+    dropped = pipeline.submit_text("First message")
+    answered = pipeline.submit_text("Second message")
+    pipeline.scheduler.start()
+    try:
+        assert answered.wait(timeout=10)
+    finally:
+        pipeline.scheduler.stop()
+
+    assert dropped.status == "dropped"
+    assert [(turn.role, turn.text) for turn in pipeline.conversation.turns] == [
+        ("user", "Second message"), ("assistant", answered.response)]
@@ -0,0 +1,162 @@
+"""Planificador de inferencia: prioridades, expulsión de turnos, trabajos caducados y afinidad"""
+import threading
+import time
+
+from scheduler import InferenceJob, InferenceScheduler, PRIORITY_CONTROL, PRIORITY_TEXT, PRIORITY_VOICE
+
+
+def blocker(scheduler):
+    """Ocupa el hilo de inferencia hasta que se libere el Event devuelto"""
+    release, started = threading.Event(), threading.Event()
+
+    def run(job):
+        started.set()
+        release.wait(10)
+        return "blocker"
+
+    job = scheduler.submit(InferenceJob(run, kind="busy"))
+    assert started.wait(5)
+    return release, job
+
+
+def recorder(events, name, **options):
+    return InferenceJob(lambda job: events.append(name), kind=name,
+                        on_drop=lambda job: events.append(f"{name} dropped"), **options)
+
+
+def wait_idle(scheduler):
+    deadline = time.monotonic() + 5
+    while (scheduler.busy or scheduler.depth) and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_higher_priority_runs_first():
+    scheduler = InferenceScheduler()
+    scheduler.start()
+    events = []
+    try:
+        release, _ = blocker(scheduler)
+        scheduler.submit(recorder(events, "text", priority=PRIORITY_TEXT))
+        scheduler.submit(recorder(events, "voice", priority=PRIORITY_VOICE))
+        scheduler.submit(recorder(events, "control", priority=PRIORITY_CONTROL))
+        assert scheduler.depth == 3 and scheduler.busy
+        release.set()
+        wait_idle(scheduler)
+    finally:
+        scheduler.stop()
+    assert events == ["control", "voice", "text"]
+    assert scheduler.completed == 4
+
+
+def test_preempt_cancels_current_and_drops_pending_of_equal_or_lower_priority():
+    scheduler = InferenceScheduler()
+    scheduler.start()
+    events = []
+    try:
+        release, current = blocker(scheduler)
+        scheduler.submit(recorder(events, "old text", priority=PRIORITY_TEXT))
+        scheduler.submit(recorder(events, "control", priority=PRIORITY_CONTROL))
+        scheduler.submit(recorder(events, "voice", priority=PRIORITY_VOICE), preempt=True)
+        # El trabajo en curso se entera por job.cancelled y termina antes
+        assert current.cancelled
+        release.set()
+        wait_idle(scheduler)
+    finally:
+        scheduler.stop()
+    assert events == ["control", "voice", "old text dropped"]
+    assert (scheduler.cancelled, scheduler.dropped) == (1, 1)
+
+
+def test_preempt_keeps_higher_priority_work():
+    scheduler = InferenceScheduler()
+    scheduler.start()
+    events = []
+    try:
+        release, current = blocker(scheduler)
+        current.priority = PRIORITY_VOICE
+        scheduler.submit(recorder(events, "text", priority=PRIORITY_TEXT), preempt=True)
+        assert not current.cancelled
+        release.set()
+        wait_idle(scheduler)
+    finally:
+        scheduler.stop()
+    assert events == ["text"]
+
+
+def test_stale_jobs_are_dropped_without_running():
+    scheduler = InferenceScheduler()
+    scheduler.start()
+    events = []
+    try:
+        release, _ = blocker(scheduler)
+        scheduler.submit(recorder(events, "stale", max_age=0.05))
+        scheduler.submit(recorder(events, "fresh", max_age=10))
+        time.sleep(0.1)
+        release.set()
+        wait_idle(scheduler)
+    finally:
+        scheduler.stop()
+    assert events == ["stale dropped", "fresh"]
+    assert scheduler.dropped == 1
+
+
+def test_errors_go_to_on_error_and_the_worker_keeps_running():
+    scheduler = InferenceScheduler()
+    scheduler.start()
+    errors, results = [], []
+
+    def fail(job):
+        raise ValueError("boom")
+
+    try:
+        scheduler.submit(InferenceJob(fail, on_error=lambda job, e: errors.append(str(e))))
+        scheduler.submit(InferenceJob(lambda job: 42, on_done=lambda job, result: results.append(result)))
+        wait_idle(scheduler)
+    finally:
+        scheduler.stop()
+    assert errors == ["boom"] and results == [42]
+
+
+def run_grouped(affinity, jobs, last_group="a"):
+    """Ejecuta jobs [(nombre, grupo, prioridad)] encolados tras un trabajo del grupo last_group"""
+    scheduler = InferenceScheduler(affinity=affinity)
+    scheduler.start()
+    events = []
+    try:
+        release, _ = blocker(scheduler)
+        scheduler.submit(InferenceJob(lambda job: None, group=last_group))
+        for name, group, priority in jobs:
+            scheduler.submit(recorder(events, name, group=group, priority=priority))
+        release.set()
+        wait_idle(scheduler)
+    finally:
+        scheduler.stop()
+    return events
+
+
+def test_affinity_runs_the_last_group_first_up_to_its_limit():
+    jobs = [("b1", "b", PRIORITY_TEXT), ("a1", "a", PRIORITY_TEXT), ("b2", "b", PRIORITY_TEXT),
+            ("a2", "a", PRIORITY_TEXT), ("a3", "a", PRIORITY_TEXT)]
+    assert run_grouped(0, jobs) == ["b1", "a1", "b2", "a2", "a3"]
+    assert run_grouped(4, jobs) == ["a1", "a2", "a3", "b1", "b2"]
+    # Como mucho affinity seguidos del mismo grupo (contando el que ya se ejecutó)
+    assert run_grouped(2, jobs) == ["a1", "b1", "b2", "a2", "a3"]
+
+
+def test_affinity_never_overrides_priority_or_cancellation():
+    jobs = [("voice b", "b", PRIORITY_VOICE), ("text a", "a", PRIORITY_TEXT)]
+    assert run_grouped(4, jobs) == ["voice b", "text a"]
+
+    scheduler = InferenceScheduler(affinity=4)
+    scheduler.start()
+    events = []
+    try:
+        release, _ = blocker(scheduler)
+        scheduler.submit(InferenceJob(lambda job: None, group="a"))
+        scheduler.submit(recorder(events, "b1", group="b"))
+        scheduler.submit(recorder(events, "a1", group="a")).cancel()
+        release.set()
+        wait_idle(scheduler)
+    finally:
+        scheduler.stop()
+    assert events == ["b1", "a1 dropped"]
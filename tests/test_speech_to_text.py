@@ -0,0 +1,83 @@
+"""Transcripción incremental con el motor determinista (StubEngine)"""
+import threading
+
+import numpy as np
+
+from speech_to_text import StreamingTranscriber, StubEngine
+
+RATE = 16000
+WORDS = "one two three four five six seven eight nine ten"
+
+
+def speech(seconds):
+    return np.full(int(seconds * RATE), 1000, dtype=np.int16)
+
+
+def transcriber(**options):
+    # 2 palabras por segundo: segmentos de 0.5 s
+    return StreamingTranscriber(StubEngine(WORDS, words_per_second=2.0), sample_rate=RATE, **options)
+
+
+def buffered_samples(t):
+    return sum(len(chunk) for chunk in t.chunks)
+
+
+def test_partial_decode_commits_and_trims_buffer():
+    t = transcriber(commit_margin=1.5)
+    t.feed(speech(4.0))
+    t._decode(final=False)
+    # Confirmados los segmentos que acaban 1.5 s antes del final (hasta 2.5 s)
+    assert t.committed == ["one", "two", "three", "four", "five"]
+    assert t.tentative == "six seven eight"
+    assert buffered_samples(t) == int(1.5 * RATE)
+
+
+def test_partial_decode_in_background_thread():
+    partials = []
+    decoded = threading.Event()
+
+    def on_partial(text):
+        partials.append(text)
+        decoded.set()
+
+    t = transcriber(partial_interval=1.0, commit_margin=1.0, on_partial=on_partial)
+    t.start()
+    try:
+        t.feed(speech(3.0))
+        assert decoded.wait(5.0)
+    finally:
+        t.stop()
+    assert t.committed == ["one", "two", "three", "four"]
+    assert buffered_samples(t) == int(1.0 * RATE)
+    assert partials[-1] == t.text
+
+
+def test_finish_returns_full_transcript_and_resets():
+    t = transcriber(commit_margin=1.5)
+    t.feed(speech(4.0))
+    t._decode(final=False)
+    t.feed(speech(1.0))
+    # Cola pendiente: 1.5 s que quedaron + 1 s nuevo = 5 palabras
+    assert t.finish() == "one two three four five one two three four five"
+    assert t.committed == [] and t.chunks == [] and t.text == ""
+
+
+def test_speculate_commits_nothing():
+    t = transcriber(commit_margin=1.5)
+    t.feed(speech(4.0))
+    t._decode(final=False)
+    committed, samples = list(t.committed), buffered_samples(t)
+
+    assert t.speculate() == "one two three four five one two three"
+    assert t.committed == committed
+    assert buffered_samples(t) == samples
+    # La frase sigue: lo que llega después se suma a lo mismo
+    t.feed(speech(1.0))
+    assert t.finish() == "one two three four five one two three four five"
+
+
+def test_without_engine_nothing_is_transcribed():
+    t = StreamingTranscriber(None, sample_rate=RATE)
+    t.feed(speech(2.0))
+    assert t.speculate() == ""
+    assert t.finish() == ""
@@ -0,0 +1,104 @@
+"""Generación en streaming: secuencias de parada partidas entre fragmentos y reutilización del prefijo"""
+import pytest
+
+from streaming import PromptCache, StopSequenceFilter, stream_generate
+
+
+class ByteModel:
+    """Modelo mínimo: un token por byte y siempre la misma respuesta"""
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.calls = []
+
+    def tokenize(self, text):
+        return list(text.encode("utf-8"))
+
+    def detokenize(self, tokens, decode=True):
+        data = bytes(tokens)
+        return data.decode("utf-8", errors="ignore") if decode else data
+
+    def generate(self, tokens, temperature=0.7, reset=True):
+        self.calls.append((list(tokens), reset))
+        yield from self.reply.encode("utf-8")
+
+
+def feed_all(stop_filter, chunks):
+    return "".join(stop_filter.feed(chunk) for chunk in chunks) + stop_filter.flush()
+
+
+def test_stop_sequence_split_across_chunks():
+    stop_filter = StopSequenceFilter()
+    shown = [stop_filter.feed(chunk) for chunk in ["Great", " job!", "<|", "im_", "end|>", "<|im_start|>user"]]
+    assert "".join(shown) == "Great job!"
+    assert shown[2:4] == ["", ""]
+    assert stop_filter.stopped
+    assert stop_filter.feed("more") == "" and stop_filter.flush() == ""
+
+
+def test_partial_stop_prefix_is_released_when_it_is_not_a_stop():
+    stop_filter = StopSequenceFilter()
+    assert stop_filter.feed("a <") == "a "
+    assert stop_filter.feed("|i") == ""
+    assert stop_filter.feed("nfo") == "<|info"
+    assert feed_all(StopSequenceFilter(), ["x <|im"]) == "x <|im"
+    assert not stop_filter.stopped
+
+
+def test_earliest_stop_wins():
+    assert feed_all(StopSequenceFilter(["END", "<|im_end|>"]), ["one<|im_end|>two END"]) == "one"
+
+
+def test_stream_generate_hides_stop_and_counts_tokens():
+    chunks = []
+    text, stats = stream_generate(ByteModel("Hi there!<|im_end|>ignored"), "prompt", on_text=chunks.append)
+    assert text == "Hi there!" == "".join(chunks)
+    assert stats.prompt_tokens == len("prompt")
+    assert stats.generated_tokens == len("Hi there!<|im_end|>")
+
+
+def test_stream_generate_stops_at_max_new_tokens_and_on_request():
+    text, stats = stream_generate(ByteModel("abcdefghij"), "p", max_new_tokens=4)
+    assert text == "abcd" and stats.generated_tokens == 4
+    text, _ = stream_generate(ByteModel("abcdefghij"), "p", should_stop=lambda: True)
+    assert text == "a"
+
+
+def test_prompt_cache_plans_only_the_new_suffix():
+    cache = PromptCache()
+    assert cache.plan([1, 2, 3]) == (True, [1, 2, 3])
+    cache.update([1, 2, 3])
+    assert cache.plan([1, 2, 3, 4, 5]) == (False, [4, 5])
+    # Otro prefijo o ningún token nuevo: hay que evaluar desde el principio
+    assert cache.plan([1, 9, 3, 4]) == (True, [1, 9, 3, 4])
+    assert cache.plan([1, 2, 3]) == (True, [1, 2, 3])
+    assert cache.plan([1, 2]) == (True, [1, 2])
+    cache.invalidate()
+    assert cache.plan([1, 2, 3, 4]) == (True, [1, 2, 3, 4])
+
+
+def test_stream_generate_reuses_the_cached_prefix():
+    model = ByteModel("ok<|im_end|>")
+    cache = PromptCache()
+    first = model.tokenize("system user")
+    stream_generate(model, first, cache=cache)
+    # La caché refleja el prompt y todo lo generado, también el stop
+    assert cache.tokens == first + model.tokenize("ok<|im_end|>")
+
+    second = cache.tokens + model.tokenize(" again")
+    _, stats = stream_generate(model, second, cache=cache)
+    assert model.calls[-1] == (model.tokenize(" again"), False)
+    assert (stats.prompt_tokens, stats.evaluated_prompt_tokens) == (len(second), len(" again"))
+
+
+def test_failed_generation_invalidates_the_cache():
+    class Broken(ByteModel):
+        def generate(self, tokens, temperature=0.7, reset=True):
+            yield 65
+            raise RuntimeError("model crashed")
+
+    cache = PromptCache()
+    cache.update([1, 2])
+    with pytest.raises(RuntimeError):
+        stream_generate(Broken(""), [1, 2, 3], cache=cache)
+    assert not cache.valid and cache.tokens == []
@@ -0,0 +1,91 @@
+"""Motores de síntesis: respaldo, caché de audio y clips guardados con la voz que los generó"""
+import asyncio
+
+from synthesizers import AudioClip, CachedSynthesizer, FallbackSynthesizer, StubSynthesizer
+from tts_cache import TTSCache
+
+
+class Voice(StubSynthesizer):
+    def __init__(self, name, sample_rate, delay=0.0):
+        super().__init__(sample_rate=sample_rate, delay=delay)
+        self.name = name
+        self.voice = f"{name}-voice"
+        self.online = True
+
+    async def _synthesize(self, text, speed):
+        if not self.online:
+            raise ConnectionError("sin red")
+        return await super()._synthesize(text, speed)
+
+
+def synthesize(synthesizer, text):
+    return asyncio.run(synthesizer.synthesize(text))
+
+
+def test_audio_clip_wav_round_trip():
+    clip = AudioClip(bytes(range(200)) * 24, 24000)
+    copy = AudioClip.from_wav(clip.to_wav())
+    assert (copy.pcm, copy.sample_rate, copy.channels) == (clip.pcm, 24000, 1)
+    assert clip.duration == len(clip.pcm) / 2 / 24000
+
+
+def test_fallback_blocks_the_failing_primary_during_cooldown():
+    edge, piper = Voice("edge", 24000), Voice("piper", 22050)
+    fallback = FallbackSynthesizer(edge, piper, cooldown=60.0)
+    edge.online = False
+    assert synthesize(fallback, "Hello.").sample_rate == 22050
+    assert synthesize(fallback, "Hello again.").sample_rate == 22050
+    # Solo se intentó una vez: después se evita hasta que pase el cooldown
+    assert edge.metrics.errors == 1 and piper.metrics.requests == 2
+
+
+def test_slow_primary_times_out_to_the_fallback():
+    edge, piper = Voice("edge", 24000, delay=0.5), Voice("piper", 22050)
+    fallback = FallbackSynthesizer(edge, piper, timeout=0.05)
+    assert synthesize(fallback, "Hello.").sample_rate == 22050
+    assert edge.metrics.timeouts == 1
+
+
+def test_cache_serves_repeated_sentences_and_prewarm_skips_them():
+    edge = Voice("edge", 24000)
+    cached = CachedSynthesizer(edge, TTSCache(directory=None))
+    first = synthesize(cached, "Good morning.")
+    again = synthesize(cached, "Good  morning.")
+    assert again.pcm == first.pcm and edge.metrics.requests == 1
+
+    warmed = asyncio.run(cached.prewarm(["Good morning.", "See you tomorrow."]))
+    assert warmed == 1 and edge.metrics.requests == 2
+
+
+def test_fallback_audio_is_not_served_as_primary():
+    edge, piper = Voice("edge", 24000), Voice("piper", 22050)
+    fallback = FallbackSynthesizer(edge, piper, cooldown=60.0)
+    cached = CachedSynthesizer(fallback, TTSCache(directory=None))
+
+    edge.online = False
+    clip = synthesize(cached, "Hello there.")
+    assert (clip.engine, clip.sample_rate) == ("piper", 22050)
+    # Sin red, la frase repetida sale de la caché (audio del respaldo)
+    assert synthesize(cached, "Hello there.").engine == "piper"
+    assert piper.metrics.requests == 1
+
+    # Vuelve la red: la frase se sintetiza con la voz principal y se guarda aparte
+    edge.online = True
+    fallback.primary_blocked_until = 0.0
+    clip = synthesize(cached, "Hello there.")
+    assert (clip.engine, clip.sample_rate) == ("edge", 24000)
+    assert edge.metrics.requests == 1
+    assert synthesize(cached, "Hello there.").engine == "edge"
+    assert edge.metrics.requests == 1
+
+
+def test_primary_audio_is_reused_while_offline():
+    edge, piper = Voice("edge", 24000), Voice("piper", 22050)
+    fallback = FallbackSynthesizer(edge, piper)
+    cached = CachedSynthesizer(fallback, TTSCache(directory=None))
+    synthesize(cached, "Good morning.")
+
+    edge.online = False
+    synthesize(cached, "Something new.")
+    assert synthesize(cached, "Good morning.").engine == "edge"
+    assert piper.metrics.requests == 1
@@ -0,0 +1,63 @@
+"""Caché de audio sintetizado: memoria, disco, expulsión y escrituras desde varios hilos"""
+import os
+import threading
+
+from tts_cache import TTSCache, cache_key
+
+
+def test_concurrent_puts_of_same_key_count_once(tmp_path):
+    cache = TTSCache(directory=str(tmp_path))
+    data = b"RIFF" + bytes(64 * 1024)
+    barrier = threading.Barrier(8)
+
+    def put():
+        barrier.wait()
+        cache.put("hello", data)
+
+    threads = [threading.Thread(target=put) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert dict(cache.disk_index) == {"hello": len(data)}
+    assert cache.disk_used == len(data)
+    assert not cache.writing
+    assert sorted(os.listdir(tmp_path)) == ["hello.wav"]
+
+
+def test_disk_usage_matches_files_after_eviction(tmp_path):
+    cache = TTSCache(directory=str(tmp_path), disk_bytes=3000)
+    for i in range(5):
+        for _ in range(2):
+            cache.put(f"clip{i}", bytes(1000))
+    assert list(cache.disk_index) == ["clip2", "clip3", "clip4"]
+    assert cache.disk_used == sum(os.path.getsize(tmp_path / name) for name in os.listdir(tmp_path))
+
+
+def test_cache_key_normalizes_whitespace_and_separates_parts():
+    assert cache_key("Hello   there\n", "voice", 1.0) == cache_key("Hello there", "voice", 1.0)
+    assert cache_key("Hello there", "voice", 1.0) != cache_key("Hello there", "voice", 1.2)
+    assert cache_key("a", "bc") != cache_key("ab", "c")
+
+
+def test_memory_tier_is_lru_bounded_in_bytes():
+    cache = TTSCache(directory=None, memory_bytes=2500)
+    for key in ("a", "b"):
+        cache.put(key, bytes(1000))
+    assert cache.get("a") is not None
+    cache.put("c", bytes(1000))
+    # "b" era el menos usado
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.memory_used == 2000
+    assert (cache.memory_hits, cache.misses) == (3, 1)
+
+
+def test_disk_tier_survives_a_new_instance(tmp_path):
+    TTSCache(directory=str(tmp_path)).put("hello", b"RIFF audio")
+    cache = TTSCache(directory=str(tmp_path))
+    assert cache.get("hello") == b"RIFF audio"
+    assert cache.disk_hits == 1
+    # Tras leerlo del disco queda también en memoria
+    assert cache.get("hello") == b"RIFF audio" and cache.memory_hits == 1
@@ -0,0 +1,177 @@
+"""Servidor del tutor: API HTTP, cola agrupada por sesión y lecturas desde los hilos HTTP"""
+import http.client
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from model_registry import StubModel
+from scheduler import InferenceJob
+from tutor_server import TutorServer, make_handler
+
+
+@pytest.fixture
+def api():
+    """(TutorServer, función para hacer peticiones) con el servidor HTTP en un puerto libre"""
+    tutor = TutorServer(StubModel(seconds_per_token=0.0, prompt_seconds_per_token=0.0)).start()
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(tutor))
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+
+    def request(method, path, data=None):
+        connection = http.client.HTTPConnection("127.0.0.1", httpd.server_address[1], timeout=10)
+        body = None if data is None else json.dumps(data)
+        connection.request(method, path, body=body, headers={"Content-Type": "application/json"})
+        response = connection.getresponse()
+        payload = response.read().decode("utf-8")
+        connection.close()
+        return response.status, response.getheader("Content-Type"), payload
+
+    yield tutor, request
+    httpd.shutdown()
+    httpd.server_close()
+    tutor.stop()
+
+
+def create_session(request):
+    status, _, body = request("POST", "/sessions")
+    assert status == 201
+    return json.loads(body)["session"]
+
+
+def test_message_without_streaming_returns_the_reply(api):
+    tutor, request = api
+    session = create_session(request)
+    status, _, body = request("POST", f"/sessions/{session}/messages", {"text": "Hello!", "stream": False})
+    assert status == 200
+    reply = json.loads(body)
+    assert reply["response"] and reply["generated_tokens"] > 0
+
+    status, _, body = request("GET", f"/sessions/{session}")
+    data = json.loads(body)
+    assert data["turns"] == 1
+    assert [(m["role"], m["content"]) for m in data["messages"]] == [("user", "Hello!"),
+                                                                     ("assistant", reply["response"])]
+    assert json.loads(request("GET", "/stats")[2])["turns_done"] == 1
+
+
+def test_streamed_reply_arrives_as_server_sent_events(api):
+    _, request = api
+    session = create_session(request)
+    status, content_type, body = request("POST", f"/sessions/{session}/messages", {"text": "Hi"})
+    assert status == 200 and content_type.startswith("text/event-stream")
+    events = [block.split("\n") for block in body.strip().split("\n\n")]
+    names = [lines[0][len("event: "):] for lines in events]
+    data = [json.loads(lines[1][len("data: "):]) for lines in events]
+    assert names[-1] == "done" and set(names[:-1]) == {"token"}
+    assert "".join(data[:-1]).strip() == data[-1]["response"]
+
+
+def test_errors_and_limits(api):
+    tutor, request = api
+    assert request("POST", "/sessions/unknown/messages", {"text": "Hi"})[0] == 404
+    session = create_session(request)
+    assert request("POST", f"/sessions/{session}/messages", {"text": "  "})[0] == 400
+    tutor.max_queue = 0
+    assert request("POST", f"/sessions/{session}/messages", {"text": "Hi"})[0] == 503
+    assert request("DELETE", f"/sessions/{session}")[0] == 200
+    assert request("GET", f"/sessions/{session}")[0] == 404
+
+
+def wait_done(turn):
+    while True:
+        event, data = turn.events.get(timeout=10)
+        if event == "done":
+            return data
+        assert event == "token", data
+
+
+def run_interleaved(affinity):
+    model = StubModel(seconds_per_token=0.0, prompt_seconds_per_token=0.0)
+    server = TutorServer(model, affinity=affinity).start()
+    first, second = server.create_session(), server.create_session()
+    order = []
+    run_turn = server._run_turn
+    server._run_turn = lambda turn, job: (order.append(turn.session), run_turn(turn, job))
+    try:
+        # Un turno de cada alumno para que ambos tengan conversación
+        for session in (first, second):
+            wait_done(server.submit(session, f"Hello, I am {session.id[:4]}"))
+
+        # Los siguientes llegan intercalados mientras el modelo está ocupado
+        release = threading.Event()
+        server.schedulers[0].submit(InferenceJob(lambda job: release.wait(10), kind="busy"))
+        turns = [server.submit(session, f"Message {i} from {session.id[:4]}")
+                 for i in range(2) for session in (first, second)]
+        release.set()
+        results = [wait_done(turn) for turn in turns]
+    finally:
+        server.stop()
+    return order[2:], results
+
+
+def test_local_model_groups_queued_turns_by_session():
+    order, results = run_interleaved(affinity=4)
+    # La conversación de second quedó en el contexto: sus turnos van primero
+    assert order[0] is order[1] and order[2] is order[3] and order[0] is not order[2]
+    evaluated = sum(result["evaluated_prompt_tokens"] for result in results)
+    prompt = sum(result["prompt_tokens"] for result in results)
+
+    _, plain = run_interleaved(affinity=0)
+    assert evaluated < sum(result["evaluated_prompt_tokens"] for result in plain)
+    assert evaluated < prompt / 2
+
+
+def test_affinity_is_bounded():
+    model = StubModel(seconds_per_token=0.0, prompt_seconds_per_token=0.0)
+    server = TutorServer(model, affinity=1)
+    first, second = server.create_session(), server.create_session()
+    order = []
+    run_turn = server._run_turn
+    server._run_turn = lambda turn, job: (order.append(turn.session), run_turn(turn, job))
+    # Encolados antes de arrancar: con affinity=1 se alternan como llegaron
+    turns = [server.submit(session, f"Message {i}") for i in range(2) for session in (first, second)]
+    server.start()
+    try:
+        for turn in turns:
+            wait_done(turn)
+    finally:
+        server.stop()
+    assert order == [first, second, first, second]
+
+
+def test_idle_sessions_expire_without_new_sessions():
+    server = TutorServer(StubModel(seconds_per_token=0.0), session_ttl=0.05, expire_interval=0.0)
+    idle, active = server.create_session(), server.create_session()
+    time.sleep(0.1)
+    active.last_active = time.time()
+    # Solo llegan peticiones de la sesión activa
+    assert server.get_session(active.id) is active
+    assert list(server.sessions) == [active.id]
+    assert server.get_session(idle.id) is None
+
+
+def test_session_snapshot_reads_under_the_session_lock():
+    model = StubModel(seconds_per_token=0.0, prompt_seconds_per_token=0.0)
+    server = TutorServer(model).start()
+    session = server.create_session()
+    try:
+        done = wait_done(server.submit(session, "Hello"))
+        messages, turns = session.snapshot()
+        assert turns == 1
+        assert [(m["role"], m["content"]) for m in messages] == [("user", "Hello"),
+                                                                 ("assistant", done["response"])]
+
+        # Mientras el hilo de inferencia modifica la conversación, la lectura espera
+        read = []
+        with session.lock:
+            reader = threading.Thread(target=lambda: read.append(session.snapshot()))
+            reader.start()
+            reader.join(timeout=0.2)
+            assert not read
+        reader.join(timeout=5)
+        assert read
+    finally:
+        server.stop()
@@ -0,0 +1,150 @@
+"""VAD sin micrófono: WAV generados (silencio, tonos, voz sobre ruido) y bloques partidos"""
+import wave
+
+import numpy as np
+import pytest
+
+from vad import VoiceActivityDetector, speech_segments
+
+RATE = 16000
+FRAME = 256
+FRAME_SECONDS = FRAME / RATE
+
+
+def noise(seconds, level=0.001, seed=0):
+    return np.random.default_rng(seed).normal(0.0, level, int(seconds * RATE))
+
+
+def tone(seconds, amplitude=0.3, hz=200.0):
+    t = np.arange(int(seconds * RATE)) / RATE
+    return amplitude * np.sin(2 * np.pi * hz * t)
+
+
+def voice(seconds, amplitude=0.2, f0=140.0):
+    """Vocal sintética: armónicos de f0 con envolvente silábica (4 Hz)"""
+    t = np.arange(int(seconds * RATE)) / RATE
+    harmonics = sum(np.sin(2 * np.pi * f0 * k * t) / k for k in range(1, 6))
+    envelope = 0.6 + 0.4 * np.abs(np.sin(2 * np.pi * 4 * t))
+    return amplitude * envelope * harmonics / 2.3
+
+
+def pcm(signal):
+    return (np.clip(signal, -1.0, 1.0) * 32767).astype(np.int16)
+
+
+def write_wav(path, signal):
+    with wave.open(str(path), "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(RATE)
+        wav.writeframes(pcm(signal).tobytes())
+    return path
+
+
+def frames(seconds):
+    return int(round(seconds / FRAME_SECONDS))
+
+
+@pytest.fixture
+def silence_wav(tmp_path):
+    return write_wav(tmp_path / "silence.wav", noise(2.0))
+
+
+@pytest.fixture
+def bursts_wav(tmp_path):
+    # Ruido de fondo con dos tonos de 0.5 s en 1.024 s y 2.048 s (alineados a frame)
+    signal = noise(3.072)
+    for start in (1.024, 2.048):
+        i = int(start * RATE)
+        signal[i:i + int(0.512 * RATE)] += tone(0.512)
+    return write_wav(tmp_path / "bursts.wav", signal)
+
+
+@pytest.fixture
+def noisy_speech_wav(tmp_path):
+    # Ruido de sala (-40 dBFS) con dos frases separadas por una pausa larga
+    signal = np.concatenate((noise(1.024, 0.01), voice(0.768), noise(1.024, 0.01, seed=1),
+                             voice(1.024), noise(1.024, 0.01, seed=2)))
+    signal[:] += noise(signal.size / RATE, 0.01, seed=3)
+    return write_wav(tmp_path / "noisy_speech.wav", signal)
+
+
+def test_silence_has_no_speech(silence_wav):
+    vad = VoiceActivityDetector(sample_rate=RATE, frame_length=FRAME)
+    decisions = vad.detect_file(silence_wav)
+    assert decisions.size == frames(2.0)
+    assert not decisions.any()
+    assert speech_segments(decisions, FRAME, RATE) == []
+
+
+def test_tone_bursts_frame_decisions_and_segments(bursts_wav):
+    vad = VoiceActivityDetector(sample_rate=RATE, frame_length=FRAME)
+    decisions = vad.detect_file(bursts_wav)
+    hangover = vad.hangover_frames
+
+    for start in (1.024, 2.048):
+        first, last = frames(start), frames(start + 0.512)
+        assert not decisions[first - 1]
+        assert decisions[first:last].all()
+        # Hangover: la voz se mantiene exactamente hangover_frames tras el tono
+        assert decisions[last:last + hangover].all()
+        assert not decisions[last + hangover]
+
+    segments = speech_segments(decisions, FRAME, RATE)
+    hangover_seconds = hangover * FRAME_SECONDS
+    assert segments == pytest.approx([(1.024, 1.536 + hangover_seconds),
+                                      (2.048, 2.56 + hangover_seconds)])
+
+
+def test_speech_over_noise_segments(noisy_speech_wav):
+    vad = VoiceActivityDetector(sample_rate=RATE, frame_length=FRAME)
+    decisions = vad.detect_file(noisy_speech_wav)
+    segments = speech_segments(decisions, FRAME, RATE)
+    assert len(segments) == 2
+    tolerance = 2 * FRAME_SECONDS
+    (start1, end1), (start2, end2) = segments
+    assert start1 == pytest.approx(1.024, abs=tolerance)
+    assert end1 == pytest.approx(1.792 + vad.hangover_frames * FRAME_SECONDS, abs=tolerance)
+    assert start2 == pytest.approx(2.816, abs=tolerance)
+    assert end2 == pytest.approx(3.84 + vad.hangover_frames * FRAME_SECONDS, abs=tolerance)
+
+
+def test_hangover_carries_across_blocks():
+    vad = VoiceActivityDetector(sample_rate=RATE, frame_length=FRAME)
+    # El tono termina justo en el final del primer bloque
+    first = vad.process(pcm(np.concatenate((noise(0.512), tone(0.256)))))
+    assert first[-1]
+    second = vad.process(pcm(noise(0.512, seed=1)))
+    hangover = vad.hangover_frames
+    assert second[:hangover].all()
+    assert not second[hangover:].any()
+
+
+def test_hysteresis_carries_across_blocks():
+    # Tono débil: por encima del nivel de mantenimiento pero por debajo del de arranque
+    quiet = noise(0.256, seed=1) + tone(0.256, amplitude=0.003)
+    tail = noise(0.512, seed=2)
+
+    continued = VoiceActivityDetector(sample_rate=RATE, frame_length=FRAME)
+    continued.process(pcm(np.concatenate((noise(0.512), tone(0.256)))))
+    decisions = continued.process(pcm(np.concatenate((quiet, tail))))
+    quiet_frames = frames(0.256)
+    assert decisions[:quiet_frames].all()
+    hangover = continued.hangover_frames
+    assert decisions[quiet_frames:quiet_frames + hangover].all()
+    assert not decisions[quiet_frames + hangover:].any()
+
+    # El mismo tono débil sin voz previa no arranca una frase
+    fresh = VoiceActivityDetector(sample_rate=RATE, frame_length=FRAME)
+    fresh.process(pcm(noise(0.768)))
+    assert not fresh.process(pcm(np.concatenate((quiet, tail)))).any()
+
+
+def test_block_size_does_not_change_decisions(bursts_wav):
+    whole = VoiceActivityDetector(sample_rate=RATE, frame_length=FRAME).detect_file(bursts_wav)
+    with wave.open(str(bursts_wav), "rb") as wav:
+        samples = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+    vad = VoiceActivityDetector(sample_rate=RATE, frame_length=FRAME)
+    # Bloques que no son múltiplo del frame: el resto pasa al bloque siguiente
+    blocks = [vad.process(samples[i:i + 3000]) for i in range(0, samples.size, 3000)]
+    assert np.array_equal(np.concatenate(blocks), whole)
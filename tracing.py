@@ -0,0 +1,140 @@
+"""Trazas por etapa de cada turno: histogramas de latencia móviles y exportación JSONL opcional"""
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+DEFAULT_TRACE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "chat_local", "traces.jsonl")
+
+# Etapas de un turno en el orden en que ocurren (para mostrarlas ordenadas)
+STAGES = [
+    "capture",          # Procesado de la captura (VAD + envío al reconocedor) durante la frase
+    "endpoint",         # Desde el último audio con voz hasta decidir que la frase terminó
+    "transcription",    # Decodificación final del reconocedor
+    "fluency",          # Métricas de fluidez del audio de la frase
+    "prefill",          # Evaluación adelantada del prompt durante el silencio final
+    "queue",            # Espera en el planificador de inferencia
+    "model_reload",     # Recarga del modelo tras descargarlo por inactividad o memoria
+    "prompt_build",     # Añadir el turno y construir los tokens del prompt
+    "prompt_eval",      # Evaluación del prompt hasta el primer token
+    "generation",       # Del primer token al último
+    "tts_synthesis",    # Síntesis de cada frase
+    "playback_start",   # Desde el inicio del turno hasta que suena el primer audio
+    "turn",             # Turno completo (texto y voz terminados)
+    "barge_in",         # Voz del alumno necesaria para interrumpir al tutor
+]
+
+
+class LatencyHistogram:
+    """Ventana móvil de duraciones de una etapa"""
+
+    def __init__(self, window=200):
+        self.values = deque(maxlen=window)
+        self.count = 0
+
+    def add(self, seconds):
+        self.values.append(seconds)
+        self.count += 1
+
+    def snapshot(self):
+        if not self.values:
+            return None
+        array = np.fromiter(self.values, dtype=float)
+        p50, p95 = np.percentile(array, [50, 95])
+        return {"p50": float(p50), "p95": float(p95), "max": float(array.max()),
+                "last": float(array[-1]), "count": self.count}
+
+
+class Tracer:
+    """Registra spans (etapa, duración, turno) desde cualquier hilo.
+
+    Cada span alimenta el histograma de su etapa; si hay un archivo de
+    exportación, además se escribe como una línea JSON.
+    """
+
+    def __init__(self, window=200, export_path=None):
+        self.window = window
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.export_file = None
+        self.export_path = None
+        if export_path:
+            self.start_export(export_path)
+
+    def record(self, stage, seconds, turn=None, **attrs):
+        """Añade un span ya medido"""
+        if seconds is None:
+            return
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = LatencyHistogram(self.window)
+            histogram.add(seconds)
+            if self.export_file is not None:
+                span = {"ts": time.time(), "stage": stage, "seconds": round(seconds, 6), "turn": turn}
+                span.update(attrs)
+                self.export_file.write(json.dumps(span, ensure_ascii=False) + "\n")
+
+    def span(self, stage, turn=None, **attrs):
+        """Context manager que mide el bloque y lo registra como span"""
+        return _Span(self, stage, turn, attrs)
+
+    def snapshot(self):
+        """{etapa: {p50, p95, max, last, count}} en el orden de STAGES"""
+        with self.lock:
+            stats = {stage: h.snapshot() for stage, h in self.histograms.items()}
+        ordered = {stage: stats.pop(stage) for stage in STAGES if stage in stats}
+        ordered.update(stats)
+        return ordered
+
+    def summary_lines(self):
+        lines = []
+        for stage, stats in self.snapshot().items():
+            if stats is None:
+                continue
+            lines.append(f"{stage:15s} p50 {stats['p50'] * 1000:6.0f} ms · "
+                         f"p95 {stats['p95'] * 1000:6.0f} ms (n={stats['count']})")
+        return lines
+
+    def start_export(self, path=DEFAULT_TRACE_PATH):
+        """Empieza a añadir los spans a un archivo JSONL"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        export_file = open(path, "a", encoding="utf-8", buffering=1)
+        with self.lock:
+            if self.export_file is not None:
+                self.export_file.close()
+            self.export_file = export_file
+            self.export_path = path
+
+    def stop_export(self):
+        with self.lock:
+            if self.export_file is not None:
+                self.export_file.close()
+            self.export_file = None
+            self.export_path = None
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+
+
+class _Span:
+    def __init__(self, tracer, stage, turn, attrs):
+        self.tracer = tracer
+        self.stage = stage
+        self.turn = turn
+        self.attrs = attrs
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.tracer.record(self.stage, time.perf_counter() - self.start, self.turn, **self.attrs)
+        return False
@@ -0,0 +1,166 @@
+"""Vista acotada del chat: el widget solo contiene una ventana de mensajes del MessageStore"""
+import tkinter as tk
+
+
+class TranscriptView:
+    """Muestra en un Text (ScrolledText) los mensajes [first, last) del store.
+
+    Con el usuario al final del chat se mantienen como mucho window
+    mensajes; al llegar arriba con la rueda se cargan page mensajes más
+    antiguos (y se descartan los de abajo), y al volver abajo se recargan
+    los recientes. Así cada inserción cuesta lo mismo tras horas de sesión.
+    """
+
+    def __init__(self, text, store, window=200, page=50):
+        self.text = text
+        self.store = store
+        self.window = window
+        self.page = page
+        self.first = 0
+        self.last = 0
+        self.streaming = None       # Mensaje que se está completando token a token
+        self.check_scheduled = False
+        # Detectar cuándo el usuario llega al principio o al final
+        self.text.configure(yscrollcommand=self._on_scroll)
+
+    # --- Inserción y borrado de mensajes renderizados ---
+
+    @staticmethod
+    def _tag(message):
+        return f"msg{message.id}"
+
+    def _insert(self, index, message):
+        self.text.insert(index, message.render(), self._tag(message))
+
+    def _delete(self, message):
+        tag = self._tag(message)
+        ranges = self.text.tag_ranges(tag)
+        if ranges:
+            self.text.delete(ranges[0], ranges[-1])
+        self.text.tag_delete(tag)
+
+    def _rendered(self, message):
+        index = self.store.index_of(message.id)
+        return index is not None and self.first <= index < self.last
+
+    def _place_stream_mark(self):
+        # Los tokens se insertan justo antes del "\n\n" final del mensaje
+        if self.streaming is not None and self._rendered(self.streaming):
+            self.text.mark_set("stream_insert", f"{self._tag(self.streaming)}.last - 2c")
+            self.text.mark_gravity("stream_insert", tk.RIGHT)
+
+    def _trim_top(self, limit):
+        while self.last - self.first > limit:
+            message = self.store[self.first]
+            if message is self.streaming:
+                break
+            self._delete(message)
+            self.first += 1
+
+    def _trim_bottom(self, limit):
+        while self.last - self.first > limit:
+            message = self.store[self.last - 1]
+            if message is self.streaming:
+                break
+            self._delete(message)
+            self.last -= 1
+
+    def at_bottom(self):
+        return self.text.yview()[1] >= 0.999
+
+    # --- API usada por la aplicación ---
+
+    def append(self, message):
+        """Muestra un mensaje recién añadido al store (si la cola está visible)"""
+        if self.last != len(self.store) - 1:
+            # El usuario está leyendo mensajes antiguos: se cargará al bajar
+            return
+        follow = self.at_bottom()
+        self._insert("end-1c", message)
+        self.last += 1
+        if follow:
+            self._trim_top(self.window)
+            self.text.see(tk.END)
+
+    def begin_stream(self, message):
+        """Muestra un mensaje vacío que se irá completando con stream_text"""
+        self.streaming = message
+        self.append(message)
+        self._place_stream_mark()
+
+    def stream_text(self, text):
+        if self.streaming is None or not self._rendered(self.streaming):
+            return
+        follow = self.at_bottom()
+        self.text.insert("stream_insert", text, self._tag(self.streaming))
+        if follow:
+            self.text.see(tk.END)
+
+    def end_stream(self):
+        """Vuelve a dibujar el mensaje en streaming con su texto final"""
+        message, self.streaming = self.streaming, None
+        if message is None or not self._rendered(message):
+            return
+        follow = self.at_bottom()
+        index = self.text.index(f"{self._tag(message)}.first")
+        self._delete(message)
+        self._insert(index, message)
+        if follow:
+            self.text.see(tk.END)
+
+    def show_latest(self, reload=False):
+        """Salta al final del chat (p. ej. cuando el usuario envía un mensaje).
+
+        Con reload=True vuelve a dibujar la ventana aunque ya estuviera al
+        final, para cuando el contenido del store se ha reemplazado.
+        """
+        if not reload and self.last == len(self.store) and self.last - self.first <= self.window:
+            self.text.see(tk.END)
+            return
+        for tag in self.text.tag_names():
+            if tag.startswith("msg"):
+                self.text.tag_delete(tag)
+        self.text.delete("1.0", tk.END)
+        self.last = len(self.store)
+        self.first = max(0, self.last - self.window)
+        for message in self.store.range(self.first, self.last):
+            self._insert("end-1c", message)
+        self._place_stream_mark()
+        self.text.see(tk.END)
+
+    # --- Paginación al desplazarse ---
+
+    def _on_scroll(self, first, last):
+        self.text.vbar.set(first, last)
+        if not self.check_scheduled:
+            self.check_scheduled = True
+            self.text.after_idle(self._check_edges)
+
+    def _check_edges(self):
+        self.check_scheduled = False
+        top, bottom = self.text.yview()
+        if top <= 0.0 and self.first > 0:
+            self._page_older()
+        elif bottom >= 1.0 and self.last < len(self.store):
+            self._page_newer()
+
+    def _page_older(self):
+        anchor = self._tag(self.store[self.first])
+        start = max(0, self.first - self.page)
+        for message in reversed(self.store.range(start, self.first)):
+            self._insert("1.0", message)
+        self.first = start
+        self._trim_bottom(self.window + self.page)
+        # Mantener a la vista el mensaje que el usuario estaba leyendo
+        self.text.yview(f"{anchor}.first")
+
+    def _page_newer(self):
+        self.text.mark_set("view_anchor", "@0,0")
+        self.text.mark_gravity("view_anchor", tk.LEFT)
+        end = min(len(self.store), self.last + self.page)
+        for message in self.store.range(self.last, end):
+            self._insert("end-1c", message)
+        self.last = end
+        self._place_stream_mark()
+        self._trim_top(self.window + self.page)
+        self.text.yview("view_anchor")
@@ -0,0 +1,225 @@
+"""Síntesis de voz por frases: se sintetiza en paralelo y se reproduce en cuanto hay audio"""
+import asyncio
+import re
+import threading
+import time
+
+import numpy as np
+
+# Fin de frase: puntuación seguida de espacio, o salto de línea
+SENTENCE_END = re.compile(r"(?<=[.!?…])[\"')\]]*\s+|\n+")
+
+
+def split_sentences(text):
+    """Divide un texto completo en frases"""
+    return [s.strip() for s in SENTENCE_END.split(text) if s and s.strip()]
+
+
+class SentenceSplitter:
+    """Agrupa texto que llega por fragmentos (tokens) en frases completas.
+
+    Las frases muy cortas se juntan con la siguiente para no pagar una
+    llamada de síntesis por un "Hi!".
+    """
+
+    def __init__(self, min_chars=12):
+        self.min_chars = min_chars
+        self.buffer = ""
+
+    def feed(self, text):
+        """Añade texto y devuelve las frases que ya están completas"""
+        self.buffer += text
+        sentences = []
+        start = 0
+        for match in SENTENCE_END.finditer(self.buffer):
+            candidate = self.buffer[start:match.end()].strip()
+            if len(candidate) >= self.min_chars:
+                sentences.append(candidate)
+                start = match.end()
+        self.buffer = self.buffer[start:]
+        return sentences
+
+    def flush(self):
+        """Devuelve lo que quede al final de la respuesta"""
+        rest, self.buffer = self.buffer.strip(), ""
+        return [rest] if rest else []
+
+
+def speech_sentences(text, min_chars=12):
+    """Frases tal como las sintetiza un SpeechStream (mismas claves de caché)"""
+    splitter = SentenceSplitter(min_chars)
+    return splitter.feed(text) + splitter.flush()
+
+
+def edge_rate_string(speed):
+    """Edge TTS usa porcentajes (+20%), no multiplicadores (1.2)"""
+    rate_percentage = int((speed - 1.0) * 100)
+    return f"{rate_percentage:+d}%" if rate_percentage != 0 else "+0%"
+
+
+async def synthesize_edge(text, voice, rate="+0%"):
+    """Sintetiza con Edge TTS y devuelve el MP3 en memoria (sin archivos temporales)"""
+    import edge_tts
+
+    communicate = edge_tts.Communicate(text, voice, rate=rate)
+    audio = bytearray()
+    async for chunk in communicate.stream():
+        if chunk["type"] == "audio":
+            audio.extend(chunk["data"])
+    return bytes(audio)
+
+
+def match_format(clip, sample_rate, channels):
+    """Adapta PCM int16 a la frecuencia y canales del mixer (interpolación lineal)"""
+    samples = np.frombuffer(clip.pcm, dtype=np.int16).reshape(-1, clip.channels)
+    if clip.sample_rate != sample_rate and len(samples):
+        n = int(round(len(samples) * sample_rate / clip.sample_rate))
+        positions = np.linspace(0, len(samples) - 1, n)
+        index = np.arange(len(samples))
+        samples = np.stack([np.interp(positions, index, samples[:, c]) for c in range(clip.channels)],
+                           axis=1).astype(np.int16)
+    if clip.channels != channels:
+        samples = np.repeat(samples.mean(axis=1, keepdims=True).astype(np.int16), channels, axis=1)
+    return np.ascontiguousarray(samples).tobytes()
+
+
+async def play_pcm(clip, should_stop=None):
+    """Reproduce un AudioClip con pygame sin bloquear el event loop"""
+    try:
+        import pygame
+    except ImportError:
+        print("🔊 TTS generado (instala pygame para reproducción)")
+        return
+
+    if not pygame.mixer.get_init():
+        pygame.mixer.init(frequency=clip.sample_rate, size=-16, channels=clip.channels)
+    frequency, _, channels = pygame.mixer.get_init()
+    pcm = clip.pcm
+    if (frequency, channels) != (clip.sample_rate, clip.channels):
+        pcm = match_format(clip, frequency, channels)
+    channel = pygame.mixer.Sound(buffer=pcm).play()
+    while channel is not None and channel.get_busy():
+        if should_stop and should_stop():
+            channel.stop()
+            break
+        await asyncio.sleep(0.02)
+
+
+class SpeechStream:
+    """Una respuesta hablada, frase por frase.
+
+    El texto llega con add_text (desde cualquier hilo, por ejemplo con cada
+    token del modelo); cada frase completa se sintetiza en paralelo con las
+    siguientes y se reproduce en orden apenas está lista, así la primera
+    frase suena mientras el resto todavía se genera.
+    """
+
+    def __init__(self, synthesize, play=play_pcm, max_parallel=3, min_chars=12, on_finished=None,
+                 loop=None):
+        self.synthesize = synthesize
+        self.play = play
+        self.on_finished = on_finished
+        self.max_parallel = max_parallel
+        self.splitter = SentenceSplitter(min_chars)
+        # Con un loop externo (AudioOutput) el stream no necesita hilo propio
+        self.loop = loop or asyncio.new_event_loop()
+        self.sentences = asyncio.Queue()
+        self.cancelled = False
+        self.closed = False
+        self.thread = None
+        self.created = time.perf_counter()
+        self.first_audio_time = None
+        self.sentence_count = 0
+
+    @property
+    def time_to_first_audio(self):
+        if self.first_audio_time is None:
+            return None
+        return self.first_audio_time - self.created
+
+    def add_text(self, text):
+        """Añade texto de la respuesta (seguro entre hilos)"""
+        if self.closed or self.cancelled:
+            return
+        for sentence in self.splitter.feed(text):
+            self._put(sentence)
+
+    def close(self):
+        """Indica que la respuesta terminó"""
+        if self.closed:
+            return
+        self.closed = True
+        for sentence in self.splitter.flush():
+            self._put(sentence)
+        self._put(None)
+
+    def cancel(self):
+        """Corta la reproducción y descarta lo pendiente"""
+        self.cancelled = True
+        if not self.closed:
+            self.closed = True
+            self._put(None)
+
+    def _put(self, item):
+        if item is not None:
+            self.sentence_count += 1
+        self.loop.call_soon_threadsafe(self.sentences.put_nowait, item)
+
+    def start(self):
+        """Ejecuta el stream en su propio hilo (solo sin loop externo)"""
+        self.thread = threading.Thread(target=self.run_blocking, daemon=True)
+        self.thread.start()
+        return self
+
+    def run_blocking(self):
+        try:
+            asyncio.set_event_loop(self.loop)
+            self.loop.run_until_complete(self.run())
+        except Exception as e:
+            print(f"Error al hablar: {e}")
+        finally:
+            self.loop.close()
+
+    async def run(self):
+        semaphore = asyncio.Semaphore(self.max_parallel)
+        ready = asyncio.Queue()
+
+        async def synthesize(sentence):
+            async with semaphore:
+                return await self.synthesize(sentence)
+
+        async def play_in_order():
+            while True:
+                task = await ready.get()
+                if task is None:
+                    break
+                try:
+                    audio = await task
+                except asyncio.CancelledError:
+                    continue
+                except Exception as e:
+                    print(f"Error en TTS: {e}")
+                    continue
+                if self.cancelled or not audio:
+                    continue
+                if self.first_audio_time is None:
+                    self.first_audio_time = time.perf_counter()
+                    print(f"🔊 Primer audio: {self.time_to_first_audio:.2f}s")
+                await self.play(audio, lambda: self.cancelled)
+
+        player = asyncio.create_task(play_in_order())
+        tasks = []
+        while True:
+            sentence = await self.sentences.get()
+            if sentence is None or self.cancelled:
+                break
+            task = asyncio.create_task(synthesize(sentence))
+            tasks.append(task)
+            await ready.put(task)
+        if self.cancelled:
+            for task in tasks:
+                task.cancel()
+        await ready.put(None)
+        await player
+        if self.on_finished:
+            self.on_finished(self)
@@ -0,0 +1,159 @@
+"""Caché de audio sintetizado: memoria + disco, direccionada por contenido, con LRU"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "chat_local", "tts")
+
+
+def cache_key(text, *parts):
+    """Clave estable para (texto, voz, velocidad, ...)"""
+    normalized = " ".join(text.split())
+    raw = "\x1f".join([normalized] + [str(p) for p in parts])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class TTSCache:
+    """Caché de dos niveles para audio sintetizado.
+
+    El nivel de memoria es un OrderedDict acotado en bytes; el de disco
+    guarda un archivo por clave y desaloja por fecha de último uso (mtime).
+    Ambos niveles son LRU y se pueden limitar de forma independiente.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, memory_bytes=32 * 1024 * 1024,
+                 disk_bytes=256 * 1024 * 1024, suffix=".wav"):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.suffix = suffix
+        self.lock = threading.Lock()
+        self.memory = OrderedDict()
+        self.memory_used = 0
+        self.disk_index = OrderedDict()  # clave -> tamaño, del menos al más reciente
+        self.disk_used = 0
+        self.writing = set()             # claves que otro hilo está escribiendo en disco
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if self.directory:
+            self._scan_disk()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def _scan_disk(self):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            entries = [e for e in os.scandir(self.directory)
+                       if e.is_file() and e.name.endswith(self.suffix)]
+        except OSError as e:
+            print(f"⚠️ Caché de TTS en disco desactivada: {e}")
+            self.directory = None
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for entry in entries:
+            size = entry.stat().st_size
+            self.disk_index[entry.name[:-len(self.suffix)]] = size
+            self.disk_used += size
+        self._evict_disk()
+
+    def get(self, key):
+        """Devuelve el audio cacheado o None"""
+        with self.lock:
+            data = self.memory.get(key)
+            if data is not None:
+                self.memory.move_to_end(key)
+                self.memory_hits += 1
+                return data
+            on_disk = self.directory is not None and key in self.disk_index
+
+        if on_disk:
+            try:
+                with open(self._path(key), "rb") as f:
+                    data = f.read()
+                os.utime(self._path(key))
+            except OSError:
+                data = None
+            if data is not None:
+                with self.lock:
+                    self.disk_hits += 1
+                    self.disk_index.move_to_end(key)
+                    self._store_memory(key, data)
+                return data
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, data):
+        """Guarda audio en ambos niveles"""
+        if not data:
+            return
+        with self.lock:
+            self._store_memory(key, data)
+            if self.directory is None or key in self.disk_index or key in self.writing:
+                return
+            # Reservada: otro put de la misma clave no la escribe ni la cuenta dos veces
+            self.writing.add(key)
+        try:
+            tmp_path = self._path(key) + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            print(f"⚠️ No se pudo guardar audio en la caché: {e}")
+            with self.lock:
+                self.writing.discard(key)
+            return
+        with self.lock:
+            self.writing.discard(key)
+            if key in self.disk_index:
+                return
+            self.disk_index[key] = len(data)
+            self.disk_used += len(data)
+            self._evict_disk()
+
+    def _store_memory(self, key, data):
+        if len(data) > self.memory_bytes:
+            return
+        if key in self.memory:
+            self.memory_used -= len(self.memory.pop(key))
+        self.memory[key] = data
+        self.memory_used += len(data)
+        while self.memory_used > self.memory_bytes:
+            _, old = self.memory.popitem(last=False)
+            self.memory_used -= len(old)
+
+    def _evict_disk(self):
+        while self.disk_used > self.disk_bytes and self.disk_index:
+            key, size = self.disk_index.popitem(last=False)
+            self.disk_used -= size
+            try:
+                os.unlink(self._path(key))
+            except OSError:
+                pass
+
+    def clear_memory(self):
+        """Vacía el nivel de memoria (el de disco se conserva); devuelve los bytes liberados"""
+        with self.lock:
+            freed = self.memory_used
+            self.memory.clear()
+            self.memory_used = 0
+        return freed
+
+    def contains(self, key):
+        """Indica si la clave está en algún nivel (sin contar acierto ni fallo)"""
+        with self.lock:
+            return key in self.memory or key in self.disk_index
+
+    @property
+    def hit_rate(self):
+        total = self.memory_hits + self.disk_hits + self.misses
+        return (self.memory_hits + self.disk_hits) / total if total else 0.0
+
+    def summary(self):
+        return (f"🗃️ Caché TTS: {self.memory_hits} memoria · {self.disk_hits} disco · "
+                f"{self.misses} fallos ({self.hit_rate:.0%}) · "
+                f"{self.memory_used // 1024} KB RAM · {self.disk_used // 1024} KB disco")
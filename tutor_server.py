@@ -0,0 +1,440 @@
+"""Servidor del tutor sin interfaz: varios alumnos comparten un modelo cargado.
+
+API HTTP local (JSON, respuestas en streaming con Server-Sent Events):
+    POST   /sessions                      → {"session": id}
+    POST   /sessions/<id>/messages        {"text": "...", "stream": true}
+    GET    /sessions/<id>                 → mensajes de la sesión
+    DELETE /sessions/<id>
+    GET    /stats                         → sesiones, cola, rendimiento y latencias por etapa
+    GET    /health
+
+Ejemplos:
+    python tutor_server.py --model stub
+    python tutor_server.py --model openhermes-2.5-mistral-7b --port 8765
+    python tutor_server.py --model openai --base-url http://localhost:1234/v1 --workers 4
+"""
+import argparse
+import itertools
+import json
+import queue
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from openai_backend import OpenAIChatClient
+from pipeline import TEXT_FALLBACK, generate_reply, remember_reply, tutor_conversation
+from scheduler import InferenceScheduler, InferenceJob, PRIORITY_TEXT
+from streaming import PromptCache
+from tracing import Tracer
+import model_registry
+
+
+class ClientSession:
+    """Conversación de un alumno; sus turnos van siempre al mismo hilo de inferencia.
+
+    El hilo de inferencia modifica la conversación (turnos, recortes y
+    resumen) bajo lock; los hilos HTTP la leen con snapshot().
+    """
+
+    def __init__(self, session_id, conversation, worker):
+        self.id = session_id
+        self.conversation = conversation
+        self.worker = worker
+        self.lock = threading.Lock()
+        self.created = time.time()
+        self.last_active = self.created
+        self.turns = 0
+
+    def snapshot(self):
+        """Mensajes (sin el de sistema) y turnos completados, leídos de forma consistente"""
+        with self.lock:
+            return self.conversation.messages()[1:], self.turns
+
+
+class ServerTurn:
+    """Un mensaje en curso: los fragmentos generados pasan al hilo HTTP por una cola"""
+
+    ids = itertools.count(1)
+
+    def __init__(self, session, text):
+        self.id = next(ServerTurn.ids)
+        self.session = session
+        self.text = text
+        self.events = queue.Queue()
+        self.job = None
+        self.created = time.perf_counter()
+
+    def put(self, event, data):
+        self.events.put((event, data))
+
+
+class TutorServer:
+    """Sesiones de varios clientes sobre un único modelo.
+
+    Con un modelo local hay un solo hilo de inferencia (el contexto del
+    modelo es uno) y el PromptCache solo reutiliza el prefijo si el turno
+    es del alumno cuya conversación está en el contexto. Por eso la cola
+    agrupa los turnos por sesión: los del alumno que acaba de generar se
+    adelantan (hasta affinity seguidos) a los de los demás. Con un backend
+    remoto se mantienen hasta workers generaciones a la vez, por orden de
+    llegada, y el servidor remoto las agrupa.
+    """
+
+    def __init__(self, model, context_length=2048, max_new_tokens=200, workers=1, max_queue=32,
+                 max_sessions=64, session_ttl=1800.0, temperature=0.7, throughput_window=60.0,
+                 affinity=4, expire_interval=30.0):
+        self.model = model
+        self.context_length = context_length
+        self.max_new_tokens = max_new_tokens
+        if getattr(model, "remote", False):
+            affinity = 0
+        else:
+            workers = 1
+        self.schedulers = [InferenceScheduler(name=f"inference-{i}", affinity=affinity)
+                           for i in range(workers)]
+        self.kv_cache = PromptCache()
+        self.max_queue = max_queue
+        self.max_sessions = max_sessions
+        self.session_ttl = session_ttl
+        self.expire_interval = expire_interval
+        self.next_expiry = 0.0
+        self.temperature = temperature
+        self.tracer = Tracer()
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.next_worker = 0
+        self.started = time.time()
+        self.throughput_window = throughput_window
+        self.finished = deque()      # (fin, tokens generados) de los turnos recientes
+        self.turns_done = 0
+        self.turns_rejected = 0
+        self.tokens_generated = 0
+        self.active_streams = 0
+
+    def start(self):
+        for scheduler in self.schedulers:
+            scheduler.start()
+        return self
+
+    def stop(self):
+        for scheduler in self.schedulers:
+            scheduler.stop()
+
+    def warm_up(self, loaded):
+        """Evalúa BOS + sistema: es el prefijo común de todas las sesiones"""
+        conversation = tutor_conversation(self.model, self.context_length, self.max_new_tokens)
+        prefix = [] if self.model.bos_token_id is None else [self.model.bos_token_id]
+        return model_registry.warm_up(loaded, prefix + conversation.system_tokens, cache=self.kv_cache)
+
+    # --- Sesiones ---
+
+    def create_session(self):
+        with self.lock:
+            self._expire_sessions()
+            if len(self.sessions) >= self.max_sessions:
+                return None
+            conversation = tutor_conversation(self.model, self.context_length, self.max_new_tokens)
+            session = ClientSession(uuid.uuid4().hex, conversation, self.next_worker % len(self.schedulers))
+            self.next_worker += 1
+            self.sessions[session.id] = session
+        print(f"👤 Sesión {session.id[:8]} creada ({len(self.sessions)} activas)")
+        return session
+
+    def get_session(self, session_id):
+        with self.lock:
+            # Con tráfico pero sin sesiones nuevas también hay que soltar las inactivas
+            if time.monotonic() >= self.next_expiry:
+                self._expire_sessions()
+            return self.sessions.get(session_id)
+
+    def close_session(self, session_id):
+        with self.lock:
+            return self.sessions.pop(session_id, None) is not None
+
+    def _expire_sessions(self):
+        self.next_expiry = time.monotonic() + self.expire_interval
+        now = time.time()
+        for session_id in [s.id for s in self.sessions.values() if now - s.last_active > self.session_ttl]:
+            del self.sessions[session_id]
+            print(f"👤 Sesión {session_id[:8]} caducada por inactividad")
+
+    # --- Turnos ---
+
+    @property
+    def queue_depth(self):
+        return sum(scheduler.depth for scheduler in self.schedulers)
+
+    def submit(self, session, text):
+        """Encola un mensaje; devuelve el ServerTurn o None si la cola está llena"""
+        if self.queue_depth >= self.max_queue:
+            self.turns_rejected += 1
+            return None
+        session.last_active = time.time()
+        turn = ServerTurn(session, text)
+        turn.job = InferenceJob(lambda job: self._run_turn(turn, job), priority=PRIORITY_TEXT,
+                                on_drop=lambda job: turn.put("error", "descartado"),
+                                on_error=lambda job, e: turn.put("error", str(e)), group=session.id)
+        self.schedulers[session.worker].submit(turn.job)
+        return turn
+
+    def _run_turn(self, turn, job):
+        """Genera la respuesta en el hilo de inferencia de la sesión"""
+        self.tracer.record("queue", job.queue_wait, turn.id)
+        conversation = turn.session.conversation
+        # Si el contexto del modelo local es de otro alumno, el PromptCache
+        # detecta que el prefijo no coincide y reevalúa
+        response, stats = generate_reply(self.model, conversation, turn.text,
+                                         on_text=lambda text: turn.put("token", text),
+                                         should_stop=lambda: job.cancelled, cache=self.kv_cache,
+                                         temperature=self.temperature, tracer=self.tracer, turn=turn.id,
+                                         lock=turn.session.lock)
+        generated = bool(response)
+        if not response:
+            response = TEXT_FALLBACK
+        with turn.session.lock:
+            remember_reply(self.model, conversation, response, stats, generated)
+            turn.session.turns += 1
+        turn.session.last_active = time.time()
+
+        end_to_end = time.perf_counter() - turn.created
+        self.tracer.record("turn", end_to_end, turn.id, stop_reason=stats.stop_reason)
+        with self.lock:
+            self.turns_done += 1
+            self.tokens_generated += stats.generated_tokens
+            self.finished.append((time.time(), stats.generated_tokens))
+        turn.put("done", {
+            "response": response,
+            "stop_reason": stats.stop_reason,
+            "queue_wait": job.queue_wait,
+            "ttft": stats.time_to_first_token,
+            "end_to_end": end_to_end,
+            "tokens_per_second": stats.tokens_per_second,
+            "prompt_tokens": stats.prompt_tokens,
+            "evaluated_prompt_tokens": stats.evaluated_prompt_tokens,
+            "generated_tokens": stats.generated_tokens,
+        })
+
+    def stats(self):
+        now = time.time()
+        with self.lock:
+            while self.finished and now - self.finished[0][0] > self.throughput_window:
+                self.finished.popleft()
+            window = min(self.throughput_window, now - self.started) or 1.0
+            recent_tokens = sum(tokens for _, tokens in self.finished)
+            data = {
+                "uptime": now - self.started,
+                "sessions": len(self.sessions),
+                "queue_depth": self.queue_depth,
+                "busy_workers": sum(1 for scheduler in self.schedulers if scheduler.busy),
+                "workers": len(self.schedulers),
+                "active_streams": self.active_streams,
+                "turns_done": self.turns_done,
+                "turns_rejected": self.turns_rejected,
+                "tokens_generated": self.tokens_generated,
+                "throughput_tokens_per_second": recent_tokens / window,
+                "throughput_turns_per_minute": len(self.finished) * 60.0 / window,
+            }
+        data["stages"] = self.tracer.snapshot()
+        return data
+
+
+def make_handler(server):
+    """Handler HTTP ligado a un TutorServer"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, data, headers=None):
+            body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _error(self, status, message, headers=None):
+            self._send_json(status, {"error": message}, headers)
+
+        def _read_json(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            if not length:
+                return {}
+            return json.loads(self.rfile.read(length))
+
+        def _route(self):
+            return [part for part in self.path.split("?")[0].split("/") if part]
+
+        def do_GET(self):
+            parts = self._route()
+            if parts == ["health"]:
+                self._send_json(200, {"status": "ok"})
+            elif parts == ["stats"]:
+                self._send_json(200, server.stats())
+            elif len(parts) == 2 and parts[0] == "sessions":
+                session = server.get_session(parts[1])
+                if session is None:
+                    self._error(404, "sesión desconocida")
+                    return
+                messages, turns = session.snapshot()
+                self._send_json(200, {"session": session.id, "turns": turns, "messages": messages})
+            else:
+                self._error(404, "ruta desconocida")
+
+        def do_DELETE(self):
+            parts = self._route()
+            if len(parts) == 2 and parts[0] == "sessions" and server.close_session(parts[1]):
+                self._send_json(200, {"closed": parts[1]})
+            else:
+                self._error(404, "sesión desconocida")
+
+        def do_POST(self):
+            parts = self._route()
+            try:
+                request = self._read_json()
+            except ValueError:
+                self._error(400, "JSON inválido")
+                return
+            if parts == ["sessions"]:
+                session = server.create_session()
+                if session is None:
+                    self._error(503, "demasiadas sesiones", {"Retry-After": "30"})
+                else:
+                    self._send_json(201, {"session": session.id})
+            elif len(parts) == 3 and parts[0] == "sessions" and parts[2] == "messages":
+                self._post_message(parts[1], request)
+            else:
+                self._error(404, "ruta desconocida")
+
+        def _post_message(self, session_id, request):
+            session = server.get_session(session_id)
+            if session is None:
+                self._error(404, "sesión desconocida")
+                return
+            text = str(request.get("text", "")).strip()
+            if not text:
+                self._error(400, "falta 'text'")
+                return
+            turn = server.submit(session, text)
+            if turn is None:
+                self._error(503, "cola llena", {"Retry-After": "2"})
+                return
+            if request.get("stream", True):
+                self._stream(turn)
+                return
+            while True:
+                event, data = turn.events.get()
+                if event == "done":
+                    self._send_json(200, data)
+                    return
+                if event == "error":
+                    self._error(500, data)
+                    return
+
+        def _stream(self, turn):
+            """Reenvía los fragmentos como Server-Sent Events (transferencia chunked)"""
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            with server.lock:
+                server.active_streams += 1
+            try:
+                while True:
+                    event, data = turn.events.get()
+                    # Los tokens ya encolados salen en un solo envío
+                    batch = [(event, data)]
+                    while event == "token":
+                        try:
+                            event, data = turn.events.get_nowait()
+                        except queue.Empty:
+                            break
+                        batch.append((event, data))
+                    payload = "".join(f"event: {name}\ndata: {json.dumps(value, ensure_ascii=False)}\n\n"
+                                      for name, value in batch).encode("utf-8")
+                    self.wfile.write(f"{len(payload):x}\r\n".encode() + payload + b"\r\n")
+                    self.wfile.flush()
+                    if event in ("done", "error"):
+                        break
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                # El alumno se fue: no seguir generando para nadie
+                turn.job.cancel()
+                self.close_connection = True
+            finally:
+                with server.lock:
+                    server.active_streams -= 1
+
+    return Handler
+
+
+def load_backend(args):
+    """(modelo, context_length, max_new_tokens, LoadedModel o None) según --model"""
+    if args.model == "stub":
+        return model_registry.StubModel(seconds_per_token=args.stub_token_seconds), 2048, 200, None
+    if args.model in ("openai", "mock-openai"):
+        base_url = args.base_url
+        if args.model == "mock-openai":
+            from mock_openai import MockChatServer
+            base_url = MockChatServer(seconds_per_token=args.stub_token_seconds).start().url
+        client = OpenAIChatClient(base_url, pool_size=max(4, args.workers))
+        client.warm_up()
+        return client, args.context_length, 200, None
+    default, models = model_registry.load_registry(args.registry)
+    spec = models[args.model or default]
+    loaded = model_registry.load_model(spec)
+    return loaded.model, spec.context_length, spec.max_new_tokens, loaded
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor del tutor para varios alumnos")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--model", default="",
+                        help="'stub', 'mock-openai', 'openai' o un nombre del registro de modelos ('' = por defecto)")
+    parser.add_argument("--registry", default=model_registry.DEFAULT_REGISTRY_PATH)
+    parser.add_argument("--base-url", default="http://localhost:1234/v1")
+    parser.add_argument("--context-length", type=int, default=4096, help="Contexto del backend remoto")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="Generaciones simultáneas con un backend remoto (local: siempre 1)")
+    parser.add_argument("--max-queue", type=int, default=32)
+    parser.add_argument("--max-sessions", type=int, default=64)
+    parser.add_argument("--session-ttl", type=float, default=1800.0, help="Segundos de inactividad")
+    parser.add_argument("--stub-token-seconds", type=float, default=0.01)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    model, context_length, max_new_tokens, loaded = load_backend(args)
+    tutor = TutorServer(model, context_length=context_length, max_new_tokens=max_new_tokens,
+                        workers=args.workers, max_queue=args.max_queue, max_sessions=args.max_sessions,
+                        session_ttl=args.session_ttl)
+    if loaded is not None:
+        if loaded.spec.warmup:
+            tutor.warm_up(loaded)
+        print(f"🧠 {loaded.summary()}", file=sys.stderr)
+    tutor.start()
+    httpd = ThreadingHTTPServer((args.host, args.port), make_handler(tutor))
+    httpd.daemon_threads = True
+    print(f"🌐 Tutor en http://{args.host}:{httpd.server_address[1]} "
+          f"({len(tutor.schedulers)} hilo(s) de inferencia)", file=sys.stderr)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        tutor.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Despachador de eventos hacia el hilo de Tk.
+
+Los hilos de trabajo publican eventos con post(); el hilo de Tk los
+atiende en un solo drenado por frame. No hay sondeo: si no llega nada,
+Tk no se despierta.
+"""
+import threading
+import time
+
+# Cómo se agrupan los eventos de un mismo frame
+QUEUE = "queue"     # Se entregan todos, en orden
+LATEST = "latest"   # Solo el último valor (estado, nivel del micrófono, ...)
+APPEND = "append"   # Los valores consecutivos se entregan juntos en una lista (tokens)
+
+
+class UIDispatcher:
+    """Cola de eventos tipados con un drenado por frame en el hilo de Tk.
+
+    on(evento, handler, mode) registra el handler que recibe los datos de
+    cada evento. Los eventos LATEST de un frame se reducen al último (en la
+    posición del último), y los APPEND consecutivos se juntan en una lista,
+    así una ráfaga de tokens cuesta una sola actualización del chat.
+
+    Los handlers corren en el hilo de Tk y no deben bloquear: el trabajo
+    pesado va con background(), que lo ejecuta en un hilo y publica el
+    resultado como evento. Un handler que tarda más de slow_ms se avisa.
+    """
+
+    def __init__(self, root, frame_ms=16, slow_ms=50):
+        self.root = root
+        self.frame_ms = frame_ms
+        self.slow_ms = slow_ms
+        self.handlers = {}
+        self.lock = threading.Lock()
+        self.pending = []           # [[evento, datos], ...] del frame en curso
+        self.latest = {}            # evento LATEST -> su entrada en pending
+        self.scheduled = False
+        self.closed = False
+        self.ui_thread = threading.current_thread()
+        self.drains = 0
+        self.delivered = 0
+
+    def on(self, event, handler, mode=QUEUE):
+        self.handlers[event] = (handler, mode)
+
+    def post(self, event, data=None):
+        """Publica un evento (desde cualquier hilo)"""
+        mode = self.handlers.get(event, (None, QUEUE))[1]
+        with self.lock:
+            if self.closed:
+                return
+            if mode == LATEST:
+                entry = self.latest.pop(event, None)
+                if entry is not None:
+                    self.pending.remove(entry)
+                entry = self.latest[event] = [event, data]
+                self.pending.append(entry)
+            elif mode == APPEND and self.pending and self.pending[-1][0] == event:
+                self.pending[-1][1].append(data)
+            else:
+                self.pending.append([event, [data] if mode == APPEND else data])
+            if self.scheduled:
+                return
+            self.scheduled = True
+        # Un solo despertar por frame, por muchos eventos que lleguen
+        self.root.after(self.frame_ms, self._drain)
+
+    def call(self, function, *args):
+        """Ejecuta una función en el hilo de Tk (evento sin agrupar)"""
+        self.post("call", (function, args))
+
+    def background(self, function, *args, event=None, name=None):
+        """Ejecuta function fuera del hilo de Tk y publica su resultado como event"""
+        def run():
+            try:
+                result = function(*args)
+            except Exception as e:
+                print(f"⚠️ Error en tarea de fondo {name or function.__name__}: {e}")
+                return
+            if event is not None:
+                self.post(event, result)
+
+        thread = threading.Thread(target=run, name=name, daemon=True)
+        thread.start()
+        return thread
+
+    def on_ui_thread(self):
+        return threading.current_thread() is self.ui_thread
+
+    def _drain(self):
+        with self.lock:
+            pending, self.pending = self.pending, []
+            self.latest.clear()
+            self.scheduled = False
+        self.drains += 1
+        for event, data in pending:
+            if event == "call":
+                handler, args = data
+            else:
+                handler, args = self.handlers.get(event, (None, QUEUE))[0], (data,)
+                if handler is None:
+                    continue
+            started = time.perf_counter()
+            try:
+                handler(*args)
+            except Exception as e:
+                print(f"⚠️ Error al atender el evento '{event}': {e}")
+            elapsed = (time.perf_counter() - started) * 1000
+            if elapsed > self.slow_ms:
+                print(f"🐢 El evento '{event}' bloqueó la interfaz {elapsed:.0f} ms")
+            self.delivered += 1
+
+    def close(self):
+        """Deja de aceptar eventos (al cerrar la ventana)"""
+        with self.lock:
+            self.closed = True
+            self.pending = []
+            self.latest.clear()
@@ -0,0 +1,271 @@
+"""Detector de actividad de voz (VAD) vectorizado con piso de ruido adaptativo"""
+import os
+import struct
+import time
+import wave
+
+import numpy as np
+
+
+def read_wav(path):
+    """Lee un WAV PCM16 y devuelve (muestras int16 mono, sample_rate)"""
+    with wave.open(str(path), "rb") as wav:
+        if wav.getsampwidth() != 2:
+            raise ValueError(f"{path}: solo se admite PCM de 16 bits")
+        rate = wav.getframerate()
+        channels = wav.getnchannels()
+        samples = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+    return samples, rate
+
+
+def map_wav(path):
+    """Abre un WAV PCM16 sin leerlo: (memmap int16 de forma (frames, canales), sample_rate).
+
+    Las muestras se leen del disco a medida que se usan, así un archivo
+    largo no se decodifica entero en memoria.
+    """
+    fmt = None
+    with open(path, "rb") as f:
+        header = f.read(12)
+        if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+            raise ValueError(f"{path}: no es un WAV RIFF")
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                raise ValueError(f"{path}: no tiene bloque de datos")
+            chunk_id, size = chunk[:4], struct.unpack("<I", chunk[4:])[0]
+            if chunk_id == b"data":
+                offset = f.tell()
+                break
+            if chunk_id == b"fmt ":
+                fmt = struct.unpack("<HHIIHH", f.read(16))
+                size -= 16
+            # Los bloques se alinean a 2 bytes
+            f.seek(size + (size & 1), 1)
+    if fmt is None:
+        raise ValueError(f"{path}: falta el bloque de formato")
+    audio_format, channels, rate, _, _, bits = fmt
+    if audio_format not in (1, 0xFFFE) or bits != 16:
+        raise ValueError(f"{path}: solo se admite PCM de 16 bits")
+    # Grabaciones cortadas a medias declaran más datos de los que hay
+    size = min(size, os.path.getsize(path) - offset)
+    frames = size // (2 * channels)
+    if frames == 0:
+        return np.zeros((0, channels), dtype=np.int16), rate
+    return np.memmap(path, dtype="<i2", mode="r", offset=offset, shape=(frames, channels)), rate
+
+
+def frame_features(frames):
+    """Energía (dBFS) y tasa de cruces por cero de una matriz (n_frames, frame_length)"""
+    x = frames.astype(np.float32) / 32768.0
+    energy_db = 10.0 * np.log10(np.mean(x * x, axis=1) + 1e-10)
+    signs = np.signbit(x)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (frames.shape[1] - 1)
+    return energy_db, zcr
+
+
+def speech_segments(decisions, frame_length, sample_rate):
+    """Convierte decisiones por frame en segmentos (inicio_s, fin_s)"""
+    d = np.concatenate(([False], np.asarray(decisions, dtype=bool), [False]))
+    edges = np.flatnonzero(d[1:] != d[:-1])
+    starts, ends = edges[0::2], edges[1::2]
+    scale = frame_length / sample_rate
+    return [(s * scale, e * scale) for s, e in zip(starts, ends)]
+
+
+class VoiceActivityDetector:
+    """VAD por bloques de frames: energía + cruces por cero + piso de ruido adaptativo.
+
+    Un frame dispara voz si supera el piso de ruido en onset_db y tiene una
+    tasa de cruces por cero de voz sonora; la voz se mantiene mientras la
+    energía siga offset_db por encima del piso (histéresis) y hangover_frames
+    más. Todo se calcula por bloque en NumPy, sin bucles por frame.
+    """
+
+    def __init__(self, sample_rate=16000, frame_length=256, onset_db=9.0, offset_db=4.0,
+                 hangover_frames=10, min_onset_frames=2, min_speech_db=-55.0,
+                 max_onset_zcr=0.35, noise_rise=0.02, noise_fall=0.3,
+                 calibration_frames=15):
+        self.sample_rate = sample_rate
+        self.frame_length = frame_length
+        self.onset_db = onset_db
+        self.offset_db = offset_db
+        self.hangover_frames = hangover_frames
+        self.min_onset_frames = min_onset_frames
+        self.min_speech_db = min_speech_db
+        self.max_onset_zcr = max_onset_zcr
+        # El piso baja rápido (ruido que cesa) y sube despacio (no "aprender" la voz)
+        self.noise_rise = noise_rise
+        self.noise_fall = noise_fall
+        self.calibration_frames = calibration_frames
+        self.reset()
+
+    def reset(self):
+        self.remainder = np.zeros(0, dtype=np.int16)
+        self.noise_floor_db = None
+        self.frames_seen = 0
+        self.in_run = False         # El último frame estaba dentro de un tramo "low" de voz
+        self.frames_since_speech = self.hangover_frames + 1
+        self.speaking = False
+        self.last_energy_db = -100.0
+        self.last_frame_energy_db = np.zeros(0, dtype=np.float32)  # Energía de cada frame del último bloque
+
+    @property
+    def frame_duration(self):
+        return self.frame_length / self.sample_rate
+
+    def process(self, samples):
+        """Procesa audio int16 y devuelve un array bool con la decisión de cada frame completo"""
+        samples = np.asarray(samples, dtype=np.int16)
+        if self.remainder.size:
+            samples = np.concatenate((self.remainder, samples))
+        n_frames = samples.size // self.frame_length
+        self.remainder = samples[n_frames * self.frame_length:].copy()
+        if n_frames == 0:
+            self.last_frame_energy_db = np.zeros(0, dtype=np.float32)
+            return np.zeros(0, dtype=bool)
+
+        frames = samples[:n_frames * self.frame_length].reshape(n_frames, self.frame_length)
+        energy_db, zcr = frame_features(frames)
+        self.last_energy_db = float(energy_db[-1])
+        self.last_frame_energy_db = energy_db
+
+        if self.noise_floor_db is None:
+            # Calibración inicial con el primer bloque
+            self.noise_floor_db = float(np.percentile(energy_db, 20))
+
+        onset_level = max(self.noise_floor_db + self.onset_db, self.min_speech_db)
+        offset_level = max(self.noise_floor_db + self.offset_db, self.min_speech_db - 6.0)
+        high = (energy_db > onset_level) & (zcr < self.max_onset_zcr)
+        low = energy_db > offset_level
+
+        # Tramos contiguos de "low": son voz si contienen suficientes frames "high"
+        # o si continúan un tramo de voz del bloque anterior
+        starts = low & ~np.concatenate(([False], low[:-1]))
+        run_id = np.cumsum(starts) - 1
+        n_runs = int(run_id[-1]) + 1
+        voiced = np.zeros(n_frames, dtype=bool)
+        if n_runs > 0 and low.any():
+            highs_per_run = np.bincount(run_id[low], weights=high[low], minlength=n_runs)
+            run_is_speech = highs_per_run >= self.min_onset_frames
+            if low[0] and self.in_run:
+                run_is_speech[0] = True
+            voiced[low] = run_is_speech[run_id[low]]
+        self.in_run = bool(low[-1] and voiced[-1])
+
+        # Hangover: mantener la voz unos frames tras el último frame sonoro
+        # (frames_since_speech arrastra la distancia desde el bloque anterior)
+        index = np.arange(n_frames)
+        last_voiced = np.maximum.accumulate(np.where(voiced, index, -1 - self.frames_since_speech))
+        decisions = (index - last_voiced) <= self.hangover_frames
+        self.frames_since_speech = n_frames - 1 - int(last_voiced[-1])
+
+        # Piso de ruido adaptativo a partir de los frames sin voz
+        noise = energy_db[~decisions]
+        if noise.size:
+            target = float(np.percentile(noise, 20))
+            calibrating = self.frames_seen < self.calibration_frames
+            rate = 1.0 if calibrating else (self.noise_fall if target < self.noise_floor_db else self.noise_rise)
+            # El peso crece con la cantidad de frames del bloque
+            weight = 1.0 - (1.0 - rate) ** min(noise.size, 50)
+            self.noise_floor_db += weight * (target - self.noise_floor_db)
+
+        self.frames_seen += n_frames
+        self.speaking = bool(decisions[-1])
+        return decisions
+
+    def iter_decisions(self, blocks):
+        """Flujo de decisiones por frame: produce (índice_frame, es_voz)"""
+        frame_index = 0
+        for block in blocks:
+            for decision in self.process(block):
+                yield frame_index, bool(decision)
+                frame_index += 1
+
+    def detect_file(self, path):
+        """Aplica el VAD a un WAV completo y devuelve las decisiones por frame"""
+        samples, rate = read_wav(path)
+        if rate != self.sample_rate:
+            raise ValueError(f"{path}: se esperaba {self.sample_rate} Hz y tiene {rate} Hz")
+        self.reset()
+        return self.process(samples)
+
+
+class EchoSuppressor:
+    """Separa la voz del alumno del eco del tutor mientras suena la respuesta.
+
+    No hay cancelación acústica (la señal del altavoz no llega alineada al
+    micrófono): se aprende con qué nivel entra el eco y, mientras suena el
+    tutor (y tail segundos después, por la reverberación), solo cuenta como
+    voz lo que lo supera en margin_db durante min_speech segundos seguidos.
+    Los primeros settle segundos de cada respuesta solo sirven para medir.
+    """
+
+    def __init__(self, frame_duration, margin_db=10.0, min_speech=0.25, settle=0.3, tail=0.3,
+                 adapt=0.1):
+        self.frame_duration = frame_duration
+        self.margin_db = margin_db
+        self.min_speech = min_speech
+        self.settle = settle
+        self.tail = tail
+        self.adapt = adapt
+        self.echo_db = None          # Nivel de eco aprendido (se conserva entre respuestas)
+        self.run_frames = 0          # Frames seguidos de voz (por encima del eco si suena el tutor)
+        self.playing_since = None
+        self.last_playing = None
+
+    @property
+    def run_seconds(self):
+        return self.run_frames * self.frame_duration
+
+    def echo_active(self, playing, now=None):
+        """¿Puede haber eco del tutor en el micrófono ahora?"""
+        now = now if now is not None else time.monotonic()
+        if playing:
+            if self.playing_since is None:
+                self.playing_since = now
+            self.last_playing = now
+            return True
+        self.playing_since = None
+        return self.last_playing is not None and now - self.last_playing < self.tail
+
+    def process(self, energy_db, decisions, playing, now=None):
+        """Filtra las decisiones del VAD de un bloque.
+
+        Devuelve (voz por frame, voz sostenida): la segunda indica que el
+        alumno lleva al menos min_speech segundos hablando, lo que basta
+        para interrumpir al tutor.
+        """
+        now = now if now is not None else time.monotonic()
+        decisions = np.asarray(decisions, dtype=bool)
+        if decisions.size == 0:
+            return decisions, False
+
+        if self.echo_active(playing, now):
+            settling = self.playing_since is not None and now - self.playing_since < self.settle
+            if settling or self.echo_db is None:
+                # Midiendo el eco: nada cuenta como voz todavía
+                voiced = np.zeros_like(decisions)
+            else:
+                voiced = decisions & (energy_db > self.echo_db + self.margin_db)
+            echo = energy_db[~voiced]
+            if echo.size:
+                # El eco sube y baja con lo que dice el tutor: seguir su nivel alto
+                target = float(np.percentile(echo, 90))
+                if self.echo_db is None:
+                    self.echo_db = target
+                else:
+                    rate = 0.5 if settling else self.adapt
+                    self.echo_db += rate * (target - self.echo_db)
+        else:
+            voiced = decisions
+
+        # Longitud del tramo de voz que llega a cada frame (arrastrando el del bloque anterior)
+        index = np.arange(voiced.size)
+        last_gap = np.maximum.accumulate(np.where(voiced, -1 - self.run_frames, index))
+        runs = np.where(voiced, index - last_gap, 0)
+        self.run_frames = int(runs[-1])
+        sustained = bool((runs * self.frame_duration >= self.min_speech).any())
+        return voiced, sustained